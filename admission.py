@@ -0,0 +1,221 @@
+"""
+Control de admisión para el pool de trabajo del webhook.
+
+- Cola acotada: si hay más de ADMISSION_MAX_QUEUE unidades esperando, el mensaje se
+  rechaza de inmediato en vez de acumular respuestas con minutos de retraso.
+- Concurrencia adaptativa (AIMD): el número de turnos simultáneos sube de a poco
+  mientras las llamadas LLM están por debajo de la latencia objetivo, y se reduce de
+  forma multiplicativa ante un 429 o una llamada lenta.
+- Límite por remitente: token bucket por número para que un solo usuario no acapare el pool.
+- Turnos por tenant: cada tenant (instancia de Evolution, ver tenants.py) tiene su propia
+  cola y el pool las atiende en round-robin, así una línea saturada no demora a las demás.
+
+Cuando un mensaje no se admite, webhook.py envía un aviso corto (ADMISSION_OVERLOAD_MESSAGE),
+como máximo una vez cada ADMISSION_NOTICE_COOLDOWN_SECONDS por usuario.
+
+Variables de entorno:
+- ADMISSION_MAX_QUEUE                (default 200)
+- ADMISSION_TENANT_MAX_QUEUE         (máximo en cola por tenant, default ADMISSION_MAX_QUEUE)
+- ADMISSION_MIN_CONCURRENCY          (default 2)
+- ADMISSION_INITIAL_CONCURRENCY      (default 8)
+- ADMISSION_TARGET_LATENCY_SECONDS   (latencia objetivo por llamada LLM, default 8)
+- ADMISSION_DECREASE_FACTOR          (default 0.7)
+- ADMISSION_SENDER_RATE_PER_MINUTE   (default 12)
+- ADMISSION_SENDER_BURST             (default 6)
+- ADMISSION_NOTICE_COOLDOWN_SECONDS  (default 120)
+- ADMISSION_OVERLOAD_MESSAGE
+"""
+
+import os
+import time
+from collections import deque
+from threading import Lock
+
+from metrics import Counter, Gauge, REGISTRY
+
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "200"))
+ADMISSION_TENANT_MAX_QUEUE = int(os.getenv("ADMISSION_TENANT_MAX_QUEUE", str(ADMISSION_MAX_QUEUE)))
+ADMISSION_MIN_CONCURRENCY = int(os.getenv("ADMISSION_MIN_CONCURRENCY", "2"))
+ADMISSION_INITIAL_CONCURRENCY = int(os.getenv("ADMISSION_INITIAL_CONCURRENCY", "8"))
+ADMISSION_TARGET_LATENCY_SECONDS = float(os.getenv("ADMISSION_TARGET_LATENCY_SECONDS", "8"))
+ADMISSION_DECREASE_FACTOR = float(os.getenv("ADMISSION_DECREASE_FACTOR", "0.7"))
+ADMISSION_SENDER_RATE_PER_MINUTE = float(os.getenv("ADMISSION_SENDER_RATE_PER_MINUTE", "12"))
+ADMISSION_SENDER_BURST = float(os.getenv("ADMISSION_SENDER_BURST", "6"))
+ADMISSION_NOTICE_COOLDOWN_SECONDS = float(os.getenv("ADMISSION_NOTICE_COOLDOWN_SECONDS", "120"))
+ADMISSION_OVERLOAD_MESSAGE = os.getenv(
+    "ADMISSION_OVERLOAD_MESSAGE",
+    "¡Gracias por escribirnos! 🙌 En este momento estamos recibiendo muchos mensajes. "
+    "En unos minutos podremos atenderte; por favor vuelve a enviarnos tu mensaje.",
+)
+
+ADMISSION_DECISIONS = REGISTRY.register(Counter(
+    "chatbot_admission_decisions_total", "Decisiones del control de admisión (admitted, overloaded, rate_limited)", ("result",)))
+ADMISSION_LIMIT = REGISTRY.register(Gauge(
+    "chatbot_admission_concurrency_limit", "Límite de concurrencia adaptativo del pool del webhook"))
+
+
+class AdaptiveLimit:
+    """Límite de concurrencia AIMD guiado por la latencia y los 429 de las llamadas LLM."""
+
+    def __init__(self, initial: int, minimum: int, maximum: int, target_seconds: float,
+                 decrease_factor: float, on_change=None):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.target_seconds = target_seconds
+        self.decrease_factor = decrease_factor
+        self._limit = float(min(self.maximum, max(self.minimum, initial)))
+        self._last_decrease = 0.0
+        self._lock = Lock()
+        self._on_change = on_change
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def current(self) -> int:
+        return int(self._limit)
+
+    def on_sample(self, site: str, seconds: float, error_kind: str | None) -> None:
+        now = time.monotonic()
+        changed = False
+        with self._lock:
+            before = int(self._limit)
+            if error_kind == "rate_limit" or seconds > self.target_seconds:
+                # Una sola reducción por ventana de latencia objetivo: las llamadas en vuelo
+                # que terminan lentas por la misma congestión no deben encadenar recortes
+                if now - self._last_decrease >= self.target_seconds:
+                    self._limit = max(self.minimum, self._limit * self.decrease_factor)
+                    self._last_decrease = now
+                    self.decreases += 1
+            elif error_kind is None:
+                # +1 por cada `limit` llamadas sanas (aumento aditivo por "ventana")
+                self._limit = min(self.maximum, self._limit + 1 / self._limit)
+                self.increases += 1
+            changed = int(self._limit) != before
+        if changed and self._on_change is not None:
+            self._on_change()
+
+
+class SenderRateLimiter:
+    """Token bucket por remitente (mensajes por minuto con ráfaga)."""
+
+    def __init__(self, rate_per_minute: float, burst: float, max_senders: int = 20000):
+        self.rate_per_second = rate_per_minute / 60
+        self.burst = burst
+        self.max_senders = max_senders
+        self._buckets: dict[str, tuple[float, float]] = {}  # remitente -> (tokens, última actualización)
+
+    def allow(self, sender: str, cost: float = 1.0) -> bool:
+        """No es thread-safe por sí solo: AdmissionController lo llama bajo su lock."""
+        if self.rate_per_second <= 0:
+            return True
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(sender, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate_per_second)
+        allowed = tokens >= min(cost, self.burst)
+        if allowed:
+            tokens -= cost
+        self._buckets[sender] = (tokens, now)
+        if len(self._buckets) > self.max_senders:
+            self._prune(now)
+        return allowed
+
+    def _prune(self, now: float) -> None:
+        # Los buckets que ya se habrían rellenado por completo equivalen a no tener entrada
+        refill_seconds = self.burst / self.rate_per_second
+        for sender in [s for s, (_, updated) in self._buckets.items() if now - updated >= refill_seconds]:
+            del self._buckets[sender]
+
+
+class AdmissionController:
+    """Colas acotadas por tenant delante de un ThreadPoolExecutor con límite de concurrencia adaptativo."""
+
+    def __init__(self, executor, max_workers: int, max_queue: int = ADMISSION_MAX_QUEUE,
+                 tenant_max_queue: int = ADMISSION_TENANT_MAX_QUEUE):
+        self._executor = executor
+        self.max_queue = max_queue
+        self.tenant_max_queue = tenant_max_queue
+        self.limit = AdaptiveLimit(
+            ADMISSION_INITIAL_CONCURRENCY, ADMISSION_MIN_CONCURRENCY, max_workers,
+            ADMISSION_TARGET_LATENCY_SECONDS, ADMISSION_DECREASE_FACTOR, on_change=self._dispatch)
+        self.rate_limiter = SenderRateLimiter(ADMISSION_SENDER_RATE_PER_MINUTE, ADMISSION_SENDER_BURST)
+        self._queues: dict[str, deque] = {}
+        self._turns: deque[str] = deque()  # tenants con trabajo en cola, en orden de turno
+        self._queued = 0
+        self._in_flight = 0
+        self._lock = Lock()
+        self._last_notice: dict[str, float] = {}
+        ADMISSION_LIMIT.set_function(lambda: self.limit.current)
+
+    def submit(self, sender: str, cost: int, fn, *args, tenant: str = "") -> str:
+        """Intenta admitir una unidad de trabajo; devuelve "admitted", "rate_limited" u "overloaded"."""
+        with self._lock:
+            queue = self._queues.get(tenant)
+            if self._queued >= self.max_queue or (queue is not None and len(queue) >= self.tenant_max_queue):
+                result = "overloaded"
+            elif not self.rate_limiter.allow(f"{tenant}:{sender}" if tenant else sender, cost):
+                result = "rate_limited"
+            else:
+                if queue is None:
+                    queue = self._queues[tenant] = deque()
+                    self._turns.append(tenant)
+                queue.append((fn, args))
+                self._queued += 1
+                result = "admitted"
+        ADMISSION_DECISIONS.inc(result=result)
+        if result == "admitted":
+            self._dispatch()
+        return result
+
+    def _dispatch(self) -> None:
+        with self._lock:
+            while self._turns and self._in_flight < self.limit.current:
+                tenant = self._turns.popleft()
+                queue = self._queues[tenant]
+                fn, args = queue.popleft()
+                if queue:
+                    self._turns.append(tenant)
+                else:
+                    del self._queues[tenant]
+                self._queued -= 1
+                self._in_flight += 1
+                self._executor.submit(self._run, fn, args)
+
+    def _run(self, fn, args) -> None:
+        try:
+            fn(*args)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._dispatch()
+
+    def should_notify(self, sender: str) -> bool:
+        """True si corresponde avisarle al usuario que no se admitió su mensaje (con enfriamiento)."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_notice.get(sender)
+            if last is not None and now - last < ADMISSION_NOTICE_COOLDOWN_SECONDS:
+                return False
+            self._last_notice[sender] = now
+            if len(self._last_notice) > 20000:
+                self._last_notice = {s: t for s, t in self._last_notice.items()
+                                     if now - t < ADMISSION_NOTICE_COOLDOWN_SECONDS}
+        return True
+
+    def queue_depth(self) -> int:
+        return self._queued
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queue_depth": self._queued,
+                "max_queue": self.max_queue,
+                "queue_by_tenant": {tenant: len(queue) for tenant, queue in self._queues.items()},
+                "tenant_max_queue": self.tenant_max_queue,
+                "in_flight": self._in_flight,
+                "concurrency_limit": self.limit.current,
+                "concurrency_bounds": [self.limit.minimum, self.limit.maximum],
+                "limit_increases": self.limit.increases,
+                "limit_decreases": self.limit.decreases,
+                "tracked_senders": len(self.rate_limiter._buckets),
+                "decisions": {r: ADMISSION_DECISIONS.value(result=r) for r in ("admitted", "overloaded", "rate_limited")},
+            }
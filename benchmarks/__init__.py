@@ -0,0 +1 @@
+"""Benchmarks offline del chatbot (ejecutar desde la raíz del repo con `python -m benchmarks.<script>`)."""
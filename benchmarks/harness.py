@@ -0,0 +1,287 @@
+"""
+Piezas compartidas por los benchmarks offline.
+
+- FakeLLMServer: imita /v1/chat/completions y /v1/embeddings de OpenAI con latencia
+  y velocidad de tokens configurables, y respuestas deterministas según el prompt.
+- FakeEvolutionServer: imita /message/sendText/<instancia> de Evolution y registra las
+  respuestas por número para que el driver mida la latencia de punta a punta.
+- start_webhook_app: levanta `webhook:app` en este mismo proceso apuntando a los fakes.
+
+Nota: OpenAIEmbeddings tokeniza con tiktoken; para correr sin red el encoding
+cl100k_base debe estar en la caché local (TIKTOKEN_CACHE_DIR).
+"""
+
+import base64
+import hashlib
+import importlib
+import json
+import math
+import os
+import random
+import re
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_API_KEY = "sk-fake-benchmark"
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Percentil por rango más cercano (p en 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def rss_bytes() -> int:
+    """Memoria residente del proceso (Linux /proc; en otros sistemas usa el pico de ru_maxrss)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            return json.loads(raw or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _BackgroundServer:
+    def __init__(self, handler_cls):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), handler_cls)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeLLMServer(_BackgroundServer):
+    """OpenAI falso: latencia = base + tokens_de_salida / tokens_por_segundo."""
+
+    def __init__(self, latency_ms: float = 300, tokens_per_s: float = 80, answer_tokens: int = 120,
+                 embedding_dim: int = 1536, embedding_latency_ms: float = 20):
+        super().__init__(_FakeLLMHandler)
+        self.latency_ms = latency_ms
+        self.tokens_per_s = tokens_per_s
+        self.answer_tokens = answer_tokens
+        self.embedding_dim = embedding_dim
+        self.embedding_latency_ms = embedding_latency_ms
+        self._lock = threading.Lock()
+        self.calls: dict[str, int] = {}
+        self.tokens = {"in": 0, "out": 0}
+
+    def count(self, kind: str, tokens_in: int = 0, tokens_out: int = 0) -> None:
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            self.tokens["in"] += tokens_in
+            self.tokens["out"] += tokens_out
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"calls": dict(self.calls), "tokens": dict(self.tokens)}
+
+    # --- Respuestas deterministas ---
+    def answer_for(self, messages: list[dict]) -> tuple[str, str]:
+        """Devuelve (tipo_de_prompt, texto) de forma determinista a partir de los mensajes."""
+        text = "\n".join(str(m.get("content") or "") for m in messages)
+        last = str(messages[-1].get("content") or "") if messages else ""
+        if "Clasifica el siguiente cargo" in text:
+            role = (re.search(r'Cargo a clasificar: "([^"]*)"', text) or [None, ""])[1].lower()
+            if any(w in role for w in ("gerente general", "director", "ceo", "presidente", "fundador")):
+                return "classify_role", "estratégico"
+            if any(w in role for w in ("coordinador", "jefe", "supervisor", "líder", "lider", "gerente")):
+                return "classify_role", "táctico"
+            return "classify_role", "operativo"
+        if "extrae ÚNICAMENTE el cargo" in text:
+            quoted = (re.search(r'Texto: "([^"]*)"', text) or [None, ""])[1]
+            words = re.sub(r"^(soy|trabajo como|fui|me desempeño como)\s+", "", quoted.strip(), flags=re.I).split()
+            return "extract_role", " ".join(words[-3:]) or "no_identificable"
+        if '"welcome_text"' in text:
+            quoted = (re.search(r'con esta frase: "([^"]*)"', text) or [None, ""])[1]
+            name = re.search(r"(?:soy|me llamo|mi nombre es)\s+(\w+)", quoted, flags=re.I)
+            city = re.search(r"\b(?:de|desde)\s+(\w+)", quoted, flags=re.I)
+            return "name_welcome", json.dumps({
+                "name": name.group(1) if name else None,
+                "city": city.group(1) if city else None,
+                "welcome_text": "Qué gusto tenerte por aquí. ¿Cuál es tu cargo actual o al que aspiras?",
+            }, ensure_ascii=False)
+        if "extrae únicamente el nombre de pila" in text:
+            quoted = (re.search(r'Frase: "([^"]*)"', text) or [None, ""])[1]
+            match = re.search(r"(?:soy|me llamo|mi nombre es)\s+(\w+)", quoted, flags=re.I)
+            return "extract_name", match.group(1) if match else (quoted.split() or ["no_identificable"])[0]
+        if "reformula la pregunta de seguimiento" in text:
+            return "rephrase", last
+        seed = int(hashlib.sha256(last.encode("utf-8")).hexdigest()[:8], 16)
+        rnd = random.Random(seed)
+        words = ["Xtalento", "servicio", "perfil", "entrevista", "hoja", "vida", "agenda", "sesión", "precio", "nivel"]
+        body = " ".join(rnd.choice(words) for _ in range(max(1, self.answer_tokens - 4)))
+        return "generate", f"Respuesta simulada: {body}."
+
+    def embedding_for(self, item) -> list[float]:
+        seed = hashlib.sha256(json.dumps(item, ensure_ascii=False).encode("utf-8")).digest()
+        rnd = random.Random(seed)
+        vec = [rnd.gauss(0.0, 1.0) for _ in range(self.embedding_dim)]
+        norm = sum(v * v for v in vec) ** 0.5 or 1.0
+        return [v / norm for v in vec]
+
+
+class _FakeLLMHandler(_QuietHandler):
+    def do_POST(self):
+        fake: FakeLLMServer = self.server.owner
+        body = self._read_json()
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            messages = body.get("messages") or []
+            kind, text = fake.answer_for(messages)
+            tokens_in = sum(_estimate_tokens(str(m.get("content") or "")) for m in messages)
+            tokens_out = _estimate_tokens(text)
+            time.sleep(fake.latency_ms / 1000 + tokens_out / max(fake.tokens_per_s, 1e-6))
+            fake.count(f"chat.{kind}", tokens_in, tokens_out)
+            self._send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": tokens_in, "completion_tokens": tokens_out, "total_tokens": tokens_in + tokens_out},
+            })
+            return
+        if self.path.rstrip("/").endswith("/embeddings"):
+            inputs = body.get("input")
+            if not isinstance(inputs, list) or (inputs and isinstance(inputs[0], int)):
+                inputs = [inputs]
+            time.sleep(fake.embedding_latency_ms / 1000)
+            data = []
+            for i, item in enumerate(inputs):
+                vec = fake.embedding_for(item)
+                if body.get("encoding_format") == "base64":
+                    vec = base64.b64encode(struct.pack(f"<{len(vec)}f", *vec)).decode("ascii")
+                data.append({"object": "embedding", "index": i, "embedding": vec})
+            tokens = sum(len(x) if isinstance(x, list) else _estimate_tokens(str(x)) for x in inputs)
+            fake.count("embeddings", tokens, 0)
+            self._send_json(200, {"object": "list", "data": data, "model": body.get("model", "fake"),
+                                  "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+            return
+        self._send_json(404, {"error": {"message": f"ruta no soportada: {self.path}"}})
+
+
+class FakeEvolutionServer(_BackgroundServer):
+    """Evolution falso: registra cada sendText por número y despierta a quien espera la respuesta."""
+
+    def __init__(self, latency_ms: float = 30):
+        super().__init__(_FakeEvolutionHandler)
+        self.latency_ms = latency_ms
+        self._cond = threading.Condition()
+        self.replies: dict[str, list[tuple[float, str]]] = {}
+
+    def record(self, number: str, text: str) -> None:
+        with self._cond:
+            self.replies.setdefault(number, []).append((time.perf_counter(), text))
+            self._cond.notify_all()
+
+    def reply_count(self, number: str) -> int:
+        with self._cond:
+            return len(self.replies.get(number, ()))
+
+    def wait_for_reply(self, number: str, count: int, timeout: float) -> tuple[float, str] | None:
+        """Espera hasta que el número tenga al menos `count` respuestas; devuelve la última."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self.replies.get(number, ())) < count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            return self.replies[number][count - 1]
+
+
+class _FakeEvolutionHandler(_QuietHandler):
+    def do_POST(self):
+        fake: FakeEvolutionServer = self.server.owner
+        body = self._read_json()
+        if "/message/sendText/" not in self.path:
+            self._send_json(404, {"error": "not found"})
+            return
+        text = body.get("text") or body.get("message") or (body.get("textMessage") or {}).get("text") or ""
+        time.sleep(fake.latency_ms / 1000)
+        fake.record(str(body.get("number", "")), text)
+        self._send_json(201, {"key": {"id": hashlib.md5(text.encode("utf-8")).hexdigest()}, "status": "PENDING"})
+
+
+def upsert_payload(number: str, text: str, message_id: str, instance: str = "bench") -> dict:
+    """Payload MESSAGES_UPSERT tal como lo envía Evolution (Baileys)."""
+    return {
+        "event": "messages.upsert",
+        "instance": instance,
+        "data": {
+            "key": {"remoteJid": f"{number}@s.whatsapp.net", "fromMe": False, "id": message_id},
+            "message": {"conversation": text},
+            "messageTimestamp": int(time.time()),
+        },
+    }
+
+
+def start_webhook_app(llm: FakeLLMServer, evolution: FakeEvolutionServer, instance: str = "bench",
+                      extra_env: dict | None = None):
+    """Importa webhook.py apuntando a los fakes y lo sirve en un hilo. Devuelve (módulo, url, servidor)."""
+    env = {
+        "OPENAI_API_KEY": FAKE_API_KEY,
+        "OPENAI_BASE_URL": f"{llm.url}/v1",
+        "OPENAI_API_BASE": f"{llm.url}/v1",
+        "EVO_API_URL": evolution.url,
+        "EVO_APIKEY": "bench",
+        "EVO_INSTANCE": instance,
+    }
+    env.update(extra_env or {})
+    os.environ.update(env)
+    webhook = importlib.import_module("webhook")
+    # load_dotenv(override=True) puede haber pisado las variables con un .env real: las restauramos
+    os.environ.update(env)
+    # El tenant por defecto recibe los payloads del benchmark (su "instance" no coincide con otro tenant)
+    webhook.TENANTS.default.evo_api_url = evolution.url
+    webhook.TENANTS.default.evo_apikey = "bench"
+    if webhook.VECTORSTORE is not None:
+        llm.embedding_dim = webhook.VECTORSTORE.index.d
+
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, webhook.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return webhook, f"http://127.0.0.1:{server.server_port}", server
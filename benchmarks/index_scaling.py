@@ -0,0 +1,136 @@
+"""
+Benchmark de escalado de los tipos de índice FAISS (ver indexes.py) con un corpus sintético.
+
+Genera vectores normalizados agrupados en clusters (parecidos a embeddings de texto),
+arma cada tipo de índice con los mismos parámetros que usaría ingest.py y reporta por
+tamaño de corpus: tiempo de construcción, memoria (tamaño serializado del índice y
+crecimiento del RSS), latencia por consulta (p50/p95, una consulta a la vez) y recall@k
+contra la búsqueda exacta (flat).
+
+Uso:
+    python -m benchmarks.index_scaling
+    python -m benchmarks.index_scaling --sizes 10000,100000 --dim 1536 --types flat,hnsw,ivf_sq,ivf_pq
+    python -m benchmarks.index_scaling --sizes 1000000 --dim 256 --json-out index_scaling.json
+
+Ojo: 1M vectores de 1536 dimensiones ocupan ~6 GB solo en float32; usa --dim para achicarlo.
+"""
+
+import argparse
+import gc
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+
+import indexes
+from benchmarks.harness import percentile, rss_bytes
+
+
+def synthetic_vectors(n: int, dim: int, centers: np.ndarray, rng: np.random.Generator, block: int = 50_000) -> np.ndarray:
+    """n vectores unitarios alrededor de `centers`, generados por bloques para acotar la memoria."""
+    out = np.empty((n, dim), dtype="float32")
+    for start in range(0, n, block):
+        size = min(block, n - start)
+        labels = rng.integers(0, len(centers), size)
+        chunk = centers[labels] + 0.35 * rng.standard_normal((size, dim), dtype="float32")
+        chunk /= np.linalg.norm(chunk, axis=1, keepdims=True)
+        out[start:start + size] = chunk
+    return out
+
+
+def index_bytes(index) -> int:
+    """Tamaño del índice escrito a disco (lo mismo que ocupa vectorstore/index.faiss)."""
+    with tempfile.NamedTemporaryFile(suffix=".faiss", delete=False) as f:
+        path = f.name
+    try:
+        faiss.write_index(index, path)
+        return os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+
+def query_latencies(index, queries: np.ndarray, k: int) -> tuple[list[float], np.ndarray]:
+    latencies, ids = [], np.empty((len(queries), k), dtype="int64")
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, found = index.search(queries[i:i + 1], k)
+        latencies.append(time.perf_counter() - started)
+        ids[i] = found[0]
+    return latencies, ids
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(row[row >= 0]) & set(expected)) for row, expected in zip(found, truth))
+    return hits / (len(truth) * k)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Escalado de tipos de índice FAISS")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="tamaños de corpus separados por coma")
+    parser.add_argument("--dim", type=int, default=1536, help="dimensión (1536 = text-embedding de OpenAI)")
+    parser.add_argument("--types", default=",".join(indexes.INDEX_TYPES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--threads", type=int, default=1, help="hilos de FAISS (1 = latencia de una consulta aislada)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json-out")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(args.threads)
+    types = [t.strip() for t in args.types.split(",") if t.strip()]
+    rng = np.random.default_rng(args.seed)
+    centers = rng.standard_normal((args.clusters, args.dim), dtype="float32")
+    rows = []
+
+    for n in (int(s) for s in args.sizes.split(",")):
+        corpus = synthetic_vectors(n, args.dim, centers, rng)
+        queries = synthetic_vectors(args.queries, args.dim, centers, rng)
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(corpus)
+        _, truth = exact.search(queries, args.k)
+        del exact
+
+        print(f"\n=== {n} vectores x {args.dim} dimensiones, {args.queries} consultas, k={args.k} ===")
+        print(f"{'tipo':<8} {'construcción':>13} {'índice':>10} {'RSS +':>10} {'p50':>9} {'p95':>9} {'recall@k':>9}")
+        for index_type in types:
+            gc.collect()
+            rss_before = rss_bytes()
+            index, meta = indexes.build_index(corpus, index_type, indexes.default_params(index_type, n, args.dim))
+            rss_delta = max(0, rss_bytes() - rss_before)
+            latencies, found = query_latencies(index, queries, args.k)
+            row = {
+                "n": n,
+                "dim": args.dim,
+                "index_type": index_type,
+                "built_as": meta["index_type"],
+                "params": meta["params"],
+                "build_seconds": meta["build_seconds"],
+                "index_bytes": index_bytes(index),
+                "rss_delta_bytes": rss_delta,
+                "query_p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                "query_p95_ms": round(percentile(latencies, 95) * 1000, 3),
+                "recall_at_k": round(recall_at_k(found, truth), 4),
+            }
+            rows.append(row)
+            label = index_type if meta["index_type"] == index_type else f"{index_type}*"
+            print(f"{label:<8} {row['build_seconds']:>11.2f} s {row['index_bytes'] / 2**20:>7.1f} MB "
+                  f"{rss_delta / 2**20:>7.1f} MB {row['query_p50_ms']:>6.2f} ms {row['query_p95_ms']:>6.2f} ms "
+                  f"{row['recall_at_k']:>9.4f}")
+            del index
+        del corpus
+    if any(r["built_as"] != r["index_type"] for r in rows):
+        print("* corpus demasiado chico para entrenar ese tipo: se construyó flat")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump({"threads": args.threads, "results": rows}, f, ensure_ascii=False, indent=2)
+        print(f"Reporte guardado en {args.json_out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Prueba de carga offline del webhook completo.
+
+Levanta `webhook:app` en este proceso contra un OpenAI falso y un Evolution falso
+(ver benchmarks/harness.py) y recorre conversaciones sintéticas de WhatsApp por todo
+el embudo de ConversationState (saludo -> nombre -> cargo -> servicio -> info -> pago)
+con la concurrencia indicada. Reporta latencia de punta a punta (p50/p95/p99) por
+turno y global, throughput, llamadas/tokens al LLM y memoria por sesión.
+
+Uso:
+    python -m benchmarks.load_test --users 100 --concurrency 20 --llm-latency-ms 400
+    python -m benchmarks.load_test --users 20 --tracemalloc --json-out bench_output.json
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.harness import (
+    FakeEvolutionServer, FakeLLMServer, percentile, rss_bytes, start_webhook_app, upsert_payload,
+)
+
+# Conversación por defecto: recorre todo el embudo sin disparar agente/agendamiento
+FUNNEL_SCRIPT = (
+    ("greeting", "Buenas"),
+    ("name_city", "Soy Ana de Medellín"),
+    ("role", "Trabajo como analista de datos"),
+    ("service_choice", "1"),
+    ("providing_info", "¿Qué incluye el servicio?"),
+    ("payment_confirmation", "Completé el formulario y realicé el pago"),
+)
+
+
+def _summary(latencies: list[float]) -> dict:
+    return {
+        "count": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies) * 1000, 1) if latencies else 0.0,
+    }
+
+
+def run_conversation(session: requests.Session, webhook_url: str, evolution: FakeEvolutionServer,
+                     number: str, script, think_s: float, timeout: float) -> list[tuple[str, float | None]]:
+    results = []
+    for turn_index, (turn_name, text) in enumerate(script, start=1):
+        started = time.perf_counter()
+        session.post(f"{webhook_url}/webhook", json=upsert_payload(number, text, uuid.uuid4().hex.upper()), timeout=timeout)
+        reply = evolution.wait_for_reply(number, turn_index, timeout)
+        results.append((turn_name, reply[0] - started if reply else None))
+        if reply is None:
+            break
+        if think_s:
+            time.sleep(think_s)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga offline del webhook")
+    parser.add_argument("--users", type=int, default=50, help="conversaciones sintéticas a ejecutar")
+    parser.add_argument("--concurrency", type=int, default=10, help="conversaciones simultáneas")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="latencia base por completion")
+    parser.add_argument("--llm-tokens-per-s", type=float, default=80, help="velocidad de generación del LLM falso")
+    parser.add_argument("--answer-tokens", type=int, default=120, help="tokens de las respuestas generativas")
+    parser.add_argument("--embedding-latency-ms", type=float, default=20)
+    parser.add_argument("--evo-latency-ms", type=float, default=30, help="latencia del sendText falso")
+    parser.add_argument("--think-ms", type=float, default=0, help="pausa del usuario entre turnos")
+    parser.add_argument("--timeout", type=float, default=120, help="espera máxima por respuesta")
+    parser.add_argument("--tracemalloc", action="store_true", help="mide memoria por sesión con tracemalloc (más lento)")
+    parser.add_argument("--json-out", help="guarda el reporte en JSON")
+    args = parser.parse_args()
+
+    llm = FakeLLMServer(args.llm_latency_ms, args.llm_tokens_per_s, args.answer_tokens,
+                        embedding_latency_ms=args.embedding_latency_ms).start()
+    evolution = FakeEvolutionServer(args.evo_latency_ms).start()
+    webhook, webhook_url, server = start_webhook_app(llm, evolution)
+
+    rss_before = rss_bytes()
+    if args.tracemalloc:
+        tracemalloc.start()
+    traced_before = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+
+    numbers = [f"57300{i:07d}" for i in range(args.users)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        sessions = [requests.Session() for _ in range(args.concurrency)]
+        futures = [
+            pool.submit(run_conversation, sessions[i % args.concurrency], webhook_url, evolution,
+                        number, FUNNEL_SCRIPT, args.think_ms / 1000, args.timeout)
+            for i, number in enumerate(numbers)
+        ]
+        conversations = [f.result() for f in futures]
+    wall = time.perf_counter() - started
+
+    traced_after = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+    rss_after = rss_bytes()
+    session_count = max(1, len(webhook._user_bots))
+
+    per_turn: dict[str, list[float]] = {name: [] for name, _ in FUNNEL_SCRIPT}
+    all_latencies, timeouts = [], 0
+    for conversation in conversations:
+        for turn_name, latency in conversation:
+            if latency is None:
+                timeouts += 1
+            else:
+                per_turn[turn_name].append(latency)
+                all_latencies.append(latency)
+
+    llm_stats = llm.snapshot()
+    report = {
+        "config": vars(args),
+        "wall_seconds": round(wall, 2),
+        "turns_completed": len(all_latencies),
+        "turns_timed_out": timeouts,
+        "throughput_turns_per_s": round(len(all_latencies) / wall, 2) if wall else 0.0,
+        "end_to_end": _summary(all_latencies),
+        "per_turn": {name: _summary(values) for name, values in per_turn.items()},
+        "llm": llm_stats,
+        "llm_calls_per_turn": round(sum(llm_stats["calls"].values()) / max(1, len(all_latencies)), 2),
+        "memory": {
+            "sessions": len(webhook._user_bots),
+            "rss_delta_bytes": rss_after - rss_before,
+            "rss_bytes_per_session": (rss_after - rss_before) // session_count,
+            "traced_bytes_per_session": (traced_after - traced_before) // session_count if args.tracemalloc else None,
+        },
+    }
+
+    print(f"\n=== Load test: {args.users} conversaciones, concurrencia {args.concurrency} ===")
+    print(f"Turnos completados: {report['turns_completed']}  (timeouts: {timeouts})  en {report['wall_seconds']} s")
+    print(f"Throughput: {report['throughput_turns_per_s']} turnos/s   LLM calls/turno: {report['llm_calls_per_turn']}")
+    e2e = report["end_to_end"]
+    print(f"Punta a punta: p50={e2e['p50_ms']} ms  p95={e2e['p95_ms']} ms  p99={e2e['p99_ms']} ms  max={e2e['max_ms']} ms")
+    for name, s in report["per_turn"].items():
+        print(f"  {name:<22} n={s['count']:<5} p50={s['p50_ms']:>9} ms  p95={s['p95_ms']:>9} ms  p99={s['p99_ms']:>9} ms")
+    mem = report["memory"]
+    print(f"Memoria: {mem['sessions']} sesiones, RSS/sesión ≈ {mem['rss_bytes_per_session']} B"
+          + (f", tracemalloc/sesión ≈ {mem['traced_bytes_per_session']} B" if args.tracemalloc else ""))
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Reporte guardado en {args.json_out}")
+
+    server.shutdown()
+    llm.stop()
+    evolution.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Benchmark de replay a partir de payloads reales (anonimizados) del webhook.
+
+1) Captura en producción con WEBHOOK_CAPTURE_PATH=captures/webhook.jsonl (ver capture.py).
+   También se aceptan como entrada los registros `turn` del log estructurado (eventlog.py).
+2) Replay contra este build, con el OpenAI y Evolution falsos de benchmarks/harness.py:
+
+    python -m benchmarks.replay run captures/webhook.jsonl --speed 10 --out replay_a.json
+
+   --speed 1 respeta los tiempos originales, 10 los acelera 10x y 0 envía lo más rápido
+   posible. El intercalado entre usuarios se mantiene por timestamp y cada usuario espera
+   la respuesta a su mensaje anterior antes de enviar el siguiente.
+3) Repetir en el otro build (otro checkout) y comparar:
+
+    python -m benchmarks.replay compare replay_a.json replay_b.json
+
+   Marca regresión si la latencia p50/p95/p99 o las llamadas al LLM suben más de la
+   tolerancia, o si cambia la secuencia de estados del embudo de algún usuario.
+   Sale con código 1 cuando hay regresiones.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from benchmarks.harness import (
+    FakeEvolutionServer, FakeLLMServer, percentile, start_webhook_app, upsert_payload,
+)
+
+
+def load_events(path: str) -> list[tuple[float, dict]]:
+    """Lee capturas (`webhook_payload`) o registros `turn` del log estructurado como (ts, payload)."""
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("event") == "webhook_payload":
+                events.append((float(record["ts"]), record["payload"]))
+            elif record.get("event") == "turn" and record.get("text"):
+                payload = upsert_payload(record["sender"], record["text"], f"REPLAY{i:08d}")
+                events.append((float(record["ts"]), payload))
+    events.sort(key=lambda e: e[0])
+    return events
+
+
+def _messages(payload: dict) -> list[dict]:
+    data = payload.get("data")
+    if isinstance(data, dict):
+        if isinstance(data.get("messages"), list):
+            return data["messages"]
+        return [data]
+    if isinstance(data, list):
+        return data
+    return payload.get("messages") or []
+
+
+def _sender(payload: dict) -> str:
+    """Número del usuario al que pertenece el evento (para agrupar el replay por usuario)."""
+    for msg in _messages(payload):
+        jid = ((msg or {}).get("key") or {}).get("remoteJid") or (msg or {}).get("from") or ""
+        if jid:
+            return str(jid).split("@")[0].split(":")[0]
+    return "unknown"
+
+
+def _expected_replies(payload: dict) -> int:
+    """Mensajes de texto entrantes (no fromMe) que deberían producir una respuesta."""
+    count = 0
+    for msg in _messages(payload):
+        msg = msg or {}
+        if (msg.get("key") or {}).get("fromMe"):
+            continue
+        message = msg.get("message") or {}
+        if message.get("conversation") or (message.get("extendedTextMessage") or {}).get("text") or msg.get("text"):
+            count += 1
+    return count
+
+
+def _git_label() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+def _summary(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50) * 1000, 1),
+        "p95_ms": round(percentile(values, 95) * 1000, 1),
+        "p99_ms": round(percentile(values, 99) * 1000, 1),
+    }
+
+
+def run_replay(args) -> dict:
+    events = load_events(args.source)
+    if not events:
+        raise SystemExit(f"No hay eventos reproducibles en {args.source}")
+
+    event_log_path = os.path.join(tempfile.mkdtemp(prefix="replay-"), "events.jsonl")
+    llm = FakeLLMServer(args.llm_latency_ms, args.llm_tokens_per_s, args.answer_tokens).start()
+    evolution = FakeEvolutionServer(args.evo_latency_ms).start()
+    webhook, webhook_url, server = start_webhook_app(
+        llm, evolution, extra_env={"EVENT_LOG_PATH": event_log_path, "EVENT_LOG_LEVEL": "INFO"})
+
+    by_user: dict[str, list[tuple[float, dict]]] = {}
+    for ts, payload in events:
+        by_user.setdefault(_sender(payload), []).append((ts, payload))
+
+    t0_event = events[0][0]
+    t0_wall = time.perf_counter() + 0.5
+    latencies: list[float] = []
+    no_reply = [0]
+    lock = threading.Lock()
+    http = threading.local()
+
+    def replay_user(number: str, user_events: list[tuple[float, dict]]) -> None:
+        session = getattr(http, "session", None) or requests.Session()
+        http.session = session
+        expected = 0
+        pending: list[float] = []  # instantes de envío aún sin respuesta
+
+        def collect() -> None:
+            nonlocal expected
+            while pending:
+                target = expected - len(pending) + 1
+                reply = evolution.wait_for_reply(number, target, args.reply_timeout)
+                sent_at = pending.pop(0)
+                with lock:
+                    if reply is None:
+                        no_reply[0] += 1
+                    else:
+                        latencies.append(reply[0] - sent_at)
+                if reply is None:
+                    # Sin respuesta (pausa, bloqueo o duplicado descartado): re-sincronizamos el conteo
+                    expected = evolution.reply_count(number) + len(pending)
+
+        for ts, payload in user_events:
+            if args.speed > 0:
+                delay = t0_wall + (ts - t0_event) / args.speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            collect()
+            sent_at = time.perf_counter()
+            session.post(f"{webhook_url}/webhook", json=payload, timeout=args.reply_timeout)
+            for _ in range(_expected_replies(payload)):
+                expected += 1
+                pending.append(sent_at)
+        collect()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=min(args.max_parallel_users, len(by_user))) as pool:
+        for future in [pool.submit(replay_user, n, evs) for n, evs in by_user.items()]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    # Secuencia de estados del embudo por usuario, tomada de los registros `turn`
+    webhook.eventlog.EVENT_LOG.flush()
+    funnel: dict[str, list] = {}
+    replies: dict[str, list] = {}
+    if os.path.exists(event_log_path):
+        with open(event_log_path, encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("event") == "turn":
+                    funnel.setdefault(record["sender"], []).append(
+                        [record.get("state_from"), record.get("state_to"), record.get("outcome")])
+    for number, items in evolution.replies.items():
+        replies[number] = [hashlib.sha1(text.encode("utf-8")).hexdigest()[:12] for _, text in items]
+
+    llm_stats = llm.snapshot()
+    result = {
+        "label": args.label or _git_label(),
+        "source": args.source,
+        "speed": args.speed,
+        "events": len(events),
+        "users": len(by_user),
+        "wall_seconds": round(wall, 2),
+        "latency": _summary(latencies),
+        "no_reply": no_reply[0],
+        "llm": llm_stats,
+        "llm_calls_total": sum(llm_stats["calls"].values()),
+        "funnel": funnel,
+        "replies": replies,
+    }
+    server.shutdown()
+    llm.stop()
+    evolution.stop()
+    return result
+
+
+def compare(baseline: dict, candidate: dict, latency_tolerance: float, llm_tolerance: float) -> list[str]:
+    """Devuelve la lista de regresiones del candidato frente a la línea base."""
+    regressions = []
+    print(f"{'métrica':<20}{baseline['label']:>14}{candidate['label']:>14}{'cambio':>10}")
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        a, b = baseline["latency"][key], candidate["latency"][key]
+        change = (b - a) / a if a else 0.0
+        print(f"{'latencia ' + key:<20}{a:>14}{b:>14}{change:>+10.1%}")
+        if change > latency_tolerance:
+            regressions.append(f"latencia {key} +{change:.1%} (tolerancia {latency_tolerance:.0%})")
+    a, b = baseline["llm_calls_total"], candidate["llm_calls_total"]
+    change = (b - a) / a if a else 0.0
+    print(f"{'llamadas LLM':<20}{a:>14}{b:>14}{change:>+10.1%}")
+    if change > llm_tolerance:
+        regressions.append(f"llamadas LLM +{change:.1%} (tolerancia {llm_tolerance:.0%})")
+    a, b = baseline["no_reply"], candidate["no_reply"]
+    print(f"{'sin respuesta':<20}{a:>14}{b:>14}")
+    if b > a:
+        regressions.append(f"mensajes sin respuesta: {a} -> {b}")
+
+    diverged = sorted(
+        user for user in set(baseline["funnel"]) | set(candidate["funnel"])
+        if baseline["funnel"].get(user) != candidate["funnel"].get(user)
+    )
+    if diverged:
+        regressions.append(f"el embudo cambió para {len(diverged)} usuario(s): {', '.join(diverged[:10])}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de payloads del webhook y comparación entre builds")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run = sub.add_parser("run", help="reproduce una captura contra este build")
+    run.add_argument("source", help="JSONL de capture.py o del log estructurado (registros turn)")
+    run.add_argument("--speed", type=float, default=1.0, help="1 = tiempos originales, 10 = 10x, 0 = sin esperas")
+    run.add_argument("--out", required=True, help="archivo JSON de resultados")
+    run.add_argument("--label", help="nombre del build (default: commit actual)")
+    run.add_argument("--llm-latency-ms", type=float, default=300)
+    run.add_argument("--llm-tokens-per-s", type=float, default=80)
+    run.add_argument("--answer-tokens", type=int, default=120)
+    run.add_argument("--evo-latency-ms", type=float, default=30)
+    run.add_argument("--reply-timeout", type=float, default=60)
+    run.add_argument("--max-parallel-users", type=int, default=256)
+
+    cmp_parser = sub.add_parser("compare", help="compara dos resultados y marca regresiones")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("candidate")
+    cmp_parser.add_argument("--latency-tolerance", type=float, default=0.10, help="aumento relativo permitido")
+    cmp_parser.add_argument("--llm-calls-tolerance", type=float, default=0.0, help="aumento relativo permitido")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        result = run_replay(args)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        lat = result["latency"]
+        print(f"Replay {result['label']}: {result['events']} eventos, {result['users']} usuarios en {result['wall_seconds']} s")
+        print(f"Latencia p50={lat['p50_ms']} ms p95={lat['p95_ms']} ms p99={lat['p99_ms']} ms; "
+              f"sin respuesta={result['no_reply']}; llamadas LLM={result['llm_calls_total']}")
+        print(f"Resultados en {args.out}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.candidate, encoding="utf-8") as f:
+        candidate = json.load(f)
+    regressions = compare(baseline, candidate, args.latency_tolerance, args.llm_calls_tolerance)
+    if regressions:
+        print("\nREGRESIONES:")
+        for r in regressions:
+            print(f"- {r}")
+        sys.exit(1)
+    print("\nSin regresiones.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark de memoria por sesión.
+
+Crea N sesiones de Chatbot en este proceso (contra el OpenAI falso de benchmarks/harness.py),
+las lleva por el embudo completo y mide con tracemalloc cuánto ocupa cada una, junto con la
+estimación propia de `Chatbot.memory_bytes()` (lo mismo que reporta /debug/memory).
+
+Uso:
+    python -m benchmarks.session_memory --sessions 500
+    python -m benchmarks.session_memory --sessions 200 --turns 4 --json-out memory.json
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from benchmarks.harness import FakeEvolutionServer, FakeLLMServer, start_webhook_app
+from benchmarks.load_test import FUNNEL_SCRIPT
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria por sesión del Chatbot")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=len(FUNNEL_SCRIPT), help="turnos del embudo por sesión")
+    parser.add_argument("--llm-latency-ms", type=float, default=1, help="latencia del LLM falso (solo alarga la corrida)")
+    parser.add_argument("--answer-tokens", type=int, default=120)
+    parser.add_argument("--top", type=int, default=10, help="sitios de asignación a mostrar")
+    parser.add_argument("--json-out")
+    args = parser.parse_args()
+
+    llm = FakeLLMServer(args.llm_latency_ms, tokens_per_s=1e9, answer_tokens=args.answer_tokens).start()
+    evolution = FakeEvolutionServer(0).start()
+    webhook, _, server = start_webhook_app(llm, evolution)
+    Chatbot = webhook.Chatbot
+    script = FUNNEL_SCRIPT[:args.turns]
+
+    # Calentamiento: construye las cadenas compartidas y los cachés de import antes de medir
+    warm = Chatbot(webhook.VECTORSTORE)
+    for _, text in script:
+        warm.process_message(text)
+    del warm
+    gc.collect()
+
+    tracemalloc.start(10)
+    before = tracemalloc.take_snapshot()
+    started = time.perf_counter()
+    bots = []
+    for _ in range(args.sessions):
+        bot = Chatbot(webhook.VECTORSTORE)
+        for _, text in script:
+            bot.process_message(text)
+        bots.append(bot)
+    elapsed = time.perf_counter() - started
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    diff = after.compare_to(before, "lineno")
+    traced = sum(stat.size_diff for stat in diff)
+    owned = [bot.memory_bytes() for bot in bots]
+    report = {
+        "sessions": args.sessions,
+        "turns_per_session": len(script),
+        "seconds": round(elapsed, 2),
+        "traced_bytes_per_session": traced // max(1, args.sessions),
+        "memory_bytes_per_session": sum(owned) // max(1, len(owned)),
+        "history_messages_per_session": sum(len(b.chat_history) for b in bots) // max(1, len(bots)),
+        "top_allocations": [
+            {"site": str(stat.traceback[0]), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+            for stat in diff[:args.top]
+        ],
+    }
+
+    print(f"\n=== Memoria por sesión: {args.sessions} sesiones x {len(script)} turnos ({report['seconds']} s) ===")
+    print(f"tracemalloc: {report['traced_bytes_per_session']} B/sesión   "
+          f"Chatbot.memory_bytes(): {report['memory_bytes_per_session']} B/sesión   "
+          f"historial: {report['history_messages_per_session']} mensajes/sesión")
+    for item in report["top_allocations"]:
+        print(f"  {item['size_diff_bytes']:>10} B  {item['count_diff']:>7}  {item['site']}")
+
+    if args.json_out:
+        with open(args.json_out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Reporte guardado en {args.json_out}")
+
+    server.shutdown()
+    llm.stop()
+    evolution.stop()
+
+
+if __name__ == "__main__":
+    main()
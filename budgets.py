@@ -0,0 +1,184 @@
+"""
+Presupuestos de tokens y llamadas al LLM por remitente y globales, en ventanas móviles.
+
+Cada turno se cobra al terminar con los tokens y llamadas reales de su acumulador
+(metrics.turn). Antes de procesar un mensaje el webhook consulta `exceeded()`: si el
+remitente o el proceso completo superó su presupuesto, el turno corre dentro de
+`resilience.llm_budget_exceeded()` y el bot contesta con plantillas deterministas (menú de
+servicios, calendario, pasos de pago u oferta de agente humano) sin llamar al LLM.
+
+La ventana se guarda en BUDGET_BUCKETS cubetas por clave, así el costo de cobrar y consultar
+no depende de cuántos mensajes mandó el remitente. El prefetch especulativo tiene su propio
+límite (ver prefetch.py) y no se cobra aquí.
+
+Variables de entorno (0 = sin límite):
+- BUDGET_WINDOW_SECONDS  (default 3600)
+- BUDGET_SENDER_TOKENS   (tokens por remitente en la ventana, default 30000)
+- BUDGET_SENDER_CALLS    (llamadas LLM por remitente en la ventana, default 60)
+- BUDGET_GLOBAL_TOKENS   (tokens de todo el proceso en la ventana, default 0)
+- BUDGET_GLOBAL_CALLS    (llamadas LLM de todo el proceso en la ventana, default 0)
+"""
+
+import os
+import time
+from collections import deque
+from threading import Lock
+
+from metrics import Counter, Gauge, REGISTRY
+
+BUDGET_WINDOW_SECONDS = float(os.getenv("BUDGET_WINDOW_SECONDS", "3600"))
+BUDGET_SENDER_TOKENS = int(os.getenv("BUDGET_SENDER_TOKENS", "30000"))
+BUDGET_SENDER_CALLS = int(os.getenv("BUDGET_SENDER_CALLS", "60"))
+BUDGET_GLOBAL_TOKENS = int(os.getenv("BUDGET_GLOBAL_TOKENS", "0"))
+BUDGET_GLOBAL_CALLS = int(os.getenv("BUDGET_GLOBAL_CALLS", "0"))
+BUDGET_BUCKETS = 60
+
+GLOBAL_KEY = "*"
+
+BUDGET_DEGRADED = REGISTRY.register(Counter(
+    "chatbot_budget_degraded_turns_total", "Turnos respondidos con plantillas por presupuesto agotado", ("scope",)))
+BUDGET_GLOBAL_TOKENS_USED = REGISTRY.register(Gauge(
+    "chatbot_budget_global_tokens", "Tokens LLM gastados por el proceso en la ventana del presupuesto"))
+
+
+class _Window:
+    """Uso de una clave en la ventana móvil: cubetas (inicio, tokens, llamadas) y totales."""
+
+    __slots__ = ("buckets", "tokens", "calls")
+
+    def __init__(self):
+        self.buckets: deque[list] = deque()
+        self.tokens = 0
+        self.calls = 0
+
+    def expire(self, cutoff: float) -> None:
+        while self.buckets and self.buckets[0][0] < cutoff:
+            _, tokens, calls = self.buckets.popleft()
+            self.tokens -= tokens
+            self.calls -= calls
+
+    def add(self, bucket_start: float, tokens: int, calls: int) -> None:
+        if self.buckets and self.buckets[-1][0] == bucket_start:
+            self.buckets[-1][1] += tokens
+            self.buckets[-1][2] += calls
+        else:
+            self.buckets.append([bucket_start, tokens, calls])
+        self.tokens += tokens
+        self.calls += calls
+
+
+class TokenBudgets:
+    """Contabilidad de tokens/llamadas por remitente y global con límites en ventana móvil."""
+
+    def __init__(self, window_seconds: float = BUDGET_WINDOW_SECONDS,
+                 sender_tokens: int = BUDGET_SENDER_TOKENS, sender_calls: int = BUDGET_SENDER_CALLS,
+                 global_tokens: int = BUDGET_GLOBAL_TOKENS, global_calls: int = BUDGET_GLOBAL_CALLS):
+        self.window_seconds = window_seconds
+        self.sender_tokens = sender_tokens
+        self.sender_calls = sender_calls
+        self.global_tokens = global_tokens
+        self.global_calls = global_calls
+        self._bucket_seconds = max(1.0, window_seconds / BUDGET_BUCKETS)
+        self._windows: dict[str, _Window] = {}
+        self._global = _Window()
+        self._lock = Lock()
+        self._last_sweep = time.monotonic()
+        self.degraded = {"sender": 0, "global": 0}
+        BUDGET_GLOBAL_TOKENS_USED.set_function(lambda: self._global.tokens)
+
+    def charge(self, key: str, tokens: int, calls: int) -> None:
+        """Cobra el consumo de un turno al remitente y al total."""
+        if not tokens and not calls:
+            return
+        now = time.monotonic()
+        bucket_start = now - now % self._bucket_seconds
+        cutoff = now - self.window_seconds
+        with self._lock:
+            window = self._windows.get(key)
+            if window is None:
+                window = self._windows[key] = _Window()
+            window.expire(cutoff)
+            window.add(bucket_start, tokens, calls)
+            self._global.expire(cutoff)
+            self._global.add(bucket_start, tokens, calls)
+            if now - self._last_sweep >= self.window_seconds:
+                self._sweep(cutoff)
+                self._last_sweep = now
+
+    def _sweep(self, cutoff: float) -> None:
+        """Descarta los remitentes sin consumo dentro de la ventana."""
+        for key in [k for k, w in self._windows.items() if not w.buckets or w.buckets[-1][0] < cutoff]:
+            del self._windows[key]
+
+    def exceeded(self, key: str) -> str | None:
+        """"sender" o "global" si ese presupuesto está agotado; None si el turno puede usar el LLM."""
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            self._global.expire(cutoff)
+            if _over(self._global, self.global_tokens, self.global_calls):
+                scope = "global"
+            else:
+                window = self._windows.get(key)
+                if window is not None:
+                    window.expire(cutoff)
+                scope = "sender" if window is not None and _over(window, self.sender_tokens, self.sender_calls) else None
+            if scope is not None:
+                self.degraded[scope] += 1
+        if scope is not None:
+            BUDGET_DEGRADED.inc(scope=scope)
+        return scope
+
+    def usage(self, key: str) -> dict:
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                window.expire(cutoff)
+            tokens, calls = (window.tokens, window.calls) if window is not None else (0, 0)
+        return {
+            "key": key,
+            "tokens": tokens,
+            "calls": calls,
+            "over_budget": _over_counts(tokens, calls, self.sender_tokens, self.sender_calls),
+        }
+
+    def stats(self, top: int = 20) -> dict:
+        cutoff = time.monotonic() - self.window_seconds
+        with self._lock:
+            self._global.expire(cutoff)
+            for window in self._windows.values():
+                window.expire(cutoff)
+            usage = [(key, w.tokens, w.calls) for key, w in self._windows.items() if w.buckets]
+            global_tokens, global_calls = self._global.tokens, self._global.calls
+            degraded = dict(self.degraded)
+        usage.sort(key=lambda item: item[1], reverse=True)
+        return {
+            "window_seconds": self.window_seconds,
+            "limits": {
+                "sender_tokens": self.sender_tokens,
+                "sender_calls": self.sender_calls,
+                "global_tokens": self.global_tokens,
+                "global_calls": self.global_calls,
+            },
+            "global": {
+                "tokens": global_tokens,
+                "calls": global_calls,
+                "over_budget": _over_counts(global_tokens, global_calls, self.global_tokens, self.global_calls),
+            },
+            "senders_tracked": len(usage),
+            "senders_over_budget": sum(
+                1 for _, tokens, calls in usage if _over_counts(tokens, calls, self.sender_tokens, self.sender_calls)),
+            "degraded_turns": degraded,
+            "top_senders": [{"key": key, "tokens": tokens, "calls": calls} for key, tokens, calls in usage[:top]],
+        }
+
+
+def _over_counts(tokens: int, calls: int, token_limit: int, call_limit: int) -> bool:
+    return bool((token_limit and tokens >= token_limit) or (call_limit and calls >= call_limit))
+
+
+def _over(window: _Window, token_limit: int, call_limit: int) -> bool:
+    return _over_counts(window.tokens, window.calls, token_limit, call_limit)
+
+
+BUDGETS = TokenBudgets()
@@ -0,0 +1,74 @@
+"""
+Captura anonimizada de payloads del webhook para el benchmark de replay.
+
+Si WEBHOOK_CAPTURE_PATH está definido, cada evento de mensajes recibido en /webhook
+se escribe (sin bloquear, vía el escritor de eventlog.py) como una línea JSONL
+`{"ts": ..., "event": "webhook_payload", "payload": {...}}`. Los números se
+reemplazan por seudónimos estables, los ids de mensaje se hashean, se quitan el
+pushName y los datos de la instancia (apikey, server_url, destination) y se enmascaran
+secuencias largas de dígitos dentro del texto.
+
+Variables de entorno:
+- WEBHOOK_CAPTURE_PATH  (vacío = captura desactivada)
+- WEBHOOK_CAPTURE_SALT  (sal para los seudónimos; cambiarla rompe la correlación entre capturas)
+"""
+
+import atexit
+import hashlib
+import os
+import re
+
+from eventlog import EventLog
+
+WEBHOOK_CAPTURE_PATH = os.getenv("WEBHOOK_CAPTURE_PATH", "").strip()
+WEBHOOK_CAPTURE_SALT = os.getenv("WEBHOOK_CAPTURE_SALT", "xtalento-replay")
+
+_JID_FIELDS = ("remoteJid", "participant", "sender", "from", "owner")
+_TEXT_FIELDS = ("conversation", "text", "body", "caption")
+# El replay no los usa y la apikey y las URLs internas no deben quedar en las capturas
+_DROP_KEYS = {"pushName", "apikey", "server_url", "destination"}
+_LONG_DIGITS = re.compile(r"\d{6,}")
+
+_capture_log = EventLog(WEBHOOK_CAPTURE_PATH, "INFO") if WEBHOOK_CAPTURE_PATH else None
+if _capture_log is not None:
+    atexit.register(_capture_log.flush, 2.0)
+
+
+def _digest(value: str) -> str:
+    return hashlib.sha256(f"{WEBHOOK_CAPTURE_SALT}:{value}".encode("utf-8")).hexdigest()
+
+
+def pseudonymize_number(number: str) -> str:
+    """Número estable y con forma de teléfono a partir del original."""
+    return "57" + str(int(_digest(number)[:12], 16) % 10**10).zfill(10)
+
+
+def _pseudonymize_jid(jid: str) -> str:
+    user, sep, domain = jid.partition("@")
+    base, colon, device = user.partition(":")
+    return pseudonymize_number(base) + colon + device + sep + domain
+
+
+def anonymize_payload(value, key: str | None = None):
+    """Copia anonimizada del payload de Evolution (recursiva)."""
+    if isinstance(value, dict):
+        return {k: anonymize_payload(v, k) for k, v in value.items() if k not in _DROP_KEYS}
+    if isinstance(value, list):
+        return [anonymize_payload(v, key) for v in value]
+    if isinstance(value, str):
+        if key in _JID_FIELDS and value:
+            return _pseudonymize_jid(value)
+        if key == "id" and value:
+            return _digest(value)[:20].upper()
+        if key in _TEXT_FIELDS:
+            return _LONG_DIGITS.sub(lambda m: "0" * len(m.group(0)), value)
+    return value
+
+
+def capture_enabled() -> bool:
+    return _capture_log is not None
+
+
+def capture_payload(payload: dict) -> None:
+    if _capture_log is not None:
+        _capture_log.log("INFO", "webhook_payload", payload=anonymize_payload(payload))
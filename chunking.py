@@ -0,0 +1,173 @@
+"""
+Troceo por estructura de los documentos de Xtalento.
+
+En lugar de cortar cada .docx cada CHUNK_SIZE caracteres, se recorren los elementos que
+deja ingest.py (títulos, párrafos, tablas) y se arman fragmentos por sección:
+
+- Un título (Heading/Title del docx), una línea corta en mayúsculas o una línea corta que
+  termina en ":" abre una sección o subsección; el encabezado se repite al inicio de cada
+  fragmento de la sección para que el embedding conserve el contexto.
+- Cada fragmento lleva metadata `service` (número del menú de servicios, "general" si no
+  corresponde a uno) y `tier` ("operativo", "tactico", "estrategico" o "all").
+- Un párrafo o fila de tabla con precios de varios niveles se separa en un fragmento por
+  nivel, así los precios de niveles distintos nunca comparten fragmento.
+
+Con esa metadata el bot filtra antes de la búsqueda por similitud (ver main.py).
+"""
+
+import os
+import re
+import unicodedata
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+TIERS = ("operativo", "tactico", "estrategico")
+ALL_TIERS = "all"
+GENERAL_SERVICE = "general"
+
+# Encabezados que identifican un servicio del menú (texto sin tildes y en minúsculas).
+# El orden importa: "simulación de entrevista" antes que "entrevistas", "Método X" antes que "hoja de vida".
+SERVICE_HEADINGS = (
+    ("6", re.compile(r"metodo x")),
+    ("7", re.compile(r"test epi|personalidad integral")),
+    ("5", re.compile(r"simulacion de entrevista")),
+    ("3", re.compile(r"preparacion (para|de) (las )?entrevistas?")),
+    ("4", re.compile(r"estrategia (personalizada )?de busqueda")),
+    ("2", re.compile(r"perfil en plataformas|plataformas de empleo")),
+    ("1", re.compile(r"hoja de vida|\bhv\b|\bats\b")),
+)
+
+_TIER_RE = re.compile(r"\b(operativ|tactic|estrategic)[oa]s?\b")
+_PRICE_RE = re.compile(r"\$\s?\d|\d{2,3}\.\d{3}")
+_HEADING_MAX_CHARS = 80
+
+
+def _fold(text: str) -> str:
+    """Minúsculas sin tildes, carácter por carácter (mismas posiciones que el original)."""
+    return "".join(unicodedata.normalize("NFD", ch)[0].lower()[:1] or ch for ch in text)
+
+
+def normalize_tier(tier: str | None) -> str | None:
+    """'táctico' -> 'tactico'; None si no es un nivel conocido."""
+    folded = _fold(tier or "").strip()
+    return folded if folded in TIERS else None
+
+
+def detect_service(text: str) -> str | None:
+    folded = _fold(text)
+    for service_id, pattern in SERVICE_HEADINGS:
+        if pattern.search(folded):
+            return service_id
+    return None
+
+
+def _heading_kind(element: dict) -> str | None:
+    """"section", "subsection" o None."""
+    text = element["text"]
+    if element.get("category") == "Title":
+        return "section"
+    if len(text) > _HEADING_MAX_CHARS or _PRICE_RE.search(text):
+        return None
+    letters = [ch for ch in text if ch.isalpha()]
+    if letters and all(ch.isupper() for ch in letters):
+        return "section"
+    if text.rstrip().endswith(":"):
+        return "subsection"
+    return None
+
+
+def _table_rows(html: str) -> list[str]:
+    """Filas de una tabla como "encabezado: celda | ..." (la primera fila se toma como encabezado)."""
+    rows = []
+    for row_html in re.findall(r"<tr[^>]*>(.*?)</tr>", html, re.S | re.I):
+        cells = [re.sub(r"<[^>]+>", "", cell).strip() for cell in re.findall(r"<t[dh][^>]*>(.*?)</t[dh]>", row_html, re.S | re.I)]
+        if any(cells):
+            rows.append(cells)
+    if len(rows) < 2:
+        return [" | ".join(cells) for cells in rows]
+    header = rows[0]
+    return [" | ".join(f"{h}: {c}" if h else c for h, c in zip(header, cells) if c) for cells in rows[1:]]
+
+
+def _split_by_tier(text: str) -> list[tuple[str, str]]:
+    """[(nivel, texto)] si `text` tiene precios por nivel; [] si no lleva precios de nivel."""
+    if not _PRICE_RE.search(text):
+        return []
+    folded = _fold(text)
+    matches = list(_TIER_RE.finditer(folded))
+    tiers = {normalize_tier(m.group(1) + "o") for m in matches}
+    if len(tiers) == 1:
+        return [(tiers.pop(), text)]
+    if not matches or _PRICE_RE.search(text[:matches[0].start()]):
+        # Precio antes del nombre del nivel: no hay forma segura de partirlo
+        return []
+    prefix = text[:matches[0].start()].strip(" -–:\n")
+    pieces = []
+    for match, following in zip(matches, matches[1:] + [None]):
+        segment = text[match.start():following.start() if following else len(text)].strip(" -–;,\n")
+        pieces.append((normalize_tier(match.group(1) + "o"), f"{prefix}: {segment}" if prefix else segment))
+    return pieces
+
+
+def _units(elements: list[dict]):
+    """Elementos con las tablas expandidas en filas."""
+    for element in elements:
+        if element.get("html"):
+            for row in _table_rows(element["html"]):
+                yield {"text": row, "category": "TableRow"}
+        else:
+            yield element
+
+
+def split_documents(documents: list[Document], chunk_size: int, chunk_overlap: int) -> list[Document]:
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks: list[Document] = []
+    for document in documents:
+        source = document.metadata.get("source", "")
+        default_service = detect_service(os.path.basename(source)) or GENERAL_SERVICE
+        elements = document.metadata.get("elements")
+        if not elements:
+            for text in splitter.split_text(document.page_content):
+                chunks.append(Document(page_content=text, metadata={
+                    "source": source, "section": "", "service": default_service, "tier": ALL_TIERS}))
+            continue
+
+        section, subsection = "", ""
+        section_service = service = default_service
+        body: list[str] = []
+
+        def emit(text: str, tier: str) -> None:
+            header = " — ".join(part for part in (section, subsection) if part)
+            metadata = {"source": source, "section": header, "service": service, "tier": tier}
+            for piece in ([text] if len(text) <= chunk_size else splitter.split_text(text)):
+                chunks.append(Document(page_content=f"{header}\n{piece}" if header else piece, metadata=dict(metadata)))
+
+        def flush() -> None:
+            if body:
+                emit("\n".join(body), ALL_TIERS)
+                body.clear()
+
+        for element in _units(elements):
+            text = element["text"].strip()
+            kind = _heading_kind(element)
+            if kind is not None:
+                flush()
+                heading = text.rstrip(":").strip()
+                if kind == "section":
+                    section, subsection = heading, ""
+                    section_service = service = detect_service(heading) or default_service
+                else:
+                    subsection = heading
+                    service = detect_service(heading) or section_service
+                continue
+            tiered = _split_by_tier(text)
+            if tiered:
+                for tier, piece in tiered:
+                    emit(piece, tier)
+                continue
+            if body and sum(len(part) + 1 for part in body) + len(text) > chunk_size:
+                flush()
+            body.append(text)
+        flush()
+    return chunks
@@ -0,0 +1,117 @@
+"""
+Índice de mensajes ya vistos para que /webhook sea idempotente.
+
+Evolution reenvía eventos cuando el webhook tarda y además el registro se suscribe a
+MESSAGES_UPSERT y MESSAGES_UPDATE, así que el mismo mensaje de WhatsApp puede llegar
+varias veces. Cada mensaje se identifica por (remoteJid, key.id); si ya se vio dentro
+del TTL se descarta antes de encolar nada.
+
+El índice es acotado (máximo de entradas, se expulsan las más antiguas) y, si
+DEDUP_STATE_PATH está definido, se carga al iniciar y se guarda al salir (atexit; webhook.py
+convierte SIGTERM en una salida normal) para que la deduplicación sobreviva reinicios.
+
+Variables de entorno:
+- DEDUP_TTL_SECONDS   (default 86400)
+- DEDUP_MAX_ENTRIES   (default 50000)
+- DEDUP_STATE_PATH    (vacío = sin persistencia)
+"""
+
+import atexit
+import json
+import os
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from metrics import Gauge, REGISTRY
+
+DEDUP_TTL_SECONDS = float(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+DEDUP_MAX_ENTRIES = int(os.getenv("DEDUP_MAX_ENTRIES", "50000"))
+DEDUP_STATE_PATH = os.getenv("DEDUP_STATE_PATH", "").strip()
+
+
+class SeenMessages:
+    """Conjunto con TTL de (remoteJid, id) en orden de llegada; O(1) por consulta."""
+
+    def __init__(self, ttl_seconds: float = DEDUP_TTL_SECONDS, max_entries: int = DEDUP_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # Se usa time.time() (y no monotonic) para que las marcas sigan valiendo tras un reinicio
+        self._entries: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._lock = Lock()
+        self.duplicates = 0
+        self.evicted = 0
+
+    def _expire(self, now: float) -> None:
+        while self._entries:
+            key, seen_at = next(iter(self._entries.items()))
+            if now - seen_at < self.ttl_seconds:
+                break
+            self._entries.popitem(last=False)
+
+    def check_and_add(self, remote_jid: str, message_id: str) -> bool:
+        """True si el mensaje es nuevo (y queda registrado); False si es un duplicado."""
+        if not message_id:
+            return True
+        key = (remote_jid or "", message_id)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if key in self._entries:
+                self.duplicates += 1
+                return False
+            self._entries[key] = now
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+        return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "duplicates_dropped": self.duplicates,
+                "evicted": self.evicted,
+                "ttl_seconds": self.ttl_seconds,
+                "max_entries": self.max_entries,
+            }
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            self._expire(time.time())
+            entries = [[jid, msg_id, ts] for (jid, msg_id), ts in self._entries.items()]
+        tmp_path = f"{path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "entries": entries}, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path: str) -> int:
+        """Carga un índice guardado; devuelve cuántas entradas vigentes se recuperaron."""
+        if not os.path.exists(path):
+            return 0
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        now = time.time()
+        with self._lock:
+            for jid, msg_id, ts in sorted(data.get("entries", []), key=lambda e: e[2]):
+                if now - ts < self.ttl_seconds:
+                    self._entries[(jid, msg_id)] = ts
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return len(self._entries)
+
+
+SEEN_MESSAGES = SeenMessages()
+REGISTRY.register(Gauge("chatbot_dedup_entries", "Mensajes en el índice de deduplicación")).set_function(
+    lambda: len(SEEN_MESSAGES))
+
+if DEDUP_STATE_PATH:
+    try:
+        SEEN_MESSAGES.load(DEDUP_STATE_PATH)
+    except (OSError, ValueError) as err:
+        print("[DEDUP] No se pudo cargar el índice:", err)
+    atexit.register(SEEN_MESSAGES.save, DEDUP_STATE_PATH)
@@ -0,0 +1,240 @@
+"""
+Evaluación por lotes de la recuperación y de las respuestas RAG contra un golden set.
+
+Se corre desde main.py:
+    python main.py --eval benchmarks/golden_set.jsonl --out eval_a.json
+    python main.py --eval benchmarks/golden_set.jsonl --k 6 --retrieval-only --out eval_b.json
+    python main.py --eval benchmarks/golden_set.jsonl --fake-llm       (respuestas del LLM falso: solo latencia)
+    python main.py --compare eval_a.json eval_b.json
+
+Golden set (JSONL o YAML con una lista), un caso por pregunta:
+    {"id": "hv_precio", "question": "¿Cuánto cuesta la optimización de hoja de vida?",
+     "expected_chunks": ["OPTIMIZACIÓN DE HOJA DE VIDA"], "expected_sources": ["Portafolio"],
+     "key_facts": ["50.000"]}
+
+- expected_chunks: textos que debe contener algún fragmento recuperado (recall@k y MRR).
+  Si no hay, se usa expected_sources contra el nombre del archivo de origen.
+- key_facts: datos que la respuesta debe mencionar (cobertura de hechos clave).
+- tier: nivel del usuario para la recuperación de producción (opcional, default tactico).
+
+La recuperación se puntúa dos veces: la búsqueda por similitud simple (recall_at_k, mrr) y la
+que hace el bot en producción (production_recall_at_k, production_mrr): si la pregunta nombra
+servicios del menú, la búsqueda filtrada por servicio y nivel de la elección de servicio, con
+el retriever RAG como respaldo; si no, el retriever RAG.
+Las comparaciones ignoran mayúsculas y tildes.
+
+Las preguntas corren en paralelo; cada una se evalúa sin historial. La latencia por etapa
+(rag.retrieve, rag.rephrase, rag.generate) sale del mismo acumulador de turno que usa el webhook.
+"""
+
+import json
+import os
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import METRICS_HANDLER, turn
+
+# Métricas del resumen que `compare` marca como regresión si bajan
+_HIGHER_IS_BETTER = ("recall_at_k", "mrr", "production_recall_at_k", "production_mrr", "key_fact_coverage")
+
+
+def _fold(text: str) -> str:
+    return "".join(ch for ch in unicodedata.normalize("NFD", text or "") if not unicodedata.combining(ch)).lower()
+
+
+def load_golden_set(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("Para leer un golden set YAML instala PyYAML (o usa JSONL)")
+            cases = yaml.safe_load(f) or []
+        else:
+            cases = [json.loads(line) for line in f if line.strip()]
+    if not cases:
+        raise SystemExit(f"{path}: el golden set está vacío, no hay preguntas que evaluar")
+    for i, case in enumerate(cases):
+        case.setdefault("id", f"q{i + 1}")
+    return cases
+
+
+def _is_relevant(doc, case: dict) -> bool:
+    content = _fold(doc.page_content)
+    expected = case.get("expected_chunks") or []
+    if expected:
+        return any(_fold(text) in content for text in expected)
+    source = _fold(os.path.basename(doc.metadata.get("source", "")))
+    return any(_fold(name) in source for name in case.get("expected_sources") or [])
+
+
+def _retrieval_scores(docs: list, case: dict) -> dict:
+    ranks = [rank for rank, doc in enumerate(docs, start=1) if _is_relevant(doc, case)]
+    expected = case.get("expected_chunks") or []
+    if expected:
+        contents = [_fold(doc.page_content) for doc in docs]
+        found = sum(1 for text in expected if any(_fold(text) in c for c in contents))
+        recall = found / len(expected)
+    else:
+        recall = 1.0 if ranks else 0.0
+    return {"recall": recall, "reciprocal_rank": 1 / ranks[0] if ranks else 0.0, "relevant_ranks": ranks}
+
+
+def _production_docs(chatbot, case: dict) -> tuple[list, str]:
+    """Fragmentos que usaría el bot para la pregunta y qué camino los trajo (ver Chatbot._handle_service_choice)."""
+    question = case["question"]
+    selected = chatbot._parse_service_selection(question)
+    if selected:
+        try:
+            docs = chatbot._retrieve_filtered(selected, case.get("tier") or "tactico")
+        except Exception:
+            docs = None
+        if docs:
+            return docs, "filtered"
+    return chatbot.retriever.invoke(question), "retriever"
+
+
+def _evaluate_case(chatbot, case: dict, k: int, retrieval_only: bool) -> dict:
+    question = case["question"]
+    result = {"id": case["id"], "question": question}
+
+    started = time.perf_counter()
+    docs = chatbot._chains.vectorstore.similarity_search(question, k=k)
+    result["retrieve_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    result.update(_retrieval_scores(docs, case))
+    result["retrieved"] = [
+        {"source": os.path.basename(doc.metadata.get("source", "")), "section": doc.metadata.get("section", ""),
+         "preview": doc.page_content[:120]}
+        for doc in docs
+    ]
+
+    started = time.perf_counter()
+    production_docs, path = _production_docs(chatbot, case)
+    result["retrieve_production_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    production = _retrieval_scores(production_docs, case)
+    result["production"] = {"path": path, "documents": len(production_docs), **production}
+    if retrieval_only:
+        return result
+
+    with turn() as stats:
+        started = time.perf_counter()
+        try:
+            response = chatbot.rag_chain.invoke(
+                {"input": question, "chat_history": [], "user_name": ""}, config={"callbacks": [METRICS_HANDLER]})
+            answer = response.get("answer") or ""
+            result["error"] = None
+        except Exception as e:
+            answer = ""
+            result["error"] = str(e)
+        result["answer_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    facts = case.get("key_facts") or []
+    covered = [fact for fact in facts if _fold(fact) in _fold(answer)]
+    result["key_fact_coverage"] = len(covered) / len(facts) if facts else None
+    result["missing_facts"] = [fact for fact in facts if fact not in covered]
+    result["answer"] = answer
+    result.update(stats.as_dict())
+    return result
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    return {"p50_ms": pick(50), "p95_ms": pick(95), "max_ms": ordered[-1]}
+
+
+def _mean(values: list) -> float | None:
+    values = [v for v in values if v is not None]
+    return round(sum(values) / len(values), 4) if values else None
+
+
+def summarize(results: list[dict]) -> dict:
+    if not results:
+        raise ValueError("no hay resultados que resumir: el golden set está vacío")
+    stage_samples: dict[str, list[float]] = {
+        "retrieve": [r["retrieve_ms"] for r in results],
+        "retrieve_production": [r["retrieve_production_ms"] for r in results],
+    }
+    for r in results:
+        if "answer_ms" in r:
+            stage_samples.setdefault("answer", []).append(r["answer_ms"])
+        for stage, ms in (r.get("stages_ms") or {}).items():
+            stage_samples.setdefault(stage, []).append(ms)
+    return {
+        "questions": len(results),
+        "recall_at_k": _mean([r["recall"] for r in results]),
+        "mrr": _mean([r["reciprocal_rank"] for r in results]),
+        "production_recall_at_k": _mean([r["production"]["recall"] for r in results]),
+        "production_mrr": _mean([r["production"]["reciprocal_rank"] for r in results]),
+        "production_filtered": sum(1 for r in results if r["production"]["path"] == "filtered"),
+        "key_fact_coverage": _mean([r.get("key_fact_coverage") for r in results]),
+        "answer_errors": sum(1 for r in results if r.get("error")),
+        "tokens_in": sum(r.get("tokens_in", 0) for r in results),
+        "tokens_out": sum(r.get("tokens_out", 0) for r in results),
+        "latency": {stage: _percentiles(samples) for stage, samples in stage_samples.items()},
+    }
+
+
+def run_eval(chatbot, golden_path: str, k: int, workers: int = 4, retrieval_only: bool = False,
+             out_path: str | None = None, config: dict | None = None) -> dict:
+    cases = load_golden_set(golden_path)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="eval") as pool:
+        results = list(pool.map(lambda case: _evaluate_case(chatbot, case, k, retrieval_only), cases))
+    report = {
+        "golden_set": golden_path,
+        "config": dict(config or {}, k=k, retrieval_only=retrieval_only, workers=workers),
+        "seconds": round(time.perf_counter() - started, 2),
+        "summary": summarize(results),
+        "results": results,
+    }
+    print_summary(report)
+    if out_path:
+        with open(out_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Resultados guardados en {out_path}")
+    return report
+
+
+def print_summary(report: dict) -> None:
+    summary = report["summary"]
+    if not summary.get("questions"):
+        raise ValueError("reporte sin preguntas: el golden set está vacío")
+    print(f"\n=== Evaluación: {summary['questions']} preguntas, k={report['config']['k']} ({report['seconds']} s) ===")
+    print(f"recall@k: {summary['recall_at_k']}   MRR: {summary['mrr']}   "
+          f"cobertura de hechos clave: {summary['key_fact_coverage']}   errores: {summary['answer_errors']}")
+    print(f"producción: recall@k {summary['production_recall_at_k']}   MRR {summary['production_mrr']}   "
+          f"(búsqueda filtrada en {summary['production_filtered']} de {summary['questions']})")
+    for stage, stats in summary["latency"].items():
+        print(f"  {stage:<20} p50 {stats['p50_ms']:>8.1f} ms   p95 {stats['p95_ms']:>8.1f} ms   max {stats['max_ms']:>8.1f} ms")
+    for r in report["results"]:
+        if r["recall"] < 1.0 or r.get("missing_facts"):
+            print(f"  [{r['id']}] recall {r['recall']:.2f}  rango {r['relevant_ranks'] or '-'}  faltan: {r.get('missing_facts') or '-'}")
+
+
+def compare(path_a: str, path_b: str) -> int:
+    """Imprime las diferencias del resumen entre dos corridas; devuelve 1 si b empeora a."""
+    with open(path_a, encoding="utf-8") as f:
+        a = json.load(f)["summary"]
+    with open(path_b, encoding="utf-8") as f:
+        b = json.load(f)["summary"]
+    regressions = []
+    print(f"\n=== {path_a} -> {path_b} ===")
+    for name in _HIGHER_IS_BETTER:
+        before, after = a.get(name), b.get(name)
+        if before is None or after is None:
+            continue
+        print(f"  {name:<24} {before:>8.4f} -> {after:>8.4f}  ({after - before:+.4f})")
+        if after < before:
+            regressions.append(name)
+    for stage in sorted(set(a["latency"]) & set(b["latency"])):
+        before, after = a["latency"][stage]["p95_ms"], b["latency"][stage]["p95_ms"]
+        print(f"  p95 {stage:<14} {before:>8.1f} -> {after:>8.1f} ms  ({after - before:+.1f})")
+    if regressions:
+        print("Regresiones: " + ", ".join(regressions))
+    return 1 if regressions else 0
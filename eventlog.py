@@ -0,0 +1,171 @@
+"""
+Log estructurado de eventos en JSONL, no bloqueante.
+
+Los hilos del webhook y de los workers sólo encolan un dict; un hilo escritor
+en background serializa por lotes, rota el archivo por tamaño y opcionalmente
+replica una línea compacta en stdout. Si la cola se llena, los eventos se
+descartan y se cuentan (nunca se bloquea el camino caliente).
+
+Cada turno procesado genera un evento `turn` con remitente, transición de
+estado, tiempos por etapa y tokens; esos registros sirven para depurar y como
+entrada del benchmark de replay (benchmarks/replay.py).
+
+Variables de entorno:
+- EVENT_LOG_PATH        (default logs/events.jsonl)
+- EVENT_LOG_LEVEL       (DEBUG, INFO, WARNING, ERROR; default INFO)
+- EVENT_LOG_MAX_BYTES   (rotación por tamaño, default 50 MB)
+- EVENT_LOG_BACKUPS     (archivos rotados a conservar, default 5)
+- EVENT_LOG_QUEUE_SIZE  (default 10000)
+- EVENT_LOG_STDOUT      (true/false, default false)
+"""
+
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+from metrics import REGISTRY, Gauge
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+EVENT_LOG_PATH = os.getenv("EVENT_LOG_PATH", os.path.join("logs", "events.jsonl"))
+EVENT_LOG_LEVEL = os.getenv("EVENT_LOG_LEVEL", "INFO").strip().upper()
+EVENT_LOG_MAX_BYTES = int(os.getenv("EVENT_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+EVENT_LOG_BACKUPS = int(os.getenv("EVENT_LOG_BACKUPS", "5"))
+EVENT_LOG_QUEUE_SIZE = int(os.getenv("EVENT_LOG_QUEUE_SIZE", "10000"))
+EVENT_LOG_STDOUT = os.getenv("EVENT_LOG_STDOUT", "false").strip().lower() in ("1", "true", "yes")
+
+_BATCH_SIZE = 500
+
+
+class EventLog:
+    """Escritor JSONL en background con niveles, rotación por tamaño y cola acotada."""
+
+    def __init__(self, path: str, level: str = "INFO", max_bytes: int = EVENT_LOG_MAX_BYTES,
+                 backups: int = EVENT_LOG_BACKUPS, queue_size: int = EVENT_LOG_QUEUE_SIZE,
+                 echo: bool = False):
+        self.path = path
+        self.threshold = LEVELS.get(level, LEVELS["INFO"])
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.echo = echo
+        self.dropped = 0
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: threading.Thread | None = None
+        self._start_lock = threading.Lock()
+        self._file = None
+
+    def enabled_for(self, level: str) -> bool:
+        return LEVELS.get(level, 0) >= self.threshold
+
+    def log(self, level: str, event: str, **fields) -> None:
+        if LEVELS.get(level, 0) < self.threshold:
+            return
+        record = {"ts": round(time.time(), 3), "level": level, "event": event}
+        record.update(fields)
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Espera a que el escritor vacíe la cola (útil en benchmarks y al apagar)."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="eventlog-writer", daemon=True)
+                self._thread.start()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _rotate(self) -> None:
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._open()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < _BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                print("[EVENTLOG] ERROR escribiendo eventos:", e, file=sys.stderr)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+    def _write(self, batch: list) -> None:
+        if self._file is None:
+            self._open()
+        lines = []
+        for record in batch:
+            if isinstance(record, threading.Event):
+                continue
+            lines.append(json.dumps(record, ensure_ascii=False, default=str))
+            if self.echo:
+                extra = " ".join(f"{k}={v}" for k, v in record.items() if k not in ("ts", "level", "event"))
+                print(f"[{record['event']}] {extra}")
+        if not lines:
+            return
+        self._file.write("\n".join(lines) + "\n")
+        self._file.flush()
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+
+EVENT_LOG = EventLog(EVENT_LOG_PATH, EVENT_LOG_LEVEL, echo=EVENT_LOG_STDOUT)
+atexit.register(EVENT_LOG.flush, 2.0)
+
+_DROPPED = REGISTRY.register(Gauge(
+    "chatbot_event_log_dropped", "Eventos descartados por cola llena en el log estructurado"))
+_DROPPED.set_function(lambda: EVENT_LOG.dropped)
+
+
+def log_event(event: str, level: str = "INFO", **fields) -> None:
+    EVENT_LOG.log(level, event, **fields)
+
+
+def debug(event: str, **fields) -> None:
+    EVENT_LOG.log("DEBUG", event, **fields)
+
+
+def info(event: str, **fields) -> None:
+    EVENT_LOG.log("INFO", event, **fields)
+
+
+def warning(event: str, **fields) -> None:
+    EVENT_LOG.log("WARNING", event, **fields)
+
+
+def error(event: str, **fields) -> None:
+    EVENT_LOG.log("ERROR", event, **fields)
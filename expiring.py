@@ -0,0 +1,116 @@
+"""
+Almacén thread-safe de claves con vencimiento (pausas por intervención humana y bloqueos).
+
+- `kind(key)` es una sola consulta O(1) a un dict: devuelve el tipo de retención vigente
+  ("paused", "blocked", ...) o None. Una entrada vencida se trata como ausente aunque el
+  barrido todavía no la haya borrado.
+- Los vencimientos se calculan con time.monotonic(); la hora de pared solo se guarda para
+  mostrarla en los listados.
+- Un hilo de barrido (daemon, se inicia con la primera entrada) duerme hasta el próximo
+  vencimiento de un min-heap, borra la entrada y llama a `on_expire(key, kind)`.
+- Los listados por tipo recorren solo las entradas de ese tipo.
+"""
+
+import heapq
+import time
+from itertools import count as _counter
+from threading import Condition, Thread
+
+
+class _Entry:
+    __slots__ = ("kind", "expires_at", "started_wall", "seq")
+
+    def __init__(self, kind: str, expires_at: float, started_wall: float, seq: int):
+        self.kind = kind
+        self.expires_at = expires_at
+        self.started_wall = started_wall
+        self.seq = seq
+
+
+class ExpiringStore:
+    """Una retención vigente por clave (la última reemplaza a la anterior), con barrido por heap."""
+
+    def __init__(self, on_expire=None):
+        self._entries: dict[str, _Entry] = {}
+        self._by_kind: dict[str, dict[str, _Entry]] = {}
+        self._heap: list[tuple[float, int, str]] = []
+        self._seq = _counter()
+        self._cond = Condition()
+        self._on_expire = on_expire
+        self._sweeper: Thread | None = None
+
+    def set(self, key: str, kind: str, ttl_seconds: float) -> None:
+        now = time.monotonic()
+        with self._cond:
+            self._remove_locked(key)
+            entry = _Entry(kind, now + ttl_seconds, time.time(), next(self._seq))
+            self._entries[key] = entry
+            self._by_kind.setdefault(kind, {})[key] = entry
+            heapq.heappush(self._heap, (entry.expires_at, entry.seq, key))
+            if self._sweeper is None:
+                self._sweeper = Thread(target=self._sweep, name="expiring-sweeper", daemon=True)
+                self._sweeper.start()
+            self._cond.notify()
+
+    def kind(self, key: str) -> str | None:
+        """Tipo de la retención vigente de la clave, o None (sin lock: lectura atómica del dict)."""
+        entry = self._entries.get(key)
+        if entry is None or entry.expires_at <= time.monotonic():
+            return None
+        return entry.kind
+
+    def discard(self, key: str, kind: str | None = None) -> bool:
+        """Quita la retención de la clave (solo si es de `kind`, cuando se indica)."""
+        with self._cond:
+            entry = self._entries.get(key)
+            if entry is None or (kind is not None and entry.kind != kind):
+                return False
+            self._remove_locked(key)
+            return True
+
+    def clear(self, kind: str) -> int:
+        with self._cond:
+            keys = list(self._by_kind.get(kind, ()))
+            for key in keys:
+                self._remove_locked(key)
+            return len(keys)
+
+    def items(self, kind: str) -> list[tuple[str, float, float]]:
+        """[(clave, inicio en hora de pared, segundos restantes)] de las retenciones vigentes de `kind`."""
+        now = time.monotonic()
+        with self._cond:
+            entries = list(self._by_kind.get(kind, {}).items())
+        return [(key, e.started_wall, e.expires_at - now) for key, e in entries if e.expires_at > now]
+
+    def count(self, kind: str) -> int:
+        return len(self._by_kind.get(kind, ()))
+
+    def _remove_locked(self, key: str) -> _Entry | None:
+        # La tupla del heap queda huérfana; el barrido la descarta al comparar `seq`
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._by_kind[entry.kind].pop(key, None)
+        return entry
+
+    def _sweep(self) -> None:
+        while True:
+            expired = []
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                expires_at, seq, key = self._heap[0]
+                delay = expires_at - time.monotonic()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                entry = self._entries.get(key)
+                if entry is not None and entry.seq == seq:
+                    self._remove_locked(key)
+                    expired.append((key, entry.kind))
+            for key, kind in expired:
+                if self._on_expire is not None:
+                    try:
+                        self._on_expire(key, kind)
+                    except Exception:
+                        pass
@@ -0,0 +1,223 @@
+"""
+Analítica del embudo de conversación, calculada en O(1) por turno.
+
+Chatbot avisa cada cambio de ConversationState (setter de `state`) y los hitos del
+embudo (nivel clasificado, servicio elegido, pasos de pago); el webhook avisa traspasos a
+humano, bloqueos y pausas. Con eso se mantienen contadores incrementales, sin recorrer las
+sesiones de ningún tenant:
+- sesiones por estado actual (se suma y resta en cada transición)
+- sesiones que alcanzaron cada etapa del embudo (una vez por sesión)
+- transiciones origen -> destino
+- histograma del tiempo que una sesión pasa en cada estado
+- distribución por nivel de cargo y conteo de eventos
+
+GET /funnel devuelve el resumen. Si FUNNEL_SNAPSHOT_PATH está definido, se agrega una línea
+JSON con el resumen cada FUNNEL_SNAPSHOT_SECONDS y al salir, para ver la evolución en el tiempo.
+
+Variables de entorno:
+- FUNNEL_SNAPSHOT_PATH     (archivo JSONL; vacío = sin snapshots)
+- FUNNEL_SNAPSHOT_SECONDS  (default 300)
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from datetime import datetime, timezone
+
+from metrics import Counter, Gauge, Histogram, REGISTRY
+
+FUNNEL_SNAPSHOT_PATH = os.getenv("FUNNEL_SNAPSHOT_PATH", "").strip()
+FUNNEL_SNAPSHOT_SECONDS = float(os.getenv("FUNNEL_SNAPSHOT_SECONDS", "300"))
+
+# Una conversación de WhatsApp se mide en minutos u horas, no en milisegundos
+TIME_IN_STATE_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1800, 3600, 4 * 3600, 24 * 3600)
+
+# Etapas en orden; cada una se alcanza al entrar a un estado o con un evento
+STAGES = ("started", "greeted", "named", "classified", "service_chosen", "payment_confirmed")
+_STAGE_BY_STATE = {
+    "AWAITING_NAME_CITY": "greeted",
+    "AWAITING_ROLE_INPUT": "named",
+    "AWAITING_SERVICE_CHOICE": "classified",
+}
+_STAGE_BY_EVENT = {
+    "service_chosen": "service_chosen",
+    "payment_confirmed": "payment_confirmed",
+}
+_STAGE_BIT = {stage: 1 << i for i, stage in enumerate(STAGES)}
+
+FUNNEL_SESSIONS = REGISTRY.register(Gauge(
+    "chatbot_funnel_sessions", "Sesiones en memoria por estado de la conversación", ("state",)))
+FUNNEL_STAGE_REACHED = REGISTRY.register(Counter(
+    "chatbot_funnel_stage_reached_total", "Sesiones que alcanzaron cada etapa del embudo", ("stage",)))
+FUNNEL_TRANSITIONS = REGISTRY.register(Counter(
+    "chatbot_funnel_transitions_total", "Transiciones entre estados de la conversación", ("from_state", "to_state")))
+FUNNEL_TIME_IN_STATE = REGISTRY.register(Histogram(
+    "chatbot_funnel_time_in_state_seconds", "Tiempo en un estado antes de pasar al siguiente", ("state",),
+    buckets=TIME_IN_STATE_BUCKETS))
+FUNNEL_EVENTS = REGISTRY.register(Counter(
+    "chatbot_funnel_events_total", "Eventos del embudo (traspasos, bloqueos, pasos de pago)", ("event",)))
+FUNNEL_TIERS = REGISTRY.register(Counter(
+    "chatbot_funnel_tiers_total", "Usuarios clasificados por nivel de cargo", ("tier",)))
+
+
+class _Durations:
+    """Conteo, suma y cubetas del tiempo en un estado (para percentiles aproximados)."""
+
+    __slots__ = ("count", "total", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(TIME_IN_STATE_BUCKETS) + 1)
+
+    def add(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect_left(TIME_IN_STATE_BUCKETS, seconds)] += 1
+
+    def quantile(self, q: float) -> float | None:
+        """Límite superior de la cubeta que contiene el cuantil q (None si cae en la última)."""
+        target, seen = q * self.count, 0
+        for bound, n in zip(TIME_IN_STATE_BUCKETS, self.buckets):
+            seen += n
+            if seen >= target:
+                return float(bound)
+        return None
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_seconds": round(self.total / self.count, 1) if self.count else None,
+            "p50_seconds_le": self.quantile(0.5),
+            "p90_seconds_le": self.quantile(0.9),
+        }
+
+
+class FunnelStats:
+    """Contadores incrementales del embudo; cada operación es O(1)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._since = time.time()
+        self._current: _Tally = _Tally()
+        self._reached: _Tally = _Tally()
+        self._transitions: _Tally = _Tally()
+        self._durations: dict[str, _Durations] = {}
+        self._tiers: _Tally = _Tally()
+        self._events: _Tally = _Tally()
+
+    def session_started(self, state: str) -> int:
+        """Nueva sesión en `state`; devuelve la máscara de etapas alcanzadas que guarda la sesión."""
+        with self._lock:
+            self._current[state] += 1
+        FUNNEL_SESSIONS.inc(state=state)
+        return self._reach("started", 0)
+
+    def transition(self, old: str, new: str, seconds: float, reached: int) -> int:
+        """La sesión pasó de `old` a `new` tras `seconds` en `old`; devuelve la máscara actualizada."""
+        with self._lock:
+            self._current[old] -= 1
+            self._current[new] += 1
+            self._transitions[(old, new)] += 1
+            durations = self._durations.get(old)
+            if durations is None:
+                durations = self._durations[old] = _Durations()
+            durations.add(seconds)
+        FUNNEL_SESSIONS.dec(state=old)
+        FUNNEL_SESSIONS.inc(state=new)
+        FUNNEL_TRANSITIONS.inc(from_state=old, to_state=new)
+        FUNNEL_TIME_IN_STATE.observe(seconds, state=old)
+        stage = _STAGE_BY_STATE.get(new)
+        return self._reach(stage, reached) if stage else reached
+
+    def event(self, name: str, reached: int = 0) -> int:
+        """Cuenta un evento; si es un hito del embudo lo marca en la máscara de la sesión."""
+        with self._lock:
+            self._events[name] += 1
+        FUNNEL_EVENTS.inc(event=name)
+        stage = _STAGE_BY_EVENT.get(name)
+        return self._reach(stage, reached) if stage else reached
+
+    def tier(self, tier: str) -> None:
+        with self._lock:
+            self._tiers[tier] += 1
+        FUNNEL_TIERS.inc(tier=tier)
+
+    def sessions_removed(self, states) -> None:
+        """Descuenta sesiones descartadas (p. ej. DELETE /sessions) de los estados actuales."""
+        removed = _Tally(states)
+        with self._lock:
+            self._current.subtract(removed)
+        for state, n in removed.items():
+            FUNNEL_SESSIONS.dec(n, state=state)
+
+    def _reach(self, stage: str, reached: int) -> int:
+        bit = _STAGE_BIT[stage]
+        if reached & bit:
+            return reached
+        with self._lock:
+            self._reached[stage] += 1
+        FUNNEL_STAGE_REACHED.inc(stage=stage)
+        return reached | bit
+
+    def summary(self) -> dict:
+        with self._lock:
+            current = {state: n for state, n in self._current.items() if n}
+            reached = dict(self._reached)
+            transitions = {f"{old}->{new}": n for (old, new), n in self._transitions.items()}
+            durations = {state: d.as_dict() for state, d in self._durations.items()}
+            tiers = dict(self._tiers)
+            events = dict(self._events)
+        started = reached.get("started", 0)
+        stages, previous = [], None
+        for stage in STAGES:
+            n = reached.get(stage, 0)
+            stages.append({
+                "stage": stage,
+                "sessions": n,
+                "from_previous": round(n / previous, 4) if previous else None,
+                "from_start": round(n / started, 4) if started else None,
+            })
+            previous = n
+        return {
+            "since": datetime.fromtimestamp(self._since, timezone.utc).isoformat(),
+            "sessions_by_state": current,
+            "stages": stages,
+            "transitions": transitions,
+            "time_in_state": durations,
+            "tiers": tiers,
+            "events": events,
+        }
+
+    def append_snapshot(self, path: str) -> None:
+        """Agrega el resumen actual como una línea JSON a `path`."""
+        record = {"ts": datetime.now(timezone.utc).isoformat(), **self.summary()}
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+FUNNEL = FunnelStats()
+
+
+def _snapshot(path: str) -> None:
+    try:
+        FUNNEL.append_snapshot(path)
+    except OSError as err:
+        print("[FUNNEL] No se pudo guardar el snapshot:", err)
+
+
+def _snapshot_loop(path: str, interval: float, stop: threading.Event) -> None:
+    while not stop.wait(interval):
+        _snapshot(path)
+
+
+if FUNNEL_SNAPSHOT_PATH and FUNNEL_SNAPSHOT_SECONDS > 0:
+    _stop_snapshots = threading.Event()
+    threading.Thread(target=_snapshot_loop, args=(FUNNEL_SNAPSHOT_PATH, FUNNEL_SNAPSHOT_SECONDS, _stop_snapshots),
+                     name="funnel-snapshots", daemon=True).start()
+    atexit.register(_snapshot, FUNNEL_SNAPSHOT_PATH)
+    atexit.register(_stop_snapshots.set)
@@ -0,0 +1,135 @@
+"""
+Tipos de índice FAISS configurables para el vectorstore.
+
+- flat    búsqueda exacta (IndexFlatL2), el default; el costo crece lineal con el corpus.
+- hnsw    grafo HNSW (IndexHNSWFlat): aproximado, sin entrenamiento, más memoria por vector.
+- ivf_sq  IVF con cuantización escalar de 8 bits (IndexIVFScalarQuantizer): ~4x menos memoria.
+- ivf_pq  IVF con cuantización de producto (IndexIVFPQ): la opción más compacta.
+
+Los IVF necesitan entrenarse con suficientes vectores; con un corpus chico (como los
+documentos de hoy) se construye flat y se deja constancia en la metadata. El tipo y los
+parámetros quedan en vectorstore/index_meta.json y al cargar se aplican los parámetros de
+búsqueda (nprobe, efSearch); las variables de entorno de búsqueda tienen prioridad.
+
+Variables de entorno:
+- INDEX_TYPE            (flat, hnsw, ivf_sq, ivf_pq; default flat)
+- HNSW_M                (default 32)
+- HNSW_EF_CONSTRUCTION  (default 40)
+- HNSW_EF_SEARCH        (default 64)
+- IVF_NLIST             (listas; default 4*sqrt(n), acotado por los vectores de entrenamiento)
+- IVF_NPROBE            (listas visitadas por búsqueda, default 8)
+- PQ_M                  (subcuantizadores de IVF-PQ, default 16; debe dividir la dimensión)
+"""
+
+import json
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "hnsw", "ivf_sq", "ivf_pq")
+INDEX_META_FILENAME = "index_meta.json"
+
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat").strip().lower()
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "40"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+PQ_M = int(os.getenv("PQ_M", "16"))
+
+# FAISS sugiere ~39 vectores de entrenamiento por centroide; PQ de 8 bits además necesita 256
+_TRAIN_POINTS_PER_LIST = 39
+_MAX_TRAIN_POINTS = 200_000
+
+
+def default_params(index_type: str, n: int, dimension: int) -> dict:
+    if index_type == "hnsw":
+        return {"m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION, "ef_search": HNSW_EF_SEARCH}
+    if index_type in ("ivf_sq", "ivf_pq"):
+        # 4*sqrt(n) listas, sin pasar de las que se pueden entrenar con n vectores
+        nlist = IVF_NLIST or max(1, min(int(4 * math.sqrt(max(n, 1))), n // _TRAIN_POINTS_PER_LIST))
+        params = {"nlist": nlist, "nprobe": IVF_NPROBE}
+        if index_type == "ivf_pq":
+            m = PQ_M
+            while m > 1 and dimension % m:
+                m -= 1
+            params["pq_m"] = m
+        return params
+    return {}
+
+
+def _trainable(index_type: str, n: int, params: dict) -> bool:
+    if index_type not in ("ivf_sq", "ivf_pq"):
+        return True
+    needed = params["nlist"] * _TRAIN_POINTS_PER_LIST
+    if index_type == "ivf_pq":
+        needed = max(needed, 256 * _TRAIN_POINTS_PER_LIST)
+    return n >= needed
+
+
+def build_index(vectors: np.ndarray, index_type: str = INDEX_TYPE, params: dict | None = None):
+    """Arma y llena un índice del tipo pedido; devuelve (índice, metadata).
+
+    Si el tipo pide entrenamiento y no hay suficientes vectores se construye flat.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"INDEX_TYPE desconocido: {index_type!r} (opciones: {', '.join(INDEX_TYPES)})")
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, dimension = vectors.shape
+    params = params or default_params(index_type, n, dimension)
+    requested = index_type
+    if not _trainable(index_type, n, params):
+        index_type, params = "flat", {}
+
+    started = time.perf_counter()
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    elif index_type == "ivf_sq":
+        index = faiss.IndexIVFScalarQuantizer(faiss.IndexFlatL2(dimension), dimension, params["nlist"], faiss.ScalarQuantizer.QT_8bit)
+    elif index_type == "ivf_pq":
+        index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dimension), dimension, params["nlist"], params["pq_m"], 8)
+    else:
+        index = faiss.IndexFlatL2(dimension)
+    if not index.is_trained:
+        sample = vectors
+        if n > _MAX_TRAIN_POINTS:
+            sample = vectors[np.random.default_rng(0).choice(n, _MAX_TRAIN_POINTS, replace=False)]
+        index.train(sample)
+    index.add(vectors)
+    apply_search_params(index, params)
+
+    meta = {
+        "index_type": index_type,
+        "requested_index_type": requested,
+        "params": params,
+        "dimension": dimension,
+        "ntotal": int(index.ntotal),
+        "build_seconds": round(time.perf_counter() - started, 3),
+    }
+    return index, meta
+
+
+def apply_search_params(index, params: dict) -> None:
+    """Fija nprobe / efSearch según la metadata; IVF_NPROBE y HNSW_EF_SEARCH del entorno mandan si están."""
+    if isinstance(index, faiss.IndexIVF):
+        index.nprobe = int(os.getenv("IVF_NPROBE") or params.get("nprobe", IVF_NPROBE))
+    elif isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = int(os.getenv("HNSW_EF_SEARCH") or params.get("ef_search", HNSW_EF_SEARCH))
+
+
+def save_meta(vectorstore_path: str, meta: dict) -> None:
+    with open(os.path.join(vectorstore_path, INDEX_META_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def load_meta(vectorstore_path: str) -> dict:
+    """Metadata guardada del índice; un vectorstore anterior a este archivo es flat."""
+    try:
+        with open(os.path.join(vectorstore_path, INDEX_META_FILENAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"index_type": "flat", "params": {}}
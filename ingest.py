@@ -0,0 +1,205 @@
+"""
+Ingesta de documentos para el vectorstore FAISS.
+
+- Parseo en paralelo: cada archivo de documents/ se parsea con `unstructured` en un
+  ProcessPoolExecutor (el parseo de .docx es lo más lento de la reconstrucción).
+- Caché de texto parseado por hash del archivo en vectorstore/parsed/<sha256>.json: un
+  archivo que no cambió no se vuelve a parsear. Se guardan los elementos (texto, categoría
+  y HTML de las tablas) para poder trocear por estructura; las entradas huérfanas se borran.
+- Embeddings por lotes (EMBED_BATCH_SIZE textos por petición) con concurrencia acotada
+  (EMBED_CONCURRENCY peticiones a la vez).
+- El índice se arma con el tipo configurado en indexes.py (INDEX_TYPE) y su metadata
+  queda en vectorstore/index_meta.json.
+- Al terminar imprime cuánto tardó cada fase (parse, split, embed, index) y deja el
+  reporte en LAST_REPORT.
+
+Uso directo (reconstruye vectorstore/):
+    python ingest.py
+    python ingest.py --no-cache
+
+Variables de entorno:
+- INGEST_WORKERS     (procesos de parseo, default min(4, CPUs))
+- EMBED_BATCH_SIZE   (default 64)
+- EMBED_CONCURRENCY  (default 4)
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+# Cambia cuando cambia lo que se guarda por archivo: invalida la caché completa
+PARSER_VERSION = "elements-v1"
+PARSED_CACHE_DIRNAME = "parsed"
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+LAST_REPORT: dict = {}
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha256(PARSER_VERSION.encode("utf-8"))
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _parse_file(path: str) -> list[dict]:
+    """Corre en un proceso del pool: devuelve los elementos de `unstructured` como dicts."""
+    from unstructured.partition.auto import partition
+
+    elements = []
+    for element in partition(filename=path):
+        text = (element.text or "").strip()
+        if not text:
+            continue
+        item = {"text": text, "category": element.category}
+        html = getattr(element.metadata, "text_as_html", None)
+        if html:
+            item["html"] = html
+        elements.append(item)
+    return elements
+
+
+def _list_files(documents_path: str) -> list[str]:
+    paths = []
+    for root, _, files in os.walk(documents_path):
+        for name in files:
+            if not name.startswith((".", "~$")):
+                paths.append(os.path.join(root, name))
+    return sorted(paths)
+
+
+def load_documents(documents_path: str, cache_root: str, use_cache: bool = True) -> list[Document]:
+    """Un Document por archivo (texto unido como el modo "single" de UnstructuredFileLoader).
+
+    Los elementos parseados viajan en `metadata["elements"]` para el troceo.
+    """
+    started = time.perf_counter()
+    cache_dir = os.path.join(cache_root, PARSED_CACHE_DIRNAME)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    paths = _list_files(documents_path)
+    digests = {path: _file_digest(path) for path in paths}
+    parsed: dict[str, list[dict]] = {}
+    pending = []
+    for path in paths:
+        cache_file = os.path.join(cache_dir, digests[path] + ".json")
+        if use_cache and os.path.exists(cache_file):
+            try:
+                with open(cache_file, encoding="utf-8") as f:
+                    parsed[path] = json.load(f)
+                continue
+            except (OSError, ValueError):
+                pass
+        pending.append(path)
+
+    if len(pending) > 1 and INGEST_WORKERS > 1:
+        with ProcessPoolExecutor(max_workers=min(INGEST_WORKERS, len(pending))) as pool:
+            results = list(pool.map(_parse_file, pending))
+    else:
+        results = [_parse_file(path) for path in pending]
+    for path, elements in zip(pending, results):
+        parsed[path] = elements
+        with open(os.path.join(cache_dir, digests[path] + ".json"), "w", encoding="utf-8") as f:
+            json.dump(elements, f, ensure_ascii=False)
+
+    # Entradas de archivos que ya no existen o cambiaron
+    live = {digest + ".json" for digest in digests.values()}
+    for name in os.listdir(cache_dir):
+        if name.endswith(".json") and name not in live:
+            os.remove(os.path.join(cache_dir, name))
+
+    documents = []
+    for path in paths:
+        elements = parsed[path]
+        if not elements:
+            continue
+        documents.append(Document(
+            page_content="\n\n".join(e["text"] for e in elements),
+            metadata={"source": path, "elements": elements},
+        ))
+
+    LAST_REPORT.clear()
+    LAST_REPORT["files"] = len(paths)
+    LAST_REPORT["parsed"] = len(pending)
+    LAST_REPORT["cached"] = len(paths) - len(pending)
+    LAST_REPORT["parse_seconds"] = time.perf_counter() - started
+    return documents
+
+
+def embed_texts(embeddings, texts: list[str]) -> list[list[float]]:
+    """Embeddings en lotes de EMBED_BATCH_SIZE, con EMBED_CONCURRENCY peticiones en paralelo."""
+    batches = [texts[i:i + EMBED_BATCH_SIZE] for i in range(0, len(texts), EMBED_BATCH_SIZE)]
+    if len(batches) <= 1 or EMBED_CONCURRENCY <= 1:
+        results = [embeddings.embed_documents(batch) for batch in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(EMBED_CONCURRENCY, len(batches)), thread_name_prefix="embed") as pool:
+            results = list(pool.map(embeddings.embed_documents, batches))
+    return [vector for batch in results for vector in batch]
+
+
+def build_vector_store(chunks: list[Document], embeddings, vectorstore_path: str, split_seconds: float = 0.0):
+    """Embebe los fragmentos, arma el índice FAISS (tipo según indexes.py), lo guarda e imprime el reporte de tiempos."""
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    import indexes
+
+    texts = [chunk.page_content for chunk in chunks]
+    metadatas = [{k: v for k, v in chunk.metadata.items() if k != "elements"} for chunk in chunks]
+
+    started = time.perf_counter()
+    vectors = embed_texts(embeddings, texts)
+    embed_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index, meta = indexes.build_index(np.array(vectors, dtype="float32"))
+    ids = [uuid.uuid4().hex for _ in texts]
+    docstore = InMemoryDocstore({doc_id: Document(page_content=text, metadata=metadata)
+                                 for doc_id, text, metadata in zip(ids, texts, metadatas)})
+    vectorstore = FAISS(embeddings, index, docstore, dict(enumerate(ids)))
+    vectorstore.save_local(vectorstore_path)
+    meta.update({"parser_version": PARSER_VERSION, "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+    indexes.save_meta(vectorstore_path, meta)
+    index_seconds = time.perf_counter() - started
+
+    LAST_REPORT["chunks"] = len(chunks)
+    LAST_REPORT["split_seconds"] = split_seconds
+    LAST_REPORT["embed_seconds"] = embed_seconds
+    LAST_REPORT["embed_batches"] = -(-len(texts) // max(1, EMBED_BATCH_SIZE))
+    LAST_REPORT["index_seconds"] = index_seconds
+    LAST_REPORT["index_type"] = meta["index_type"]
+    print_report()
+    return vectorstore
+
+
+def print_report(report: dict | None = None) -> None:
+    report = LAST_REPORT if report is None else report
+    phases = [("parse", "parse_seconds"), ("split", "split_seconds"), ("embed", "embed_seconds"), ("index", "index_seconds")]
+    total = sum(report.get(key, 0.0) for _, key in phases)
+    print(f"[INGEST] {report.get('files', 0)} archivos ({report.get('parsed', 0)} parseados, "
+          f"{report.get('cached', 0)} desde caché), {report.get('chunks', 0)} fragmentos, "
+          f"{report.get('embed_batches', 0)} lotes de embeddings, índice {report.get('index_type', '-')}")
+    for name, key in phases:
+        print(f"[INGEST]   {name:<6} {report.get(key, 0.0):8.2f} s")
+    print(f"[INGEST]   {'total':<6} {total:8.2f} s")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from main import create_vector_store, load_documents as load_main_documents
+
+    parser = argparse.ArgumentParser(description="Reconstruye el vectorstore FAISS")
+    parser.add_argument("--no-cache", action="store_true", help="vuelve a parsear todos los archivos")
+    args = parser.parse_args()
+    create_vector_store(load_main_documents(use_cache=not args.no_cache))
@@ -0,0 +1,67 @@
+"""
+Listados paginados de los endpoints de administración (sesiones, pausas y bloqueos).
+
+Cada endpoint toma una copia de referencias del dict que corresponde (Tenant.sessions_snapshot,
+ExpiringStore.items) y suelta el lock enseguida: filtrar, ordenar y serializar ocurre sobre
+la copia, así get_user_bot y el barrido de retenciones no esperan a que se arme la respuesta.
+
+Paginación por cursor: las filas van ordenadas por clave (número del usuario); `after` es la
+última clave de la página anterior y la respuesta trae `next_cursor` (None en la última
+página). Las altas y bajas entre una página y otra no corren las posiciones. Cada página
+cuesta O(n log limit) sobre la copia, sin ordenar el listado completo.
+"""
+
+import heapq
+from operator import itemgetter
+
+import chunking
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def parse_limit(value: str | None, default: int = DEFAULT_LIMIT, maximum: int = MAX_LIMIT) -> int:
+    """Entero de la query (`limit`, `top`) acotado a [1, maximum]; ValueError si no es un entero."""
+    if value in (None, ""):
+        return default
+    return max(1, min(maximum, int(value)))
+
+
+def page(rows, after: str | None, limit: int) -> tuple[list, str | None]:
+    """Las `limit` filas (clave, ...) de menor clave posteriores a `after`, y el cursor siguiente."""
+    candidates = (row for row in rows if after is None or row[0] > after)
+    chosen = heapq.nsmallest(limit + 1, candidates, key=itemgetter(0))
+    if len(chosen) > limit:
+        return chosen[:limit], chosen[limit - 1][0]
+    return chosen, None
+
+
+def session_filter(states: str | None = None, tier: str | None = None,
+                   idle_min: str | None = None, idle_max: str | None = None):
+    """Predicado sobre Chatbot a partir de los parámetros de la query; ValueError si alguno no es válido.
+
+    states: nombres de ConversationState separados por coma (sin distinguir mayúsculas).
+    tier: operativo, tactico o estrategico (con o sin tilde).
+    idle_min / idle_max: segundos desde el último mensaje del usuario.
+    """
+    wanted_states = {s.strip().upper() for s in states.split(",") if s.strip()} if states else None
+    wanted_tier = None
+    if tier:
+        wanted_tier = chunking.normalize_tier(tier)
+        if wanted_tier is None:
+            raise ValueError(f"tier desconocido: {tier!r} (opciones: {', '.join(chunking.TIERS)})")
+    min_idle = float(idle_min) if idle_min else None
+    max_idle = float(idle_max) if idle_max else None
+
+    def matches(bot) -> bool:
+        if wanted_states is not None and bot.state.name not in wanted_states:
+            return False
+        if wanted_tier is not None and chunking.normalize_tier(bot.user_role) != wanted_tier:
+            return False
+        if min_idle is not None or max_idle is not None:
+            idle = bot.idle_seconds()
+            if (min_idle is not None and idle < min_idle) or (max_idle is not None and idle > max_idle):
+                return False
+        return True
+
+    return matches
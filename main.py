@@ -2,16 +2,33 @@
 
 
 
+import argparse
 import os
+import re
+import json
+import sys
+import time
+from enum import IntEnum
+from threading import Lock
 from dotenv import load_dotenv
-from langchain_community.document_loaders import DirectoryLoader, UnstructuredFileLoader
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_openai import OpenAIEmbeddings
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains import create_retrieval_chain, create_history_aware_retriever
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import AIMessage, HumanMessage
+from metrics import span, METRICS_HANDLER
+import eventlog
+import ingest
+import chunking
+import evaluation
+import indexes
+import prompts
+from prompts import PAYMENT_FORM_URL, CALENDAR_LINK, PAYMENT_ACCOUNTS
+from prefetch import PREFETCHER, PREFETCH_ENABLED, PREFETCH_ANSWERS, RETRIEVAL_COST, ANSWER_COST, SessionPrefetch
+from singleflight import SingleFlightChatOpenAI
+from funnel import FUNNEL
+from resilience import call_llm, turn_deadline, budget_exceeded, LLMUnavailable, BREAKER
 
 # Cargar variables de entorno. Asegúrate de tener un archivo .env con tu OPENAI_API_KEY
 load_dotenv(override=True)
@@ -22,62 +39,148 @@ VECTORSTORE_PATH = "vectorstore"
 CHUNK_SIZE = 800
 CHUNK_OVERLAP = 80
 OPENAI_MODEL = "gpt-4o-mini"
-PAYMENT_FORM_URL = "https://forms.gle/vBDAguF19cSaDhAK6"
-CALENDAR_LINK = "https://n9.cl/fa5tz3"
+# Timeout del cliente HTTP: acota también las llamadas que resilience.py abandona por plazo
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+# Endpoint compatible con OpenAI solo para el chat (p. ej. el LLM falso de benchmarks/harness.py); None = OpenAI
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+# Fragmentos que trae el retriever de la cadena RAG
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "4"))
+# Nombre, ciudad y bienvenida en una sola llamada estructurada (false = dos llamadas secuenciales)
+FUSED_NAME_WELCOME = os.getenv("FUSED_NAME_WELCOME", "true").strip().lower() in ("1", "true", "yes")
+
+# Catálogo del menú de servicios (número -> nombre, alias para detectar la elección)
+SERVICE_CATALOG = {
+    "1": ("Optimización de hoja de vida (formato ATS)", ("hoja de vida", "hoja", "ats", "optimización", "optimizacion", "cv")),
+    "2": ("Mejora de perfil en plataformas de empleo", ("mejora", "mejorar", "plataformas")),
+    "3": ("Preparación para entrevistas laborales", ("preparación", "preparacion")),
+    "4": ("Estrategia personalizada de búsqueda de empleo", ("estrategia", "búsqueda", "busqueda")),
+    "5": ("Simulación de entrevista con feedback", ("simulación", "simulacion")),
+    "6": ("Método X", ("metodo x", "método x")),
+    "7": ("Test EPI (Evaluación de Personalidad Integral)", ("test epi", "personalidad")),
+}
+
+# Historial por sesión: últimos N mensajes y respuestas del bot recortadas (solo se usan como contexto)
+HISTORY_MAX_MESSAGES = int(os.getenv("HISTORY_MAX_MESSAGES", "24"))
+HISTORY_MAX_AI_CHARS = int(os.getenv("HISTORY_MAX_AI_CHARS", "1200"))
+
+# Fragmentos por servicio en la recuperación filtrada por metadata (elección de servicio y Método X)
+FILTERED_RETRIEVAL_K = int(os.getenv("FILTERED_RETRIEVAL_K", "4"))
+# Candidatos por similitud que se revisan antes de aplicar el filtro (acota el costo con índices grandes)
+FILTERED_FETCH_K = int(os.getenv("FILTERED_FETCH_K", "200"))
 
 # --- Estados de Conversación ---
-class ConversationState:
-    AWAITING_GREETING = "AWAITING_GREETING"
-    AWAITING_NAME_CITY = "AWAITING_NAME_CITY"
-    AWAITING_ROLE_INPUT = "AWAITING_ROLE_INPUT"
-    AWAITING_SERVICE_CHOICE = "AWAITING_SERVICE_CHOICE"
-    AWAITING_CONTINUE_CHOICE = "AWAITING_CONTINUE_CHOICE"
-    PROVIDING_INFO = "PROVIDING_INFO"
+class ConversationState(IntEnum):
+    AWAITING_GREETING = 0
+    AWAITING_NAME_CITY = 1
+    AWAITING_ROLE_INPUT = 2
+    AWAITING_SERVICE_CHOICE = 3
+    AWAITING_CONTINUE_CHOICE = 4
+    PROVIDING_INFO = 5
 
-# --- Lógica del Chatbot ---
-class Chatbot:
-    def __init__(self, vectorstore):
-        self.state = ConversationState.AWAITING_GREETING
-        self.user_data = {}
-        self.user_data['name'] = "" # Se inicializa el nombre del usuario
-        self.chat_history = []
-        self.llm = ChatOpenAI(model_name=OPENAI_MODEL, max_tokens=500, temperature=0.1)
-        
-        system_prompt = """
-        Actuás como Xtalento Bot, un asistente profesional cálido, claro y experto que guía a personas a potenciar su perfil laboral y encontrar empleo más rápido.
-        El nombre del usuario es {user_name}. Cuando sea natural y amigable, utiliza su nombre para personalizar la conversación. Si no sabes el nombre (porque está vacío), no intentes inventarlo.
-        Importante: No utilices la palabra 'Hola' en ninguna de tus respuestas, ya que el saludo inicial ya fue dado. siempre trata de no sobrepasar los 200 tokens.
-
-        🔎 Cuando el usuario mencione un servicio, responde incluyendo:
-        - Qué incluye el servicio.
-        - Cuál es el precio para su nivel de cargo.
-        - Cómo se agenda o paga.
-
-        📌 Cuando el usuario mencione su cargo o el último empleo:
-        - Clasificalo automáticamente según la guía de cargos (operativo, táctico o estratégico).
-        - Usa esa clasificación para sugerir servicios y precios.
-
-        🎯 Siempre destacá:
-        - La mentoría virtual personalizada (45 a 60 minutos).
-        - La entrega rápida (40 a 120 minutos en optimización HV).
-        - La garantía de superar filtros ATS.
-        - El respaldo de casos reales y experiencia.
-
-        🚨 POLÍTICA DE CONOCIMIENTO ESTRICTA:
-        - SOLO habla de lo que tienes conocimiento confirmado en el contexto proporcionado (RAG).
-        - NO inventes información, servicios, precios o datos que no estén en tu base de conocimiento.
-        - Si no tienes conocimiento suficiente sobre algo que te preguntan, responde honestamente: "Actualmente no tengo conocimiento sobre esto. Si quieres comunicarte con un humano, menciona la palabra 'agente' en el chat."
-        - Si el usuario menciona "agente" en cualquier momento, conecta inmediatamente con un agente humano.
-        - Si el usuario decide seguir con el bot después de no tener información, tu objetivo principal es vender un servicio disponible en tu conocimiento y proponer agendar una sesión virtual.
-        - Usa emojis con calidez, sin perder profesionalismo. Sé concreto y con orientación clara a la acción.
-        """
-        
-        retriever = vectorstore.as_retriever()
 
-        contextualize_q_system_prompt = """Dada una conversación y una pregunta de seguimiento, reformula la pregunta de seguimiento para que sea una pregunta independiente, en su idioma original. El nombre del usuario es {user_name}. IMPORTANTE: Solo utiliza información que esté confirmada en el contexto de la conversación. Si no tienes conocimiento suficiente, indica que no tienes esa información y que el cliente se puede comunicar con un agente humano. copiando la palabra agente en el chat"""
+# Respuestas fijas del bot: una sola instancia por texto para todas las sesiones (ver _register_shared_replies)
+_SHARED_REPLIES: dict[str, str] = {}
+
+HANDOFF_REPLY = "Perfecto. Te conecto con un agente humano inmediatamente. Pauso este chat y un agente de ventas te contactará en este mismo canal."
+
+
+class SessionHistory:
+    """Historial compacto de la conversación: roles en un bytearray y textos en una lista.
+
+    Los HumanMessage/AIMessage de LangChain se crean solo al invocar una cadena (`as_messages`).
+    Las respuestas fijas del bot (plantillas, menú, traspaso) se guardan como la instancia única
+    de _SHARED_REPLIES; las del LLM se guardan tal cual (internarlas las volvería inmortales).
+    """
+
+    __slots__ = ("_roles", "_texts")
+    HUMAN, AI = 0, 1
+
+    def __init__(self):
+        self._roles = bytearray()
+        self._texts: list[str] = []
+
+    def add_user(self, text: str) -> None:
+        self._append(self.HUMAN, text or "")
+
+    def add_ai(self, text: str) -> None:
+        text = str(text or "")[:HISTORY_MAX_AI_CHARS]
+        self._append(self.AI, _SHARED_REPLIES.get(text, text))
+
+    def _append(self, role: int, text: str) -> None:
+        self._roles.append(role)
+        self._texts.append(text)
+        overflow = len(self._texts) - HISTORY_MAX_MESSAGES
+        if overflow > 0:
+            del self._roles[:overflow]
+            del self._texts[:overflow]
+
+    def as_messages(self, extra_user: str | None = None) -> list:
+        messages = [HumanMessage(content=t) if r == self.HUMAN else AIMessage(content=t)
+                    for r, t in zip(self._roles, self._texts)]
+        if extra_user is not None:
+            messages.append(HumanMessage(content=extra_user))
+        return messages
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def nbytes(self) -> int:
+        """Bytes propios (sin contar las respuestas fijas compartidas con otras sesiones)."""
+        size = sys.getsizeof(self._roles) + sys.getsizeof(self._texts)
+        for role, text in zip(self._roles, self._texts):
+            if role == self.HUMAN or _SHARED_REPLIES.get(text) is not text:
+                size += sys.getsizeof(text)
+        return size
+
+
+_shared_llm_instance: SingleFlightChatOpenAI | None = None
+_embeddings_instance: OpenAIEmbeddings | None = None
+_shared_clients_lock = Lock()
+
+
+def _shared_llm() -> SingleFlightChatOpenAI:
+    """Un solo cliente de chat (y su pool HTTP) para todos los vectorstores y tenants."""
+    global _shared_llm_instance
+    with _shared_clients_lock:
+        if _shared_llm_instance is None:
+            _shared_llm_instance = SingleFlightChatOpenAI(
+                model_name=OPENAI_MODEL, max_tokens=500, temperature=0.1, timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+                max_retries=LLM_MAX_RETRIES, base_url=LLM_BASE_URL, callbacks=[METRICS_HANDLER])
+        return _shared_llm_instance
+
+
+def _embeddings() -> OpenAIEmbeddings:
+    """Modelo de embeddings compartido por todos los vectorstores cargados."""
+    global _embeddings_instance
+    with _shared_clients_lock:
+        if _embeddings_instance is None:
+            _embeddings_instance = OpenAIEmbeddings()
+        return _embeddings_instance
+
+
+class _SharedChains:
+    """Retriever y cadenas RAG: no dependen de la sesión, así que se comparten por vectorstore.
+
+    Los mensajes de sistema van de lo estático a lo variable (ver prompts.py) para que el
+    proveedor pueda reutilizar el prefijo entre usuarios.
+    """
+
+    __slots__ = ("vectorstore", "llm", "retriever", "question_answer_chain", "rag_chain", "pricing_chain",
+                 "filtered_retrieval")
+
+    def __init__(self, vectorstore, retriever_k: int = RETRIEVER_K):
+        self.vectorstore = vectorstore
+        self.llm = _shared_llm()
+        # Sin la metadata de chunking.py la búsqueda filtrada nunca encuentra nada: se omite
+        self.filtered_retrieval = has_chunk_metadata(vectorstore)
+
+        retriever = vectorstore.as_retriever(search_kwargs={"k": retriever_k})
+        self.retriever = retriever
+
         contextualize_q_prompt = ChatPromptTemplate.from_messages(
             [
-                ("system", contextualize_q_system_prompt),
+                ("system", prompts.CONTEXTUALIZE_PROMPT),
                 MessagesPlaceholder(variable_name="chat_history"),
                 ("human", "{input}"),
             ]
@@ -86,21 +189,125 @@ class Chatbot:
             self.llm, retriever, contextualize_q_prompt
         )
 
-        qa_system_prompt = system_prompt + """
-
-        Contexto: {context}
-        Respuesta:"""
         qa_prompt = ChatPromptTemplate.from_messages(
             [
-                ("system", qa_system_prompt),
+                ("system", prompts.RAG_SYSTEM_PROMPT),
+                ("system", prompts.SESSION_TEMPLATE),
                 MessagesPlaceholder(variable_name="chat_history"),
                 ("human", "{input}"),
             ]
         )
         question_answer_chain = create_stuff_documents_chain(self.llm, qa_prompt)
+        self.question_answer_chain = question_answer_chain
 
         self.rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
 
+        # Consulta de servicios y precios: política fija + reglas de un solo nivel antes de lo variable
+        pricing_prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", prompts.RAG_SYSTEM_PROMPT),
+                ("system", prompts.PRICING_POLICY),
+                ("system", "{tier_rules}"),
+                ("system", prompts.SESSION_TEMPLATE),
+                MessagesPlaceholder(variable_name="chat_history"),
+                ("human", "{input}"),
+            ]
+        )
+        self.pricing_chain = create_stuff_documents_chain(self.llm, pricing_prompt)
+
+
+_shared_chains: dict[tuple[int, int], _SharedChains] = {}
+_shared_chains_lock = Lock()
+
+
+def _chains_for(vectorstore, retriever_k: int = RETRIEVER_K) -> _SharedChains:
+    key = (id(vectorstore), retriever_k)
+    with _shared_chains_lock:
+        chains = _shared_chains.get(key)
+        # Se compara la identidad por si el id() de un vectorstore ya liberado fue reutilizado
+        if chains is None or chains.vectorstore is not vectorstore:
+            chains = _shared_chains[key] = _SharedChains(vectorstore, retriever_k)
+        return chains
+
+
+# --- Lógica del Chatbot ---
+class Chatbot:
+    # Registro compacto por sesión: todo lo pesado (LLM, cadenas) vive en _SharedChains
+    __slots__ = ("_state", "_state_since", "_funnel", "_last_active", "user_name", "user_city", "user_role",
+                 "user_service", "chat_history", "_prefetch", "_chains")
+
+    def __init__(self, vectorstore, retriever_k: int = RETRIEVER_K):
+        self._state = ConversationState.AWAITING_GREETING
+        self._state_since = self._last_active = time.monotonic()
+        self._funnel = FUNNEL.session_started(self._state.name)
+        self.user_name = ""  # Se inicializa el nombre del usuario
+        self.user_city: str | None = None
+        self.user_role: str | None = None
+        self.user_service: str | None = None
+        self.chat_history = SessionHistory()
+        self._prefetch: SessionPrefetch | None = None
+        self._chains = _chains_for(vectorstore, retriever_k)
+
+    @property
+    def state(self) -> ConversationState:
+        return self._state
+
+    @state.setter
+    def state(self, new_state: ConversationState) -> None:
+        # Cada cambio de estado alimenta el embudo (funnel.py) sin recorrer sesiones
+        if new_state == self._state:
+            return
+        now = time.monotonic()
+        self._funnel = FUNNEL.transition(self._state.name, new_state.name, now - self._state_since, self._funnel)
+        self._state, self._state_since = new_state, now
+
+    def _funnel_event(self, name: str) -> None:
+        self._funnel = FUNNEL.event(name, self._funnel)
+
+    @property
+    def llm(self):
+        return self._chains.llm
+
+    @property
+    def retriever(self):
+        return self._chains.retriever
+
+    @property
+    def question_answer_chain(self):
+        return self._chains.question_answer_chain
+
+    @property
+    def rag_chain(self):
+        return self._chains.rag_chain
+
+    @property
+    def pricing_chain(self):
+        return self._chains.pricing_chain
+
+    def idle_seconds(self) -> float:
+        """Segundos desde el último mensaje procesado (o desde que se creó la sesión)."""
+        return time.monotonic() - self._last_active
+
+    def session_info(self) -> dict:
+        """Resumen de la sesión para los listados de administración; solo lee atributos, sin lock."""
+        now = time.monotonic()
+        return {
+            "state": self._state.name,
+            "tier": chunking.normalize_tier(self.user_role),
+            "service": self.user_service,
+            "history_messages": len(self.chat_history),
+            "state_seconds": round(now - self._state_since, 1),
+            "idle_seconds": round(now - self._last_active, 1),
+        }
+
+    def memory_bytes(self) -> int:
+        """Bytes aproximados propios de la sesión (excluye LLM y cadenas compartidas)."""
+        size = sys.getsizeof(self) + self.chat_history.nbytes()
+        for value in (self.user_name, self.user_city, self.user_role, self.user_service):
+            if value:
+                size += sys.getsizeof(value)
+        return size
+
     def _extract_role_from_text(self, text):
         """Extrae el cargo o rol laboral de un texto complejo."""
         extraction_prompt = f"""
@@ -123,7 +330,11 @@ class Chatbot:
         Texto: "{text}"
         Cargo extraído:
         """
-        response = self.llm.invoke(extraction_prompt)
+        try:
+            response = self._invoke_llm("llm.extract_role", extraction_prompt)
+        except Exception as e:
+            eventlog.warning("llm_fallback", site="llm.extract_role", error=str(e))
+            return self._guess_role(text)
         extracted_role = response.content.strip()
         
         if extracted_role.lower() in ['no_identificable', 'no identificable', '']:
@@ -136,10 +347,8 @@ class Chatbot:
         extracted_role = self._extract_role_from_text(role_description)
         
         if not extracted_role:
-            print(f"[DEBUG] No se pudo extraer un cargo del texto: {role_description}")
+            eventlog.debug("role_not_extracted", text=role_description)
             return None
-            
-        print(f"[DEBUG] Cargo extraído: '{extracted_role}' del texto: '{role_description}'")
         
         # Paso 2: Clasificar el cargo extraído
         classification_prompt_text = f"""
@@ -166,12 +375,14 @@ class Chatbot:
         Cargo a clasificar: "{extracted_role}"
 
         Respuesta (solo la palabra):"""
-        response = self.llm.invoke(classification_prompt_text)
+        try:
+            response = self._invoke_llm("llm.classify_role", classification_prompt_text)
+        except Exception as e:
+            eventlog.warning("llm_fallback", site="llm.classify_role", error=str(e))
+            return self._classify_role_by_keywords(extracted_role)
         # Aseguramos que la respuesta sea una de las tres opciones válidas
         classification_raw = response.content.strip().lower()
         
-        print(f"[DEBUG] Clasificación raw obtenida: '{classification_raw}' para cargo: '{extracted_role}'")
-        
         # Extraer la clasificación real del texto (por si el LLM agrega palabras extra)
         if 'operativo' in classification_raw:
             classification = 'operativo'
@@ -180,10 +391,10 @@ class Chatbot:
         elif 'estratégico' in classification_raw or 'estrategico' in classification_raw:
             classification = 'estratégico'
         else:
-            print(f"[DEBUG] No se pudo extraer clasificación válida de: '{classification_raw}'")
+            eventlog.debug("role_not_classified", role=extracted_role, raw=classification_raw)
             return None
         
-        print(f"[DEBUG] Clasificación final: '{classification}' para cargo: '{extracted_role}'")
+        eventlog.debug("role_classified", role=extracted_role, raw=classification_raw, tier=classification)
         return classification
 
     def _extract_name(self, name_city_text):
@@ -196,7 +407,11 @@ class Chatbot:
         Frase: "{name_city_text}"
         Nombre de pila:
         """
-        response = self.llm.invoke(extraction_prompt_text)
+        try:
+            response = self._invoke_llm("llm.extract_name", extraction_prompt_text)
+        except Exception as e:
+            eventlog.warning("llm_fallback", site="llm.extract_name", error=str(e))
+            return self._guess_name(name_city_text)
         name = response.content.strip()
         
         # Si el LLM no devuelve nada, usamos la primera palabra como fallback.
@@ -204,24 +419,250 @@ class Chatbot:
             return name_city_text.split()[0]
         return name
 
-    def _generate_response(self, prompt_text):
-        """Genera una respuesta directa del LLM para mensajes conversacionales."""
+    def _extract_name_and_welcome(self, name_city_text: str) -> dict | None:
+        """Una sola llamada que devuelve {name, city, welcome_text} validados.
+
+        Devuelve None si la respuesta no cumple el esquema (el llamador usa entonces el camino de
+        dos llamadas). Si el LLM no está disponible responde con la plantilla de bienvenida.
+        """
+        prompt_text = f"""
+        Actúas como Xtalento Bot. El usuario respondió a la pregunta por su nombre y ciudad con esta frase: "{name_city_text}"
+
+        1) name: extrae únicamente el nombre de pila. Solo si está claramente presente; si no, null.
+        2) city: la ciudad desde la que escribe; si no la menciona, null.
+        3) welcome_text: dale una bienvenida personalizada usando su nombre si lo tienes (sin usar la palabra 'Hola') y luego pregúntale sobre su cargo actual o al que aspira para poder darle una mejor asesoría. IMPORTANTE: Solo habla de servicios que tienes conocimiento confirmado. Si no sabes algo específico, di 'Actualmente no tengo conocimiento sobre esto. Si quieres comunicarte con un humano, menciona la palabra agente en el chat.'
+
+        Responde ÚNICAMENTE con un objeto JSON con las claves "name", "city" y "welcome_text".
+        """
+        site = "llm.name_welcome"
+        try:
+            with span(site):
+                response = call_llm(site, lambda: self.llm.invoke(prompt_text, response_format={"type": "json_object"}))
+        except Exception as e:
+            eventlog.warning("llm_fallback", site=site, error=str(e))
+            user_name = self._guess_name(name_city_text)
+            return {"name": user_name, "city": None, "welcome_text": self._welcome_template(user_name)}
+        fused = self._parse_name_welcome(response.content)
+        if fused is None:
+            eventlog.warning("structured_output_invalid", site=site, raw=str(response.content)[:300])
+        return fused
+
+    def _parse_name_welcome(self, raw: str) -> dict | None:
+        """Valida la salida estructurada de _extract_name_and_welcome."""
+        text = (raw or "").strip()
+        if text.startswith("```"):
+            text = re.sub(r"^```(?:json)?\s*|\s*```$", "", text)
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(data, dict):
+            return None
+        welcome_text = data.get("welcome_text")
+        if not isinstance(welcome_text, str) or len(welcome_text.strip()) < 10:
+            return None
+        fields = {}
+        for field, max_words in (("name", 3), ("city", 5)):
+            value = data.get(field)
+            if value is not None and not isinstance(value, str):
+                return None
+            value = (value or "").strip()
+            if value.lower() in ("no_identificable", "no identificable", "null", "none") or len(value.split()) > max_words:
+                value = ""
+            fields[field] = value or None
+        return {"name": fields["name"] or "", "city": fields["city"], "welcome_text": welcome_text.strip()}
+
+    def _invoke_llm(self, site: str, prompt_text: str):
+        """Llamada directa al LLM, medida, atribuida al sitio indicado y acotada por el plazo del turno."""
+        with span(site):
+            return call_llm(site, lambda: self.llm.invoke(prompt_text))
+
+    def _generate_response(self, prompt_text, site: str = "llm.generate", fallback: str | None = None):
+        """Genera una respuesta directa del LLM para mensajes conversacionales.
+
+        Si se pasa `fallback`, se devuelve esa plantilla cuando el LLM falla, vence el plazo
+        o el circuit breaker está abierto.
+        """
         # Usamos el mismo LLM pero sin el contexto de RAG
-        response = self.llm.invoke(prompt_text)
+        try:
+            response = self._invoke_llm(site, prompt_text)
+        except Exception as e:
+            if fallback is None:
+                raise
+            eventlog.warning("llm_fallback", site=site, error=str(e))
+            return fallback
         return response.content.strip()
 
-    def _safe_rag_answer(self, query_text: str) -> str:
-        """Intenta responder vía RAG; si falla, continúa la conversación con conocimiento general (LLM)."""
+    def _safe_rag_answer(self, query_text: str, context_docs: list | None = None) -> str:
+        """Intenta responder vía RAG; si falla, continúa la conversación con conocimiento general (LLM).
+
+        Si se pasan `context_docs` (p. ej. calentados por el prefetch) se omiten la reformulación
+        de la pregunta y la búsqueda en FAISS, y se genera directamente con esos documentos.
+        """
+        config = {"callbacks": [METRICS_HANDLER]}
         try:
-            response = self.rag_chain.invoke({"input": query_text, "chat_history": self.chat_history, "user_name": self.user_data.get('name', '')})
+            if context_docs:
+                with span("rag.answer_prefetched"):
+                    answer_text = call_llm("rag.answer_prefetched", lambda: self.question_answer_chain.invoke({"input": query_text, "chat_history": self.chat_history.as_messages(), "user_name": self.user_name, "context": context_docs}, config=config)) or ""
+                if not answer_text.strip():
+                    return self._build_unknown_options_message()
+                return answer_text
+            with span("rag.answer"):
+                response = call_llm("rag.answer", lambda: self.rag_chain.invoke({"input": query_text, "chat_history": self.chat_history.as_messages(), "user_name": self.user_name}, config=config))
             answer_text = response.get('answer') or ""
             if not answer_text.strip():
                 return self._build_unknown_options_message()
             return answer_text
+        except LLMUnavailable as e:
+            eventlog.warning("llm_fallback", site="rag.answer", error=str(e))
+            return self._build_unknown_options_message()
         except Exception:
             return self._build_unknown_options_message()
 
-    def _build_unknown_options_message(self) -> str:
+    def _parse_service_selection(self, user_input: str) -> list[str]:
+        """Devuelve los números de servicio (según SERVICE_CATALOG) mencionados por el usuario, en orden."""
+        text_lower = (user_input or "").lower()
+        selected = re.findall(r"(?<!\d)[1-7](?!\d)", text_lower)
+        for service_id, (_, aliases) in SERVICE_CATALOG.items():
+            if any(alias in text_lower for alias in aliases):
+                selected.append(service_id)
+        return list(dict.fromkeys(selected))
+
+    def _schedule_service_prefetch(self, tier: str) -> None:
+        """Calienta en background la recuperación de los siete servicios (y opcionalmente el Método X)."""
+        # Con el proveedor degradado no se especula: cada llamada extra empeora la recuperación
+        if not PREFETCH_ENABLED or BREAKER.is_open() or budget_exceeded():
+            return
+        prefetch = SessionPrefetch(tier)
+        for service_id in SERVICE_CATALOG:
+            future = PREFETCHER.submit(RETRIEVAL_COST, self._speculative_retrieve, service_id, tier)
+            if future is not None:
+                prefetch.docs[service_id] = future
+        if PREFETCH_ANSWERS:
+            history = self.chat_history.as_messages(extra_user="6")
+            prefetch.answer = PREFETCHER.submit(ANSWER_COST, self._speculative_metodo_x_answer, history, self.user_name)
+        self._prefetch = prefetch
+
+    def _speculative_retrieve(self, service_id: str, tier: str) -> list:
+        with span("prefetch.retrieve"):
+            return self._retrieve_filtered([service_id], tier) or self.retriever.invoke(self._service_query(service_id, tier))
+
+    def _service_query(self, service_id: str, tier: str | None) -> str:
+        service_name = SERVICE_CATALOG[service_id][0]
+        if tier:
+            return f"{service_name}: qué incluye, cómo funciona y precio para nivel {tier}"
+        return f"{service_name}: qué es, para quién aplica, beneficios y cómo funciona"
+
+    def _retrieve_filtered(self, service_ids: list[str], tier: str | None = None) -> list:
+        """Búsqueda por similitud restringida por metadata a los servicios (y nivel) indicados.
+
+        Sin `tier` solo se traen fragmentos sin precios por nivel. Devuelve [] sin buscar si el
+        índice no tiene la metadata de chunking.py (vectorstore viejo), o si nada coincide.
+        """
+        if not self._chains.filtered_retrieval:
+            return []
+        vectorstore = self._chains.vectorstore
+        tiers = [chunking.ALL_TIERS]
+        if chunking.normalize_tier(tier):
+            tiers.append(chunking.normalize_tier(tier))
+        docs, seen = [], set()
+        for service_id in service_ids:
+            found = vectorstore.similarity_search(
+                self._service_query(service_id, tier), k=FILTERED_RETRIEVAL_K, filter={"service": [service_id], "tier": tiers},
+                fetch_k=max(FILTERED_RETRIEVAL_K, min(vectorstore.index.ntotal, FILTERED_FETCH_K)))
+            for doc in found:
+                if doc.page_content not in seen:
+                    seen.add(doc.page_content)
+                    docs.append(doc)
+        return docs
+
+    def _metodo_x_docs(self) -> list | None:
+        """Fragmentos del Método X sin precios (la respuesta no debe incluirlos); None si no hay."""
+        try:
+            with span("rag.retrieve"):
+                return self._retrieve_filtered(["6"]) or None
+        except Exception as e:
+            eventlog.warning("filtered_retrieval_error", error=str(e))
+            return None
+
+    def _speculative_metodo_x_answer(self, history: list, user_name: str) -> str:
+        """Genera la respuesta del Método X tal como la produciría el turno siguiente."""
+        config = {"callbacks": [METRICS_HANDLER]}
+        with span("prefetch.answer"):
+            context_docs = self._retrieve_filtered(["6"])
+            if context_docs:
+                answer_text = self.question_answer_chain.invoke({"input": self._metodo_x_prompt(), "chat_history": history, "user_name": user_name, "context": context_docs}, config=config) or ""
+            else:
+                response = self.rag_chain.invoke({"input": self._metodo_x_prompt(), "chat_history": history, "user_name": user_name}, config=config)
+                answer_text = response.get('answer') or ""
+        if not answer_text.strip():
+            raise ValueError("respuesta especulativa vacía")
+        return answer_text
+
+    def _take_prefetch(self) -> SessionPrefetch | None:
+        """Retira el prefetch de la sesión; si expiró, lo descarta como desperdicio."""
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None and prefetch.expired():
+            PREFETCHER.record_waste(prefetch.pending_count())
+            return None
+        return prefetch
+
+    def _metodo_x_prompt(self) -> str:
+        return prompts.METODO_X_PROMPT
+
+    # --- Plantillas deterministas (cuando el LLM falla, vence el plazo o el circuit breaker está abierto) ---
+    @staticmethod
+    def _greeting_template() -> str:
+        return (
+            "¡Hola! 👋 Soy Xtalento Bot, tu asistente para potenciar tu perfil laboral y encontrar empleo más rápido. "
+            "Para darte una mejor asesoría, ¿me cuentas tu nombre y desde qué ciudad nos escribes?"
+        )
+
+    def _welcome_template(self, user_name: str) -> str:
+        greeting = f"¡Qué gusto tenerte aquí, {user_name}! 🙌" if user_name else "¡Qué gusto tenerte aquí! 🙌"
+        return (
+            f"{greeting} En Xtalento te acompañamos a destacar tu perfil profesional. "
+            "¿Cuál es tu cargo actual o el cargo al que aspiras?"
+        )
+
+    @staticmethod
+    def _service_menu_template() -> str:
+        lines = [f"{service_id}. {'*Método X* (recomendado)' if service_id == '6' else name}"
+                 for service_id, (name, _) in SERVICE_CATALOG.items()]
+        return (
+            "Gracias por tu interés en Xtalento. Ayudamos a personas como tú a potenciar su perfil profesional y conseguir trabajo más rápido 🚀\n\n"
+            "Nuestros servicios son:\n\n" + "\n".join(lines) + "\n\n"
+            "Libros y recursos en: https://xtalento.com.co\n\n"
+            "Puedes elegir uno o varios servicios escribiendo su número, o escribe 'Todos' si te interesan todos."
+        )
+
+    def _guess_name(self, name_city_text: str) -> str:
+        """Nombre de pila sin LLM: 'soy/me llamo/mi nombre es <nombre>' o la primera palabra."""
+        match = re.search(r"(?:soy|me llamo|mi nombre es)\s+([^\W\d_]+)", name_city_text or "", flags=re.IGNORECASE)
+        if match:
+            return match.group(1).capitalize()
+        words = (name_city_text or "").split()
+        return words[0] if words else ""
+
+    def _guess_role(self, text: str) -> str | None:
+        """Cargo sin LLM: el texto sin las muletillas iniciales más comunes."""
+        role = re.sub(r"^\s*(soy|trabajo como|trabajo de|fui|me desempeño como|estoy como|era)\s+", "", text or "", flags=re.IGNORECASE)
+        role = role.strip(" .!¿?")
+        return role or None
+
+    def _classify_role_by_keywords(self, role: str) -> str | None:
+        """Clasificación del cargo sin LLM, con las mismas pistas de la guía de cargos."""
+        role_lower = (role or "").lower()
+        if any(w in role_lower for w in ("ceo", "presidente", "vicepresidente", "director", "gerente general", "fundador", "vp")):
+            return 'estratégico'
+        if any(w in role_lower for w in ("coordinador", "jefe", "supervisor", "líder", "lider", "team lead", "gerente", "senior")):
+            return 'táctico'
+        if role_lower:
+            return 'operativo'
+        return None
+
+    @staticmethod
+    def _build_unknown_options_message() -> str:
         """Devuelve el mensaje estándar de opciones cuando no hay suficiente información."""
         return (
             "Actualmente no tengo conocimiento sobre esto. Si quieres comunicarte con un humano, menciona la palabra 'agente' en el chat. "
@@ -230,7 +671,36 @@ class Chatbot:
             "2) Seguir conmigo y explorar otros servicios de Xtalento que sí conozco."
         )
 
-    def _continue_conversation(self, user_text: str, guidance: str) -> str:
+    # --- Plantillas para remitentes sin presupuesto de tokens (ver budgets.py) ---
+    def _budget_template(self, user_input: str) -> str:
+        """Respuesta sin LLM: pasos de pago, menú de servicios u oferta de agente según el mensaje."""
+        if self._is_payment_related_query(user_input):
+            return self._payment_steps_template()
+        if self._parse_service_selection(user_input) or "servicio" in (user_input or "").lower():
+            return self._service_menu_template()
+        return self._budget_handoff_template()
+
+    @staticmethod
+    def _payment_steps_template() -> str:
+        return (
+            "Estos son los pasos para tomar el servicio:\n\n"
+            f"📋 Paso 1: llena el formulario {PAYMENT_FORM_URL} (es fundamental para poder seguir).\n"
+            "📄 Paso 2: si elegiste la hoja de vida, envíanos tu hoja de vida actual "
+            "(o un documento con nombres, cédula, estudios y experiencias laborales).\n"
+            f"💳 Paso 3: realiza el pago:\n{PAYMENT_ACCOUNTS}\n\n"
+            "Si quieres que un agente te confirme el precio para tu perfil, escribe 'agente'. "
+            "Confirma cuando completes el formulario (paso 1) y cuando realices el pago (paso 3)."
+        )
+
+    @staticmethod
+    def _budget_handoff_template() -> str:
+        return (
+            "Para darte una atención más completa te puedo conectar con un agente humano: escribe 'agente'. 🙌\n\n"
+            f"También puedes escribir 'ver servicios' para ver la lista de servicios o agendar tu sesión aquí: {CALENDAR_LINK}"
+        )
+
+    @staticmethod
+    def _continue_conversation(user_text: str, guidance: str) -> str:
         """Responde cuando no se detecta una respuesta válida, ofreciendo opciones claras al usuario."""
         return (
             "No se detectó una respuesta válida. "
@@ -255,7 +725,8 @@ class Chatbot:
         text_lower = user_input.lower().strip()
         return any(keyword in text_lower for keyword in scheduling_keywords)
     
-    def _provide_calendar_link(self) -> str:
+    @staticmethod
+    def _provide_calendar_link() -> str:
         """Proporciona el enlace del calendario para agendar citas."""
         return (
             f"¡Perfecto! Para agendar tu sesión personalizada, entra a nuestro calendario online:\n\n"
@@ -270,7 +741,7 @@ class Chatbot:
         
         # Opción 1: Quiere agente humano
         if any(x in text_lower for x in ["1", "uno", "agente", "humano", "ventas"]):
-            return "Perfecto. Te conecto con un agente humano inmediatamente. Pauso este chat y un agente de ventas te contactará en este mismo canal."
+            return HANDOFF_REPLY
         
         # Opción 2: Quiere seguir hablando
         elif any(x in text_lower for x in ["2", "dos", "seguir", "continuar", "hablar", "preguntas"]):
@@ -286,35 +757,41 @@ class Chatbot:
             )
 
     def process_message(self, user_input):
+        self._last_active = time.monotonic()
+        # Presupuesto de latencia del turno: cada llamada LLM recorta su plazo a lo que queda
+        with span("process_message"), turn_deadline():
+            return self._process_message(user_input)
+
+    def _process_message(self, user_input):
         try:
             # PRIORIDAD MÁXIMA: Detectar solicitud de agente humano ANTES de cualquier procesamiento
             # EXCEPCIÓN: No detectar "agente" cuando el usuario está describiendo su cargo laboral
             if (user_input and "agente" in user_input.lower() and 
                 self.state != ConversationState.AWAITING_ROLE_INPUT):
                 # Agregar el mensaje del usuario al historial antes de responder
-                self.chat_history.append(HumanMessage(content=user_input))
-                response = "Perfecto. Te conecto con un agente humano inmediatamente. Pauso este chat y un agente de ventas te contactará en este mismo canal."
-                self.chat_history.append(AIMessage(content=response))
+                self.chat_history.add_user(user_input)
+                response = HANDOFF_REPLY
+                self.chat_history.add_ai(response)
                 return response
             
             # SEGUNDA PRIORIDAD: Detectar solicitudes de agendamiento
             if user_input and self._detect_scheduling_request(user_input):
                 # Agregar el mensaje del usuario al historial antes de responder
-                self.chat_history.append(HumanMessage(content=user_input))
+                self.chat_history.add_user(user_input)
                 response = self._provide_calendar_link()
-                self.chat_history.append(AIMessage(content=response))
+                self.chat_history.add_ai(response)
                 return response
             
             # Los saludos iniciales no necesitan memoria ni RAG
             if self.state == ConversationState.AWAITING_GREETING:
                 self.state = ConversationState.AWAITING_NAME_CITY
                 prompt = "Actúas como Xtalento Bot. Genera un saludo inicial cálido y profesional que comience exactamente con la palabra '¡Hola! 👋'. A continuación, preséntate brevemente y pide al usuario su nombre y la ciudad desde la que escribe. IMPORTANTE: Solo habla de servicios y información que tienes conocimiento confirmado en tu base de datos."
-                response_text = self._generate_response(prompt)
-                self.chat_history.append(AIMessage(content=response_text))
+                response_text = self._generate_response(prompt, site="llm.greeting", fallback=self._greeting_template())
+                self.chat_history.add_ai(response_text)
                 return response_text
 
             # Guardamos la entrada del usuario en el historial
-            self.chat_history.append(HumanMessage(content=user_input))
+            self.chat_history.add_user(user_input)
 
             if self.state == ConversationState.AWAITING_NAME_CITY:
                 is_question = '?' in user_input or (user_input.lower().split() and user_input.lower().split()[0] in [
@@ -322,30 +799,37 @@ class Chatbot:
                     'how', 'when', 'where', 'which', 'why', 'who', 'do', 'is', 'are'
                 ])
                 if is_question:
-                    print(f"[DEBUG] Se detectó una pregunta en lugar de nombre/ciudad. Respondiendo sin interrumpir la conversación.")
-                    answer = self._safe_rag_answer(user_input)
-                    self.chat_history.append(AIMessage(content=answer))
+                    eventlog.debug("question_instead_of_name")
+                    answer = self._budget_template(user_input) if budget_exceeded() else self._safe_rag_answer(user_input)
+                    self.chat_history.add_ai(answer)
                     return answer
                 
-                self.user_data['name_city'] = user_input
-                user_name = self._extract_name(user_input)
-                self.user_data['name'] = user_name
                 self.state = ConversationState.AWAITING_ROLE_INPUT
+                fused = self._extract_name_and_welcome(user_input) if FUSED_NAME_WELCOME else None
+                if fused is not None:
+                    self.user_name = fused['name']
+                    self.user_city = fused['city']
+                    self.chat_history.add_ai(fused['welcome_text'])
+                    return fused['welcome_text']
+
+                user_name = self._extract_name(user_input)
+                self.user_name = user_name
                 prompt = f"Actúas como Xtalento Bot. El usuario se llama {user_name}. Dale una bienvenida personalizada (sin usar la palabra 'Hola') y luego pregúntale sobre su cargo actual o al que aspira para poder darle una mejor asesoría. IMPORTANTE: Solo habla de servicios que tienes conocimiento confirmado. Si no sabes algo específico, di 'Actualmente no tengo conocimiento sobre esto. Si quieres comunicarte con un humano, menciona la palabra agente en el chat.'"
-                response_text = self._generate_response(prompt)
-                self.chat_history.append(AIMessage(content=response_text))
+                response_text = self._generate_response(prompt, site="llm.welcome", fallback=self._welcome_template(user_name))
+                self.chat_history.add_ai(response_text)
                 return response_text
 
             elif self.state == ConversationState.AWAITING_ROLE_INPUT:
                 role_classification = self._classify_role(user_input)
                 if not role_classification:
-                    print(f"[DEBUG] No se pudo clasificar el rol. Continuando la conversación sin error.")
+                    eventlog.debug("role_classification_failed")
                     self.state = ConversationState.AWAITING_CONTINUE_CHOICE
                     response_text = self._continue_conversation(user_input, "")
-                    self.chat_history.append(AIMessage(content=response_text))
+                    self.chat_history.add_ai(response_text)
                     return response_text
 
-                self.user_data['role'] = role_classification
+                self.user_role = role_classification
+                FUNNEL.tier(chunking.normalize_tier(role_classification) or role_classification)
                 self.state = ConversationState.AWAITING_SERVICE_CHOICE
                 prompt = f"""
                 Actúas como Xtalento Bot. Presenta los siguientes servicios en una lista numerada sin mencionar ni revelar la categoría/nivel del usuario:
@@ -369,101 +853,23 @@ class Chatbot:
                 Dile que puede elegir uno o varios servicios, marcando el número del servicio y que si quiere escoger todos marque en el char la palabara Todos
                 IMPORTANTE: Solo presenta estos servicios que tienes en tu conocimiento confirmado. Si el usuario pregunta por servicios no listados, di 'Actualmente no tengo conocimiento sobre esto. Si quieres comunicarte con un humano, menciona la palabra agente en el chat.'
                 """
-                response_text = self._generate_response(prompt)
-                self.chat_history.append(AIMessage(content=response_text))
+                response_text = self._generate_response(prompt, site="llm.service_menu", fallback=self._service_menu_template())
+                self.chat_history.add_ai(response_text)
+                # Mientras el usuario lee el menú, calentamos la información de los servicios
+                self._schedule_service_prefetch(role_classification)
                 return response_text
 
             elif self.state == ConversationState.AWAITING_SERVICE_CHOICE:
-                service_keywords = ['hoja de vida','Hoja', 'Hoja de vida', 'Optimización', 'Optimización de Hoja de vida', 'ats','Optimización de Hoja de vida (ATS)','Mejora de perfil en plataformas de empleo','Preparación para Entrevistas','Preparacion para Entrevistas','Estrategia de búsqueda de empleo','Estrategia de busqueda de empleo','Simulación de entrevista con feedback','Simulacion de entrevista con feedback','Metodo X','Test EPI','Evaluación de Personalidad Integral','1', '2', '3', '4', '5', '6','7', 'mejora','mejorar','preparación', 'metodo x', 'método x', 'Ats', 'Mejora', 'Mejorar', 'Preparación']
-                is_service_choice = any(keyword in user_input.lower() for keyword in service_keywords)
-
-                if not is_service_choice:
-                    print(f"[DEBUG] No se detectó una selección de servicio. Continuando sin interrumpir.")
-                    self.state = ConversationState.AWAITING_CONTINUE_CHOICE
-                    response_text = self._continue_conversation(user_input, "")
-                    self.chat_history.append(AIMessage(content=response_text))
-                    return response_text
+                prefetch = self._take_prefetch()
+                try:
+                    return self._handle_service_choice(user_input, prefetch)
+                finally:
+                    if prefetch is not None:
+                        PREFETCHER.record_waste(prefetch.pending_count())
 
-                self.user_data['service'] = user_input
-                self.state = ConversationState.PROVIDING_INFO
-                
-                # Si el usuario elige TODOS los servicios, ofrecer diagnóstico gratuito
-                normalized_choice = (user_input or "").strip().lower()
-                if normalized_choice in {"Todos", "Todos los servicios", "Lista completa", "Opciones disponibles"}:
-                    response_text = (
-                        "¡Nos encantaría conocerte y trabajar contigo! 🎉\n\n"
-                        "Te ofrecemos un diagnóstico virtual gratuito para revisar tu perfil y a partir de este diagnóstico generar junto contigo una Estrategia Laboral Personalizada.\n\n"
-                        "Marca 'agenda' en el chat para que escojas tu horario disponible ⏰"
-                    )
-                    self.chat_history.append(AIMessage(content=response_text))
-                    return response_text
-                
-                # Si el usuario selecciona explícitamente Metodo X, responder sin precios antes de construir el query general
-                elif normalized_choice in {"metodo x", "método x", "metodo", "método", "6"}:
-                    mx_prompt = (
-                        "Usa EXCLUSIVAMENTE el contexto de tu conocimiento confirmado. Brinda información clara pero corta en un maximo de 200 tokens sobre 'Metodo X' SIN INCLUIR precios: "
-                        "qué es, para quién aplica, beneficios, cómo funciona y resultados esperables. "
-                        "IMPORTANTE: Solo habla de información que tienes confirmada en tu base de conocimiento. Si no tienes conocimiento suficiente sobre algún aspecto del Método X, di 'Actualmente no tengo conocimiento completo sobre esto. Si quieres comunicarte con un humano, menciona la palabra agente en el chat.' "
-                        f"Cierra invitando a agendar una asesoría personalizada gratuita. Incluye este enlace para agendar: {CALENDAR_LINK}. Recuerda que si el cliente dice que le interesa o quiere agendar una asesoria no le digas nada sobre pagos porque esta asesoria es gratuita"
-                    )
-                    mx_answer = self._safe_rag_answer(mx_prompt)
-                    self.chat_history.append(AIMessage(content=mx_answer))
-                    return mx_answer
-
-                user_role = self.user_data.get('role', 'táctico')
-                
-                query = (
-                    f"""
-                    Usa EXCLUSIVAMENTE el contexto de tu conocimiento confirmado para responder, excepto en la política de precios indicada abajo.
-                    Servicios escogidos por el usuario: "{user_input}".
-
-                    🚨 POLÍTICA DE CONOCIMIENTO ESTRICTA:
-                    - SOLO proporciona información que tienes confirmada en tu base de conocimiento.
-                    - Si no tienes información completa sobre algún servicio solicitado, di: "Actualmente no tengo conocimiento completo sobre este servicio. Si quieres comunicarte con un humano, menciona la palabra 'agente' en el chat."
-                    - NO inventes detalles sobre servicios, tiempos o características.
-                    - NUNCA reveles o menciones la clasificación de nivel del usuario.
-
-                    📊 POLÍTICA DE PRECIOS POR NIVEL JERÁRQUICO:
-                    
-                    Para el nivel OPERATIVO (cargos de ejecución directa y técnicos: analistas, desarrolladores, asistentes, operarios, técnicos, especialistas junior, consultores junior, ejecutivos de cuenta, vendedores):
-                    - Hoja de vida/CV/ATS: 50.000$ (precio fijo)
-                    - Mejora de perfil en plataformas: 80.000$ (precio fijo)  
-                    - Para otros servicios: busca en tu base de conocimiento los precios específicos para nivel operativo
-                    
-                    Para el nivel TÁCTICO (cargos de supervisión y coordinación media: coordinadores, especialistas senior, jefes de área, supervisors, team leads, líderes de equipo, gerentes de área específica):
-                    - Hoja de vida/CV/ATS: 50.000$ (precio fijo)
-                    - Mejora de perfil en plataformas: 80.000$ (precio fijo)
-                    - Para otros servicios: busca en tu base de conocimiento los precios específicos para nivel táctico
-                    
-                    Para el nivel ESTRATÉGICO (cargos de alta dirección y toma de decisiones: CEO, presidente, vicepresidente, director general, directores de área, gerentes generales, VP, fundadores):
-                    - Hoja de vida/CV/ATS: 50.000$ (precio fijo)
-                    - Mejora de perfil en plataformas: 80.000$ (precio fijo)
-                    - Para otros servicios: busca en tu base de conocimiento los precios específicos para nivel estratégico
-                    
-                    El usuario está clasificado como nivel {user_role.upper()}. Busca los precios correspondientes a este nivel en tu base de conocimiento, excepto para los dos servicios con precio fijo mencionados arriba.
-
-                    Formato de salida (en español, claro y consistente). Sigue estos encabezados en este orden, en texto plano:
-                    
-                    Servicio o servicios escogidos: <lista breve de los servicios tal como aparecen en el contexto>
-                    Información sobre el servicio o servicios: <qué incluye, cómo funciona y tiempos si están en contexto - SOLO si tienes la información confirmada>
-                    Precio del servicio o servicios: <aplica precios específicos para nivel {user_role} según tu base de conocimiento, excepto hoja de vida=50.000$ y mejora de perfil=80.000$ que son fijos>
-                    
-                    - Paso 1: llenar el formulario {PAYMENT_FORM_URL} (indica que este paso es fundamental para poder seguir)
-
-                    - Paso 2: SOLO si entre los servicios hay 'hoja de vida'/'cv'/'currículum'/'ATS'/'1'/Hoja de vida/ Hoja/ hoja/Elaboración: pedir la hoja de vida actual; si no la tiene, pedir documento con nombres, cédula, estudios y experiencias laborales. Si NO aplica, escribe: 'paso 2: (no aplica)'
-
-                    - Paso 3: formas de pagar y confirmar pago: incluye las cuentas/medios de pago que estan en el RAG SI no acá están Banco: bancolmbia \n tipo: ahorros \n numero: 10015482343 \n titular: gina paola cano \n nequi: 3128186587.
-
-                    Cierra indicando: 'Confirma cuando completes el formulario (paso 1) y cuando realices el pago (paso 3)'. Evita saludos iniciales. Por favor trata de no sobrepasar los 400 tokens.
-                    """
-                )
-                answer = self._safe_rag_answer(query)
-                self.chat_history.append(AIMessage(content=answer))
-                return answer
-            
             elif self.state == ConversationState.AWAITING_CONTINUE_CHOICE:
                 response_text = self._handle_continue_choice(user_input)
-                self.chat_history.append(AIMessage(content=response_text))
+                self.chat_history.add_ai(response_text)
                 
                 # Si el usuario eligió agente, mantener el estado para que el webhook detecte el bloqueo
                 if "Te conecto con un agente humano" in response_text:
@@ -480,12 +886,14 @@ class Chatbot:
                 # PRIORIDAD: Detectar confirmación de pasos 1 y 3 para enviar calendario
                 payment_status = self._detect_payment_confirmation(user_input)
                 if payment_status['both_confirmed']:
+                    self._funnel_event("payment_confirmed")
                     response_text = self._send_calendar_for_confirmed_payment()
-                    self.chat_history.append(AIMessage(content=response_text))
+                    self.chat_history.add_ai(response_text)
                     return response_text
                 
                 # Detectar confirmación individual de pasos para dar retroalimentación
                 elif payment_status['paso1'] and not payment_status['paso3']:
+                    self._funnel_event("payment_form_confirmed")
                     response_text = (
                         "¡Confirmado! ✅ Has completado el formulario (paso 1).\n\n"
                         "Ahora te falta completar el paso 3 (realizar el pago) para poder agendar tu sesión virtual.\n\n"
@@ -495,10 +903,11 @@ class Chatbot:
                         "• 'Pago listo'\n\n"
                         "Y te enviaré inmediatamente el link del calendario. 😊"
                     )
-                    self.chat_history.append(AIMessage(content=response_text))
+                    self.chat_history.add_ai(response_text)
                     return response_text
                 
                 elif payment_status['paso3'] and not payment_status['paso1']:
+                    self._funnel_event("payment_paid_confirmed")
                     response_text = (
                         "¡Confirmado! ✅ Has completado el pago (paso 3).\n\n"
                         "Ahora te falta completar el paso 1 (llenar el formulario) para poder agendar tu sesión virtual.\n\n"
@@ -508,7 +917,7 @@ class Chatbot:
                         "• 'Formulario listo'\n\n"
                         "Y te enviaré inmediatamente el link del calendario. 😊"
                     )
-                    self.chat_history.append(AIMessage(content=response_text))
+                    self.chat_history.add_ai(response_text)
                     return response_text
                 
                 # Opción específica SOLO para cuando el usuario explícitamente quiere ver la lista completa
@@ -537,25 +946,116 @@ class Chatbot:
                         "7. Test EPI (Evaluación de Personalidad Integral)\n\n"
                         "¿Cuál te interesa? Puedes elegir por número o nombre del servicio."
                     )
-                    self.chat_history.append(AIMessage(content=response_text))
+                    self.chat_history.add_ai(response_text)
                     return response_text
 
                 # Si menciona temas de pago/formulario pero no confirma claramente, pedir clarificación
                 if self._is_payment_related_query(user_input):
                     response_text = self._send_step_clarification_message()
-                    self.chat_history.append(AIMessage(content=response_text))
+                    self.chat_history.add_ai(response_text)
                     return response_text
 
-                # Responder vía RAG; si RAG no sabe, devolver opciones 1/2
-                answer = self._safe_rag_answer(user_input)
-                self.chat_history.append(AIMessage(content=answer))
+                # Responder vía RAG (plantillas si se agotó el presupuesto); si RAG no sabe, devolver opciones 1/2
+                answer = self._budget_template(user_input) if budget_exceeded() else self._safe_rag_answer(user_input)
+                self.chat_history.add_ai(answer)
                 return answer
 
         except Exception as e:
-            print(f"\n[ERROR] Ha ocurrido un problema, continuo la conversación: {e}")
+            eventlog.error("process_message_error", state=self.state.name, error=str(e))
             guidance = "hubo un inconveniente interno; responde de forma útil a lo último que dijo el usuario y mantén la conversación en marcha. IMPORTANTE: Solo habla de información que tienes conocimiento confirmado. Si no sabes algo específico, di 'Actualmente no tengo conocimiento sobre esto. Si quieres comunicarte con un humano, menciona la palabra agente en el chat.'"
             return self._continue_conversation(str(user_input), guidance)
 
+    def _handle_service_choice(self, user_input: str, prefetch: SessionPrefetch | None) -> str:
+        """Procesa la elección del menú de servicios, usando el prefetch especulativo si está disponible."""
+        service_keywords = ['hoja de vida','Hoja', 'Hoja de vida', 'Optimización', 'Optimización de Hoja de vida', 'ats','Optimización de Hoja de vida (ATS)','Mejora de perfil en plataformas de empleo','Preparación para Entrevistas','Preparacion para Entrevistas','Estrategia de búsqueda de empleo','Estrategia de busqueda de empleo','Simulación de entrevista con feedback','Simulacion de entrevista con feedback','Metodo X','Test EPI','Evaluación de Personalidad Integral','1', '2', '3', '4', '5', '6','7', 'mejora','mejorar','preparación', 'metodo x', 'método x', 'Ats', 'Mejora', 'Mejorar', 'Preparación']
+        is_service_choice = any(keyword in user_input.lower() for keyword in service_keywords)
+
+        if not is_service_choice:
+            eventlog.debug("service_choice_not_detected")
+            self.state = ConversationState.AWAITING_CONTINUE_CHOICE
+            response_text = self._continue_conversation(user_input, "")
+            self.chat_history.add_ai(response_text)
+            return response_text
+
+        self.user_service = user_input
+        self._funnel_event("service_chosen")
+        self.state = ConversationState.PROVIDING_INFO
+        
+        # Si el usuario elige TODOS los servicios, ofrecer diagnóstico gratuito
+        normalized_choice = (user_input or "").strip().lower()
+        if normalized_choice in {"Todos", "Todos los servicios", "Lista completa", "Opciones disponibles"}:
+            response_text = (
+                "¡Nos encantaría conocerte y trabajar contigo! 🎉\n\n"
+                "Te ofrecemos un diagnóstico virtual gratuito para revisar tu perfil y a partir de este diagnóstico generar junto contigo una Estrategia Laboral Personalizada.\n\n"
+                "Marca 'agenda' en el chat para que escojas tu horario disponible ⏰"
+            )
+            self.chat_history.add_ai(response_text)
+            return response_text
+        
+        # Si el usuario selecciona explícitamente Metodo X, responder sin precios antes de construir el query general
+        elif normalized_choice in {"metodo x", "método x", "metodo", "método", "6"}:
+            mx_answer = prefetch.take_answer() if prefetch is not None else None
+            if mx_answer:
+                PREFETCHER.record_hit()
+            else:
+                if prefetch is not None:
+                    PREFETCHER.record_miss()
+                if budget_exceeded():
+                    mx_answer = self._budget_handoff_template()
+                else:
+                    mx_answer = self._safe_rag_answer(self._metodo_x_prompt(), context_docs=self._metodo_x_docs())
+            self.chat_history.add_ai(mx_answer)
+            return mx_answer
+
+        user_role = self.user_role or 'táctico'
+        if budget_exceeded():
+            response_text = self._payment_steps_template()
+            self.chat_history.add_ai(response_text)
+            return response_text
+
+        # Documentos calentados por el prefetch: evitan la reformulación y la búsqueda en FAISS
+        context_docs = None
+        selected = self._parse_service_selection(user_input)
+        if prefetch is not None and selected:
+            context_docs = prefetch.take_docs(selected)
+            if context_docs:
+                PREFETCHER.record_hit(len(selected))
+            else:
+                PREFETCHER.record_miss()
+        # Sin prefetch: solo los fragmentos de los servicios elegidos y del nivel del usuario
+        if not context_docs and selected:
+            try:
+                with span("rag.retrieve"):
+                    context_docs = self._retrieve_filtered(selected, user_role)
+            except Exception as e:
+                eventlog.warning("filtered_retrieval_error", error=str(e))
+                context_docs = None
+        answer = self._pricing_answer(user_input, user_role, context_docs)
+        self.chat_history.add_ai(answer)
+        return answer
+
+    def _pricing_answer(self, user_input: str, user_role: str, context_docs: list | None) -> str:
+        """Servicios y precios con la cadena de prefijo estable (solo las reglas del nivel del usuario)."""
+        tier = chunking.normalize_tier(user_role) or "tactico"
+        config = {"callbacks": [METRICS_HANDLER]}
+        try:
+            if not context_docs:
+                with span("rag.retrieve"):
+                    context_docs = self.retriever.invoke(f"{user_input}: qué incluye, cómo funciona y precio para nivel {tier}")
+            with span("rag.answer_pricing"):
+                answer_text = call_llm("rag.answer_pricing", lambda: self.pricing_chain.invoke({
+                    "input": prompts.pricing_request(user_input), "tier_rules": prompts.TIER_RULES[tier],
+                    "chat_history": self.chat_history.as_messages(), "user_name": self.user_name,
+                    "context": context_docs}, config=config)) or ""
+        except LLMUnavailable as e:
+            eventlog.warning("llm_fallback", site="rag.answer_pricing", error=str(e))
+            return self._build_unknown_options_message()
+        except Exception:
+            return self._build_unknown_options_message()
+        if not answer_text.strip():
+            return self._build_unknown_options_message()
+        return answer_text
+
     def _detect_payment_confirmation(self, user_input: str) -> dict:
         """Detecta si el usuario confirma el paso 1 (formulario) y/o paso 3 (pago)."""
         text_lower = user_input.lower().strip()
@@ -600,7 +1100,8 @@ class Chatbot:
             'both_confirmed': paso1_confirmed and paso3_confirmed
         }
     
-    def _send_calendar_for_confirmed_payment(self) -> str:
+    @staticmethod
+    def _send_calendar_for_confirmed_payment() -> str:
         """Envía el link del calendario cuando se confirman ambos pasos."""
         return (
             f"¡Excelente! ✅ Has completado tanto el formulario como el pago.\n\n"
@@ -640,30 +1141,79 @@ class Chatbot:
         )
 
 
+def _register_shared_replies() -> None:
+    """Registra las respuestas que no dependen del usuario ni del LLM (recortadas como en el historial)."""
+    for text in (
+        HANDOFF_REPLY,
+        Chatbot._greeting_template(),
+        Chatbot._service_menu_template(),
+        Chatbot._build_unknown_options_message(),
+        Chatbot._payment_steps_template(),
+        Chatbot._budget_handoff_template(),
+        Chatbot._provide_calendar_link(),
+        Chatbot._send_calendar_for_confirmed_payment(),
+        Chatbot._continue_conversation("", ""),
+    ):
+        text = text[:HISTORY_MAX_AI_CHARS]
+        _SHARED_REPLIES[text] = text
+
+
+_register_shared_replies()
+
+
 # --- Funciones de Soporte ---
-def load_documents():
-    """Carga los documentos desde el directorio especificado."""
-    loader = DirectoryLoader(DOCUMENTS_PATH, glob="**/*.*", loader_cls=lambda p: UnstructuredFileLoader(p))
-    return loader.load()
-
-def create_vector_store(documents):
-    """Crea y guarda el almacén de vectores FAISS."""
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    docs = text_splitter.split_documents(documents)
-    embeddings = OpenAIEmbeddings()
-    vectorstore = FAISS.from_documents(docs, embeddings)
-    vectorstore.save_local(VECTORSTORE_PATH)
-    return vectorstore
-
-def load_vector_store():
+def load_documents(use_cache: bool = True, documents_path: str = DOCUMENTS_PATH, vectorstore_path: str = VECTORSTORE_PATH):
+    """Carga los documentos (parseo en paralelo con caché por hash, ver ingest.py)."""
+    return ingest.load_documents(documents_path, vectorstore_path, use_cache=use_cache)
+
+def create_vector_store(documents, vectorstore_path: str = VECTORSTORE_PATH):
+    """Crea y guarda el almacén de vectores FAISS e imprime el tiempo de cada fase."""
+    started = time.perf_counter()
+    docs = chunking.split_documents(documents, CHUNK_SIZE, CHUNK_OVERLAP)
+    split_seconds = time.perf_counter() - started
+    return ingest.build_vector_store(docs, _embeddings(), vectorstore_path, split_seconds=split_seconds)
+
+def has_chunk_metadata(vectorstore) -> bool:
+    """True si el índice se armó con la metadata de chunking.py (service/tier).
+
+    Todo el índice sale de una misma ingesta, así que basta con mirar un documento.
+    """
+    ids = vectorstore.index_to_docstore_id
+    if not ids:
+        return False
+    doc = vectorstore.docstore.search(next(iter(ids.values())))
+    return "service" in (getattr(doc, "metadata", None) or {})
+
+def load_vector_store(vectorstore_path: str = VECTORSTORE_PATH):
     """Carga el almacén de vectores FAISS si existe."""
-    if os.path.exists(VECTORSTORE_PATH):
-        embeddings = OpenAIEmbeddings()
-        return FAISS.load_local(VECTORSTORE_PATH, embeddings, allow_dangerous_deserialization=True)
+    if os.path.exists(os.path.join(vectorstore_path, "index.faiss")):
+        vectorstore = FAISS.load_local(vectorstore_path, _embeddings(), allow_dangerous_deserialization=True)
+        meta = indexes.load_meta(vectorstore_path)
+        indexes.apply_search_params(vectorstore.index, meta.get("params", {}))
+        if meta.get("requested_index_type", meta["index_type"]) != indexes.INDEX_TYPE:
+            print(f"[INIT] El índice guardado es {meta['index_type']} (INDEX_TYPE={indexes.INDEX_TYPE}); "
+                  "reconstrúyelo con 'python ingest.py' para cambiarlo.")
+        if not has_chunk_metadata(vectorstore):
+            print(f"[INIT] {vectorstore_path} no tiene metadata de servicio/nivel: la recuperación filtrada "
+                  "queda desactivada hasta reconstruirlo con 'python ingest.py'.")
+        return vectorstore
     return None
 
 def main():
-    """Función principal para ejecutar el chatbot."""
+    """Función principal: chat interactivo, o evaluación por lotes con --eval / --compare."""
+    parser = argparse.ArgumentParser(description="Xtalento Bot")
+    parser.add_argument("--eval", metavar="GOLDEN_SET", help="evalúa recuperación y respuestas contra un golden set (JSONL/YAML)")
+    parser.add_argument("--k", type=int, default=RETRIEVER_K, help="fragmentos recuperados por pregunta en --eval (para las métricas de recuperación y para el RAG de las respuestas)")
+    parser.add_argument("--workers", type=int, default=4, help="preguntas en paralelo en --eval")
+    parser.add_argument("--retrieval-only", action="store_true", help="en --eval, mide solo la recuperación")
+    parser.add_argument("--fake-llm", action="store_true", help="en --eval, responde con el LLM falso de benchmarks/harness.py")
+    parser.add_argument("--out", help="archivo JSON donde guardar los resultados de --eval")
+    parser.add_argument("--compare", nargs=2, metavar=("A", "B"), help="compara dos resultados guardados de --eval")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(evaluation.compare(*args.compare))
+
     if not os.getenv("OPENAI_API_KEY"):
         print("[ERROR] La variable de entorno OPENAI_API_KEY no fue encontrada.")
         print("Por favor, asegúrate de tener un archivo .env en la raíz del proyecto con la línea: OPENAI_API_KEY='tu_clave_aqui'")
@@ -676,6 +1226,24 @@ def main():
         vectorstore = create_vector_store(documents)
         print("Almacén de vectores creado y guardado.")
 
+    if args.eval:
+        global LLM_BASE_URL
+        fake_llm = None
+        if args.fake_llm:
+            from benchmarks.harness import FakeLLMServer
+            fake_llm = FakeLLMServer().start()
+            LLM_BASE_URL = f"{fake_llm.url}/v1"
+        config = {"model": OPENAI_MODEL, "fake_llm": args.fake_llm, "chunk_size": CHUNK_SIZE,
+                  "chunk_overlap": CHUNK_OVERLAP, "vectorstore": VECTORSTORE_PATH, "chunks": vectorstore.index.ntotal}
+        try:
+            # El RAG de las respuestas recupera los mismos k fragmentos que se puntúan
+            evaluation.run_eval(Chatbot(vectorstore, retriever_k=args.k), args.eval, args.k, workers=args.workers,
+                                retrieval_only=args.retrieval_only, out_path=args.out, config=config)
+        finally:
+            if fake_llm is not None:
+                fake_llm.stop()
+        return
+
     chatbot = Chatbot(vectorstore)
     
     print(f"Xtalento: {chatbot.process_message(None)}")
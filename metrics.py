@@ -0,0 +1,403 @@
+"""
+Instrumentación ligera de latencias, tokens y colas, exportada en formato de texto Prometheus.
+
+Uso:
+- `with span("llm.extract_name"): ...` mide una etapa y deja el nombre como sitio de llamada
+  para atribuir los tokens de las llamadas LLM que ocurran dentro.
+- `METRICS_HANDLER` es un callback de LangChain que cuenta tokens por sitio de llamada y mide las
+  etapas internas de la cadena RAG (reformulación, búsqueda FAISS y generación).
+- `with turn() as stats: ...` acumula los tiempos por etapa y los tokens de un turno completo
+  (para el registro `turn` del log estructurado).
+- `render()` produce el texto que sirve el endpoint /metrics.
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_number(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_number(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self._values: dict[tuple, float] = {}
+        self._functions: dict[tuple, object] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels) -> None:
+        """Calcula el valor al momento de exportar (p. ej. tamaño de una cola)."""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        with self._lock:
+            fn = self._functions.get(key)
+            if fn is None:
+                return self._values.get(key, 0)
+        return fn()
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        lines = [f"{self.name}{_format_labels(self.labelnames, k)} {_format_number(v)}" for k, v in items]
+        for key, fn in functions:
+            try:
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_number(fn())}")
+            except Exception:
+                continue
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple, list] = {}  # key -> [conteos por bucket..., +Inf, suma]
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[idx] += 1
+            series[-1] += value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_number(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._lock = Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    "chatbot_stage_duration_seconds", "Latencia por etapa del pipeline", ("stage",)))
+LLM_CALLS = REGISTRY.register(Counter(
+    "chatbot_llm_calls_total", "Llamadas LLM por sitio de llamada", ("site",)))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "chatbot_llm_tokens_total", "Tokens LLM por sitio de llamada y dirección (in/out)", ("site", "direction")))
+LLM_ERRORS = REGISTRY.register(Counter(
+    "chatbot_llm_errors_total", "Errores LLM por sitio de llamada y tipo", ("site", "kind")))
+CACHE_EVENTS = REGISTRY.register(Counter(
+    "chatbot_cache_events_total", "Eventos de caché (hit, miss, waste) por caché", ("cache", "result")))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "chatbot_queue_depth", "Tareas pendientes por cola", ("queue",)))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "chatbot_in_flight", "Tareas en ejecución por pool", ("pool",)))
+SEND_ATTEMPTS = REGISTRY.register(Counter(
+    "chatbot_evolution_send_attempts_total", "Intentos de envío a Evolution por código de estado", ("status",)))
+WEBHOOK_MESSAGES = REGISTRY.register(Counter(
+    "chatbot_webhook_messages_total", "Mensajes recibidos en /webhook por resultado (enqueued, duplicate, ...)", ("result",)))
+WEBHOOK_BATCH_SIZE = REGISTRY.register(Histogram(
+    "chatbot_webhook_batch_size", "Mensajes por payload de /webhook (lotes grandes = reconexiones)", (),
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500)))
+
+
+def render() -> str:
+    return REGISTRY.render()
+
+
+# --- Spans ---
+_current_site: ContextVar[str] = ContextVar("chatbot_llm_site", default="unknown")
+
+
+class TurnStats:
+    """Acumulado de un turno: milisegundos por etapa, tokens y llamadas LLM."""
+
+    __slots__ = ("stages", "tokens_in", "tokens_out", "llm_calls")
+
+    def __init__(self):
+        self.stages: dict[str, float] = {}
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.llm_calls = 0
+
+    def add_stage(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds * 1000
+
+    def as_dict(self) -> dict:
+        return {
+            "stages_ms": {k: round(v, 1) for k, v in self.stages.items()},
+            "tokens_in": self.tokens_in,
+            "tokens_out": self.tokens_out,
+            "llm_calls": self.llm_calls,
+        }
+
+
+_current_turn: ContextVar[TurnStats | None] = ContextVar("chatbot_turn", default=None)
+
+
+def current_site() -> str:
+    return _current_site.get()
+
+
+def current_turn() -> TurnStats | None:
+    return _current_turn.get()
+
+
+@contextmanager
+def turn():
+    """Abre el acumulador de un turno; las etapas y tokens dentro se suman a él."""
+    stats = TurnStats()
+    token = _current_turn.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_turn.reset(token)
+
+
+def _observe_stage(stage: str, seconds: float) -> None:
+    STAGE_LATENCY.observe(seconds, stage=stage)
+    stats = _current_turn.get()
+    if stats is not None:
+        stats.add_stage(stage, seconds)
+
+
+@contextmanager
+def span(stage: str):
+    """Mide la duración de una etapa; las llamadas LLM dentro se atribuyen a este sitio."""
+    token = _current_site.set(stage)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe_stage(stage, time.perf_counter() - start)
+        _current_site.reset(token)
+
+
+# Observadores de cada llamada LLM terminada: fn(sitio, segundos, tipo_de_error | None)
+_llm_observers: list = []
+
+
+def add_llm_observer(fn) -> None:
+    """Registra un callback que recibe (sitio, segundos, tipo_de_error) por llamada LLM (p. ej. control de admisión)."""
+    _llm_observers.append(fn)
+
+
+def _notify_llm_observers(site: str, seconds: float, error_kind: str | None) -> None:
+    for fn in _llm_observers:
+        try:
+            fn(site, seconds, error_kind)
+        except Exception:
+            pass
+
+
+def _error_kind(error: BaseException) -> str:
+    name = type(error).__name__
+    if name == "RateLimitError" or getattr(error, "status_code", None) == 429:
+        return "rate_limit"
+    if "Timeout" in name:
+        return "timeout"
+    return name
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Callback de LangChain: tokens por sitio y latencia de las etapas internas de la cadena RAG."""
+
+    # Nombres de las sub-cadenas que arma create_retrieval_chain
+    _CHAIN_SITES = {
+        "chat_retriever_chain": "rag.rephrase",
+        "stuff_documents_chain": "rag.generate",
+    }
+
+    def __init__(self):
+        self._lock = Lock()
+        self._parents: dict = {}
+        self._names: dict = {}
+        self._started: dict = {}
+
+    def _site_for(self, run_id, parent_run_id) -> str:
+        with self._lock:
+            node = parent_run_id
+            while node is not None:
+                site = self._CHAIN_SITES.get(self._names.get(node))
+                if site:
+                    return site
+                node = self._parents.get(node)
+        return current_site()
+
+    def _forget(self, run_id):
+        with self._lock:
+            self._parents.pop(run_id, None)
+            self._names.pop(run_id, None)
+            return self._started.pop(run_id, None)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name")
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            self._names[run_id] = name
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._forget(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._forget(run_id)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        site = self._site_for(run_id, parent_run_id)
+        with self._lock:
+            self._parents[run_id] = parent_run_id
+            self._started[run_id] = (site, time.perf_counter())
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        self.on_chat_model_start(serialized, prompts, run_id=run_id, parent_run_id=parent_run_id, **kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._forget(run_id)
+        site = started[0] if started else current_site()
+        llm_output = getattr(response, "llm_output", None) or {}
+        # Respuesta compartida por single-flight: no hubo llamada ni tokens propios
+        if not llm_output.get("coalesced"):
+            LLM_CALLS.inc(site=site)
+        if started:
+            elapsed = time.perf_counter() - started[1]
+            if site.startswith("rag."):
+                _observe_stage(site, elapsed)
+            _notify_llm_observers(site, elapsed, None)
+        stats = _current_turn.get()
+        if stats is not None and not llm_output.get("coalesced"):
+            stats.llm_calls += 1
+        usage = llm_output.get("token_usage") or {}
+        if usage:
+            tokens_in = usage.get("prompt_tokens", 0) or 0
+            tokens_out = usage.get("completion_tokens", 0) or 0
+            LLM_TOKENS.inc(tokens_in, site=site, direction="in")
+            LLM_TOKENS.inc(tokens_out, site=site, direction="out")
+            if stats is not None:
+                stats.tokens_in += tokens_in
+                stats.tokens_out += tokens_out
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._forget(run_id)
+        site = started[0] if started else current_site()
+        kind = _error_kind(error)
+        LLM_ERRORS.inc(site=site, kind=kind)
+        if started:
+            _notify_llm_observers(site, time.perf_counter() - started[1], kind)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        with self._lock:
+            self._started[run_id] = ("rag.retrieve", time.perf_counter())
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        started = self._forget(run_id)
+        if started:
+            _observe_stage("rag.retrieve", time.perf_counter() - started[1])
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._forget(run_id)
+
+
+METRICS_HANDLER = MetricsCallbackHandler()
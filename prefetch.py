@@ -0,0 +1,183 @@
+"""
+Prefetch especulativo para el turno de selección de servicios.
+
+Cuando el bot envía el menú de siete servicios ya conoce el nivel del usuario,
+así que mientras la persona lee podemos calentar en background la recuperación
+de documentos de cada servicio (y opcionalmente la respuesta del Método X).
+Todo corre en un pool propio, con concurrencia y presupuesto de costo globales,
+para que la especulación nunca le quite capacidad al camino principal.
+
+Variables de entorno:
+- SPECULATIVE_PREFETCH            (true/false, default false)
+- SPECULATIVE_PREFETCH_ANSWERS    (true/false, default false) -> pre-genera la respuesta del Método X
+- PREFETCH_MAX_CONCURRENCY        (default 4)
+- PREFETCH_BUDGET_UNITS           (unidades de costo por ventana, default 600)
+- PREFETCH_BUDGET_WINDOW_SECONDS  (default 3600)
+- PREFETCH_TTL_SECONDS            (vida máxima de un resultado calentado, default 900)
+- PREFETCH_WAIT_SECONDS           (espera máxima por un prefetch en curso, default 5)
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from threading import Lock
+
+from metrics import CACHE_EVENTS
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes")
+
+
+PREFETCH_ENABLED = _env_flag("SPECULATIVE_PREFETCH")
+PREFETCH_ANSWERS = _env_flag("SPECULATIVE_PREFETCH_ANSWERS")
+PREFETCH_MAX_CONCURRENCY = int(os.getenv("PREFETCH_MAX_CONCURRENCY", "4"))
+PREFETCH_BUDGET_UNITS = int(os.getenv("PREFETCH_BUDGET_UNITS", "600"))
+PREFETCH_BUDGET_WINDOW_SECONDS = float(os.getenv("PREFETCH_BUDGET_WINDOW_SECONDS", "3600"))
+PREFETCH_TTL_SECONDS = float(os.getenv("PREFETCH_TTL_SECONDS", "900"))
+PREFETCH_WAIT_SECONDS = float(os.getenv("PREFETCH_WAIT_SECONDS", "5"))
+
+# Costo relativo de cada tipo de trabajo especulativo (1 unidad ~ una llamada de embeddings)
+RETRIEVAL_COST = 1
+ANSWER_COST = 10
+
+
+class PrefetchBudget:
+    """Presupuesto de costo en ventana deslizante, compartido por todas las sesiones."""
+
+    def __init__(self, units: int, window_seconds: float):
+        self.units = units
+        self.window_seconds = window_seconds
+        self._spent: deque[tuple[float, int]] = deque()
+        self._total = 0
+        self._lock = Lock()
+
+    def try_spend(self, cost: int) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._spent and now - self._spent[0][0] >= self.window_seconds:
+                self._total -= self._spent.popleft()[1]
+            if self._total + cost > self.units:
+                return False
+            self._spent.append((now, cost))
+            self._total += cost
+            return True
+
+    def used(self) -> int:
+        with self._lock:
+            return self._total
+
+
+class SpeculativePrefetcher:
+    """Pool acotado para trabajo especulativo con contadores de acierto/desperdicio."""
+
+    def __init__(self, max_concurrency: int, budget: PrefetchBudget):
+        self.max_concurrency = max_concurrency
+        self.budget = budget
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="prefetch")
+        self._lock = Lock()
+        self._counters = {
+            "scheduled": 0,
+            "rejected_budget": 0,
+            "completed": 0,
+            "errors": 0,
+            "hits": 0,
+            "misses": 0,
+            "wasted": 0,
+        }
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += n
+
+    def submit(self, cost: int, fn, *args) -> Future | None:
+        """Agenda trabajo especulativo si el presupuesto global lo permite."""
+        if not self.budget.try_spend(cost):
+            self._count("rejected_budget")
+            return None
+        self._count("scheduled")
+        future = self._executor.submit(fn, *args)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def _on_done(self, future: Future) -> None:
+        if future.cancelled() or future.exception() is not None:
+            self._count("errors")
+        else:
+            self._count("completed")
+
+    def record_hit(self, n: int = 1) -> None:
+        self._count("hits", n)
+        CACHE_EVENTS.inc(n, cache="prefetch", result="hit")
+
+    def record_miss(self) -> None:
+        self._count("misses")
+        CACHE_EVENTS.inc(cache="prefetch", result="miss")
+
+    def record_waste(self, n: int = 1) -> None:
+        if n:
+            self._count("wasted", n)
+            CACHE_EVENTS.inc(n, cache="prefetch", result="waste")
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({
+            "enabled": PREFETCH_ENABLED,
+            "answers_enabled": PREFETCH_ANSWERS,
+            "max_concurrency": self.max_concurrency,
+            "budget_units": self.budget.units,
+            "budget_used": self.budget.used(),
+            "budget_window_seconds": self.budget.window_seconds,
+        })
+        return counters
+
+
+class SessionPrefetch:
+    """Resultados calentados para una sesión: documentos por servicio y respuesta opcional del Método X."""
+
+    def __init__(self, tier: str):
+        self.tier = tier
+        self.created_at = time.monotonic()
+        self.docs: dict[str, Future] = {}
+        self.answer: Future | None = None
+
+    def expired(self) -> bool:
+        return time.monotonic() - self.created_at > PREFETCH_TTL_SECONDS
+
+    def pending_count(self) -> int:
+        return len(self.docs) + (1 if self.answer is not None else 0)
+
+    def take_docs(self, service_ids: list[str]) -> list | None:
+        """Devuelve los documentos combinados de los servicios pedidos, o None si falta alguno."""
+        futures = [self.docs.get(sid) for sid in service_ids]
+        if not futures or any(f is None for f in futures):
+            return None
+        docs, seen = [], set()
+        deadline = time.monotonic() + PREFETCH_WAIT_SECONDS
+        try:
+            for sid, future in zip(service_ids, futures):
+                for doc in future.result(timeout=max(0.0, deadline - time.monotonic())):
+                    if doc.page_content not in seen:
+                        seen.add(doc.page_content)
+                        docs.append(doc)
+                del self.docs[sid]
+        except Exception:
+            return None
+        return docs
+
+    def take_answer(self) -> str | None:
+        future, self.answer = self.answer, None
+        if future is None:
+            return None
+        try:
+            return future.result(timeout=PREFETCH_WAIT_SECONDS)
+        except Exception:
+            return None
+
+
+PREFETCHER = SpeculativePrefetcher(
+    PREFETCH_MAX_CONCURRENCY,
+    PrefetchBudget(PREFETCH_BUDGET_UNITS, PREFETCH_BUDGET_WINDOW_SECONDS),
+)
@@ -0,0 +1,332 @@
+"""
+Presupuesto de latencia por turno, llamadas LLM con plazo, hedging y circuit breaker.
+
+- `with turn_deadline(TURN_BUDGET_SECONDS): ...` fija el plazo total del turno. Cada llamada
+  hecha con `call_llm(sitio, fn)` espera como máximo lo que indique STAGE_TIMEOUTS para su
+  sitio, recortado a lo que le queda al turno; si no alcanza lanza DeadlineExceeded.
+- Hedging: en las llamadas cortas (HEDGED_SITES) si la respuesta tarda más que el p95
+  observado del sitio se lanza una copia y se usa la que termine primero.
+- Circuit breaker: si en la ventana reciente fallan demasiadas llamadas al proveedor
+  (PROVIDER_ERRORS: timeouts, conexión, 429, 5xx; plazos del sitio vencidos) se abre durante BREAKER_OPEN_SECONDS y `call_llm` lanza CircuitOpen sin
+  llamar al proveedor; main.py responde entonces con plantillas deterministas. Pasado ese
+  tiempo se deja pasar una llamada de prueba (half-open) para decidir si se cierra. Los
+  errores locales dentro de `fn` (recuperación en FAISS, parseo, bugs) se relanzan sin
+  contar como falla del proveedor.
+- Presupuesto de tokens: dentro de `llm_budget_exceeded(alcance)` (el remitente o el proceso
+  agotó su presupuesto, ver budgets.py) `call_llm` lanza BudgetExceeded sin llamar al proveedor.
+
+Las llamadas corren en CALL_EXECUTOR con el contexto copiado (sitio y turno de metrics.py) y
+las copias de hedging omiten el single-flight (singleflight.py). Si se abandonan por plazo
+terminan en segundo plano, acotadas por el timeout del cliente (LLM_REQUEST_TIMEOUT_SECONDS en main.py).
+
+Variables de entorno:
+- TURN_BUDGET_SECONDS          (default 25)
+- LLM_CALL_WORKERS             (default 32)
+- LLM_HEDGING                  (true/false, default true)
+- HEDGE_PERCENTILE             (default 95)
+- HEDGE_MIN_SAMPLES            (muestras antes de empezar a cubrir, default 20)
+- BREAKER_WINDOW_SECONDS       (default 60)
+- BREAKER_MIN_CALLS            (default 10)
+- BREAKER_FAILURE_RATIO        (default 0.5)
+- BREAKER_CONSECUTIVE_FAILURES (default 5)
+- BREAKER_OPEN_SECONDS         (default 30)
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from threading import Lock
+
+import openai
+
+from metrics import Counter, Gauge, LLM_ERRORS, REGISTRY, add_llm_observer
+from singleflight import bypass_single_flight
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes")
+
+
+TURN_BUDGET_SECONDS = float(os.getenv("TURN_BUDGET_SECONDS", "25"))
+LLM_CALL_WORKERS = int(os.getenv("LLM_CALL_WORKERS", "32"))
+LLM_HEDGING = _env_flag("LLM_HEDGING", "true")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+BREAKER_WINDOW_SECONDS = float(os.getenv("BREAKER_WINDOW_SECONDS", "60"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "10"))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_CONSECUTIVE_FAILURES = int(os.getenv("BREAKER_CONSECUTIVE_FAILURES", "5"))
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+
+# Plazo máximo por sitio de llamada (segundos); el turno completo además se corta en TURN_BUDGET_SECONDS
+STAGE_TIMEOUTS = {
+    "llm.extract_name": 6.0,
+    "llm.extract_role": 6.0,
+    "llm.classify_role": 6.0,
+    "llm.greeting": 10.0,
+    "llm.welcome": 10.0,
+    "llm.name_welcome": 12.0,
+    "llm.service_menu": 15.0,
+    "rag.answer": 18.0,
+    "rag.answer_prefetched": 15.0,
+    "rag.answer_pricing": 18.0,
+}
+DEFAULT_STAGE_TIMEOUT = 15.0
+
+# Llamadas cortas y sin efectos donde duplicar la petición es barato
+HEDGED_SITES = frozenset({"llm.extract_name", "llm.extract_role", "llm.classify_role"})
+
+HEDGES = REGISTRY.register(Counter(
+    "chatbot_llm_hedges_total", "Peticiones duplicadas (hedging) por sitio y resultado (launched, won)", ("site", "result")))
+BREAKER_STATE = REGISTRY.register(Gauge(
+    "chatbot_llm_circuit_state", "Estado del circuit breaker del LLM (0 cerrado, 1 half-open, 2 abierto)"))
+
+
+class LLMUnavailable(Exception):
+    """La llamada al LLM no se hizo o no terminó a tiempo; el llamador debe degradar."""
+
+
+class DeadlineExceeded(LLMUnavailable):
+    pass
+
+
+class CircuitOpen(LLMUnavailable):
+    pass
+
+
+class BudgetExceeded(LLMUnavailable):
+    pass
+
+
+# --- Plazo del turno ---
+_deadline: ContextVar[float | None] = ContextVar("chatbot_turn_deadline", default=None)
+
+
+@contextmanager
+def turn_deadline(seconds: float = TURN_BUDGET_SECONDS):
+    """Fija el plazo del turno; los plazos anidados nunca extienden el exterior."""
+    outer = _deadline.get()
+    deadline = time.monotonic() + seconds
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+# --- Presupuesto de tokens agotado (alcance "sender" o "global") ---
+_budget_scope: ContextVar[str | None] = ContextVar("chatbot_budget_scope", default=None)
+
+
+@contextmanager
+def llm_budget_exceeded(scope: str | None):
+    """Si `scope` no es None, las llamadas del bloque no van al proveedor."""
+    token = _budget_scope.set(scope)
+    try:
+        yield
+    finally:
+        _budget_scope.reset(token)
+
+
+def budget_exceeded() -> str | None:
+    """Alcance del presupuesto agotado en el turno actual (None si el LLM está disponible)."""
+    return _budget_scope.get()
+
+
+def remaining() -> float | None:
+    """Segundos que le quedan al turno actual (None si no hay plazo)."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# --- Latencias observadas por sitio (para el umbral de hedging) ---
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self._samples: dict[str, deque] = {}
+        self._window = window
+        self._lock = Lock()
+
+    def observe(self, site: str, seconds: float, error_kind: str | None) -> None:
+        if error_kind is not None:
+            return
+        with self._lock:
+            samples = self._samples.get(site)
+            if samples is None:
+                samples = self._samples[site] = deque(maxlen=self._window)
+            samples.append(seconds)
+
+    def percentile(self, site: str, p: float) -> float | None:
+        with self._lock:
+            samples = list(self._samples.get(site, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        samples.sort()
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+# --- Circuit breaker ---
+class CircuitBreaker:
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self):
+        self._events: deque[tuple[float, bool]] = deque()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+        self._lock = Lock()
+        self.opened_count = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= BREAKER_OPEN_SECONDS:
+                return self.HALF_OPEN
+            return self._state
+
+    def is_open(self) -> bool:
+        return self.state == self.OPEN
+
+    def allow(self) -> bool:
+        """True si la llamada puede ir al proveedor (en half-open solo una de prueba a la vez)."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at < BREAKER_OPEN_SECONDS:
+                return False
+            self._state = self.HALF_OPEN
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record(self, success: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                if success:
+                    self._state = self.CLOSED
+                    self._events.clear()
+                    self._consecutive_failures = 0
+                else:
+                    self._open(now)
+                return
+            self._events.append((now, success))
+            while self._events and now - self._events[0][0] > BREAKER_WINDOW_SECONDS:
+                self._events.popleft()
+            self._consecutive_failures = 0 if success else self._consecutive_failures + 1
+            failures = sum(1 for _, ok in self._events if not ok)
+            if self._state == self.CLOSED and (
+                self._consecutive_failures >= BREAKER_CONSECUTIVE_FAILURES
+                or (len(self._events) >= BREAKER_MIN_CALLS and failures / len(self._events) >= BREAKER_FAILURE_RATIO)
+            ):
+                self._open(now)
+
+    def release(self) -> None:
+        """Libera la llamada de prueba sin veredicto (falló por algo que no es el proveedor)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _open(self, now: float) -> None:
+        self._state = self.OPEN
+        self._opened_at = now
+        self.opened_count += 1
+
+    def stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            return {
+                "state": state,
+                "window_calls": len(self._events),
+                "window_failures": sum(1 for _, ok in self._events if not ok),
+                "consecutive_failures": self._consecutive_failures,
+                "opened_count": self.opened_count,
+            }
+
+
+# Fallas transitorias del proveedor; solo estas cuentan para el circuit breaker. Los 4xx
+# deterministas (BadRequestError, AuthenticationError, NotFoundError...) también heredan de
+# openai.APIError y no deben abrirlo.
+PROVIDER_ERRORS = (TimeoutError, openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError,
+                   openai.InternalServerError)
+
+LATENCY_TRACKER = LatencyTracker()
+add_llm_observer(LATENCY_TRACKER.observe)
+BREAKER = CircuitBreaker()
+BREAKER_STATE.set_function(lambda: {"closed": 0, "half_open": 1, "open": 2}[BREAKER.state])
+CALL_EXECUTOR = ThreadPoolExecutor(max_workers=LLM_CALL_WORKERS, thread_name_prefix="llm-call")
+
+
+def _run_hedge(fn):
+    # La copia no debe unirse (single-flight) a la misma llamada lenta que intenta cubrir
+    with bypass_single_flight():
+        return fn()
+
+
+def call_llm(site: str, fn):
+    """Ejecuta `fn()` (una llamada al LLM o a una cadena) con plazo, hedging y circuit breaker.
+
+    Lanza DeadlineExceeded / CircuitOpen (subclases de LLMUnavailable) o el error de la llamada.
+    """
+    stage_timeout = STAGE_TIMEOUTS.get(site, DEFAULT_STAGE_TIMEOUT)
+    left = remaining()
+    timeout = stage_timeout if left is None else min(stage_timeout, left)
+    if timeout <= 0:
+        LLM_ERRORS.inc(site=site, kind="deadline")
+        raise DeadlineExceeded(f"sin presupuesto de turno para {site}")
+    if _budget_scope.get() is not None:
+        LLM_ERRORS.inc(site=site, kind="budget")
+        raise BudgetExceeded(f"presupuesto de tokens agotado ({_budget_scope.get()}), se omite {site}")
+    if not BREAKER.allow():
+        LLM_ERRORS.inc(site=site, kind="circuit_open")
+        raise CircuitOpen(f"circuit breaker abierto, se omite {site}")
+
+    deadline_at = time.monotonic() + timeout
+    primary = CALL_EXECUTOR.submit(copy_context().run, fn)
+    pending = {primary}
+    hedge_after = LATENCY_TRACKER.percentile(site, HEDGE_PERCENTILE) if LLM_HEDGING and site in HEDGED_SITES else None
+    if hedge_after is not None and hedge_after < timeout:
+        done, _ = wait(pending, timeout=hedge_after)
+        if not done:
+            pending.add(CALL_EXECUTOR.submit(copy_context().run, _run_hedge, fn))
+            HEDGES.inc(site=site, result="launched")
+
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline_at - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            # Solo es falla del proveedor si venció el plazo propio del sitio; si lo que se
+            # agotó fue el presupuesto del turno (etapas previas lentas) no cuenta para el breaker
+            if timeout >= stage_timeout:
+                BREAKER.record(False)
+            else:
+                BREAKER.release()
+            LLM_ERRORS.inc(site=site, kind="deadline")
+            raise DeadlineExceeded(f"{site} superó {timeout:.1f}s")
+        for future in done:
+            if future.exception() is None:
+                BREAKER.record(True)
+                if future is not primary:
+                    HEDGES.inc(site=site, result="won")
+                return future.result()
+            error = future.exception()
+    if isinstance(error, PROVIDER_ERRORS):
+        BREAKER.record(False)
+    else:
+        BREAKER.release()
+    raise error
+
+
+def stats() -> dict:
+    return {
+        "breaker": BREAKER.stats(),
+        "turn_budget_seconds": TURN_BUDGET_SECONDS,
+        "hedging": LLM_HEDGING,
+        "hedge_thresholds_seconds": {
+            site: LATENCY_TRACKER.percentile(site, HEDGE_PERCENTILE) for site in sorted(HEDGED_SITES)
+        },
+    }
@@ -0,0 +1,110 @@
+"""
+Single-flight para el cliente LLM compartido.
+
+Muchos prompts son idénticos byte a byte entre usuarios al mismo tiempo (saludo inicial,
+menú de servicios, consulta del Método X, precios del mismo nivel durante una campaña).
+`SingleFlightChatOpenAI` agrupa las peticiones concurrentes con el mismo modelo, parámetros
+y mensajes: la primera hace la llamada real y las demás esperan y comparten su resultado.
+No es una caché: en cuanto la llamada termina la clave se libera.
+
+Las respuestas compartidas se marcan con `llm_output["coalesced"] = True` y sin
+`token_usage`, para que metrics.py no cuente dos veces llamadas ni tokens que no se gastaron.
+Las copias de hedging (resilience.py) se ejecutan dentro de `bypass_single_flight()` para
+no quedar esperando a la misma llamada lenta que intentan cubrir.
+
+Variables de entorno:
+- LLM_SINGLE_FLIGHT (true/false, default true)
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+from langchain_core.messages import messages_to_dict
+from langchain_core.outputs import ChatResult
+from langchain_openai import ChatOpenAI
+
+from metrics import Counter, REGISTRY
+
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").strip().lower() in ("1", "true", "yes")
+
+SINGLE_FLIGHT_CALLS = REGISTRY.register(Counter(
+    "chatbot_llm_single_flight_total", "Llamadas LLM por rol en single-flight (leader = llamada real, coalesced = compartida)", ("result",)))
+
+_bypass: ContextVar[bool] = ContextVar("chatbot_single_flight_bypass", default=False)
+
+
+@contextmanager
+def bypass_single_flight():
+    """Las llamadas dentro del bloque van siempre al proveedor (p. ej. copias de hedging)."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución."""
+
+    def __init__(self):
+        self._calls: dict[str, Future] = {}
+        self._lock = Lock()
+
+    def do(self, key: str, fn):
+        """Devuelve (resultado, compartido). Los errores del líder se propagan a quienes esperan."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            SINGLE_FLIGHT_CALLS.inc(result="coalesced")
+            return future.result(), True
+        SINGLE_FLIGHT_CALLS.inc(result="leader")
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+LLM_FLIGHTS = SingleFlight()
+
+
+class SingleFlightChatOpenAI(ChatOpenAI):
+    """ChatOpenAI que comparte las llamadas idénticas en curso entre todas las sesiones."""
+
+    def _flight_key(self, messages, stop, kwargs) -> str:
+        material = {
+            "params": self._default_params,
+            "stop": stop,
+            "kwargs": kwargs,
+            "messages": messages_to_dict(messages),
+        }
+        raw = json.dumps(material, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if not LLM_SINGLE_FLIGHT or _bypass.get() or self.streaming:
+            return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        key = self._flight_key(messages, stop, kwargs)
+        result, shared = LLM_FLIGHTS.do(
+            key, lambda: super(SingleFlightChatOpenAI, self)._generate(messages, stop=stop, run_manager=run_manager, **kwargs))
+        if not shared:
+            return result
+        llm_output = {k: v for k, v in (result.llm_output or {}).items() if k != "token_usage"}
+        llm_output["coalesced"] = True
+        return ChatResult(generations=result.generations, llm_output=llm_output)
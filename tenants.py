@@ -0,0 +1,127 @@
+"""
+Varias líneas de WhatsApp (instancias de Evolution) servidas por un mismo proceso.
+
+Cada tenant tiene su configuración de Evolution, su base de conocimiento, sus sesiones y
+su estado de pausa/bloqueo. Lo pesado se comparte:
+- los vectorstores se cargan una vez por ruta: dos tenants con el mismo vectorstore_path
+  usan el mismo índice y las mismas cadenas (main.py las cachea por vectorstore);
+- el LLM y los embeddings son únicos en main.py;
+- el pool de trabajo, el control de admisión (cola con turnos round-robin por tenant, ver
+  admission.py) y la sesión HTTP hacia Evolution son los de webhook.py.
+
+Configuración: TENANTS_CONFIG apunta a un JSON como
+    {"tenants": [
+        {"instance": "xtalento", "evo_apikey": "..."},
+        {"instance": "pruebas", "evo_apikey": "...", "documents_path": "documents_pruebas",
+         "vectorstore_path": "vectorstore_pruebas"}
+    ]}
+Los campos que falten toman los valores globales (EVO_API_URL, EVO_APIKEY, documents/,
+vectorstore/, ...); public_webhook_url por defecto es PUBLIC_WEBHOOK_URL + "/<instance>".
+El primer tenant es el de /webhook sin instancia. Sin TENANTS_CONFIG hay un único tenant
+con la configuración de siempre (EVO_INSTANCE).
+
+Variables de entorno:
+- TENANTS_CONFIG (vacío = un solo tenant desde EVO_*)
+"""
+
+import json
+import os
+from threading import RLock
+
+from expiring import ExpiringStore
+
+TENANTS_CONFIG = os.getenv("TENANTS_CONFIG", "").strip()
+
+_TENANT_FIELDS = ("instance", "evo_api_url", "evo_apikey", "public_webhook_url",
+                  "documents_path", "vectorstore_path", "intervention_keyword")
+
+
+class Tenant:
+    """Configuración y estado de una instancia de Evolution."""
+
+    def __init__(self, instance: str, evo_api_url: str, evo_apikey: str, public_webhook_url: str,
+                 documents_path: str, vectorstore_path: str, intervention_keyword: str,
+                 vectorstore, on_hold_expired=None):
+        self.instance = instance
+        self.evo_api_url = evo_api_url
+        self.evo_apikey = evo_apikey
+        self.public_webhook_url = public_webhook_url
+        self.documents_path = documents_path
+        self.vectorstore_path = vectorstore_path
+        self.intervention_keyword = intervention_keyword
+        self.vectorstore = vectorstore
+        self.bots: dict = {}
+        self.bots_lock = RLock()
+        self.holds = ExpiringStore(
+            on_expire=(lambda key, kind: on_hold_expired(self, key, kind)) if on_hold_expired else None)
+
+    def sessions_snapshot(self) -> list[tuple[str, object]]:
+        """Copia de (número, bot); el lock se toma solo para copiar referencias."""
+        with self.bots_lock:
+            return list(self.bots.items())
+
+    def describe(self) -> dict:
+        return {
+            "instance": self.instance,
+            "evo_api_url": self.evo_api_url,
+            "public_webhook_url": self.public_webhook_url,
+            "documents_path": self.documents_path,
+            "vectorstore_path": self.vectorstore_path,
+            "knowledge_base_loaded": self.vectorstore is not None,
+            "sessions": len(self.bots),
+        }
+
+
+def load_tenant_configs(defaults: dict) -> list[dict]:
+    """Configuraciones completas de los tenants (TENANTS_CONFIG o un único tenant desde `defaults`)."""
+    if not TENANTS_CONFIG:
+        return [dict(defaults)]
+    with open(TENANTS_CONFIG, encoding="utf-8") as f:
+        raw = json.load(f)
+    entries = raw.get("tenants", []) if isinstance(raw, dict) else raw
+    configs = []
+    for entry in entries:
+        if not entry.get("instance"):
+            raise ValueError(f"{TENANTS_CONFIG}: cada tenant necesita 'instance'")
+        unknown = set(entry) - set(_TENANT_FIELDS)
+        if unknown:
+            raise ValueError(f"{TENANTS_CONFIG}: campos desconocidos en {entry['instance']}: {sorted(unknown)}")
+        config = dict(defaults)
+        config["public_webhook_url"] = f"{defaults['public_webhook_url'].rstrip('/')}/{entry['instance']}"
+        config.update(entry)
+        configs.append(config)
+    if not configs:
+        raise ValueError(f"{TENANTS_CONFIG}: no hay tenants configurados")
+    return configs
+
+
+class TenantRegistry:
+    """Tenants por nombre de instancia; los vectorstores se cargan una sola vez por ruta."""
+
+    def __init__(self, configs: list[dict], load_vectorstore, on_hold_expired=None):
+        self._vectorstores: dict[str, object] = {}
+        self.tenants: dict[str, Tenant] = {}
+        for config in configs:
+            key = os.path.realpath(config["vectorstore_path"])
+            if key not in self._vectorstores:
+                self._vectorstores[key] = load_vectorstore(config["vectorstore_path"], config["documents_path"])
+            tenant = Tenant(vectorstore=self._vectorstores[key], on_hold_expired=on_hold_expired, **config)
+            if tenant.instance in self.tenants:
+                raise ValueError(f"instancia repetida en la configuración de tenants: {tenant.instance}")
+            self.tenants[tenant.instance] = tenant
+        self.default = next(iter(self.tenants.values()))
+
+    def get(self, instance: str | None = None) -> Tenant | None:
+        """Tenant de la instancia (el por defecto si no se indica); None si no existe."""
+        if not instance:
+            return self.default
+        return self.tenants.get(instance)
+
+    def __iter__(self):
+        return iter(self.tenants.values())
+
+    def __len__(self) -> int:
+        return len(self.tenants)
+
+    def shared_vectorstores(self) -> int:
+        return len(self._vectorstores)
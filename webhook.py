@@ -2,67 +2,126 @@
 Webhook especializado para Evolution API
 
 Expone:
-- POST /webhook           -> recibe eventos de Evolution (Baileys)
+- POST /webhook           -> recibe eventos de Evolution (Baileys) del tenant por defecto
+                             (o del indicado en el campo "instance" del payload)
+- POST /webhook/<inst>    -> recibe eventos de la instancia <inst> (ver tenants.py)
 - POST /register_webhook  -> registra el webhook en Evolution API
 - GET  /check_webhook     -> consulta configuración del webhook en Evolution API
 - GET  /healthz           -> healthcheck
+- GET  /metrics           -> métricas Prometheus (latencia por etapa, tokens por sitio, colas)
+- GET  /prefetch_stats    -> contadores del prefetch especulativo de servicios
+- GET  /admission_stats   -> cola, límite de concurrencia adaptativo y mensajes rechazados
+- GET  /debug/memory      -> bytes por sesión y principales sitios de asignación (tracemalloc)
+- GET  /resilience_stats  -> circuit breaker del LLM y umbrales de hedging
+- GET  /dedup_stats       -> índice de mensajes ya vistos y duplicados descartados
+- GET  /tenants           -> instancias configuradas y recursos compartidos
+- GET  /budget_stats      -> consumo de tokens/llamadas LLM por remitente y global (?user_number= para uno)
+- GET  /funnel            -> embudo de conversación: etapas, transiciones, tiempo por estado, niveles
+- GET  /sessions          -> sesiones paginadas (?after=&limit=) y filtrables (?state=&tier=&idle_min=&idle_max=)
+- GET  /sessions/export   -> todas las sesiones (mismos filtros) en NDJSON, en streaming
+
+Los endpoints de administración (registro, pausas, bloqueos, sesiones) actúan sobre el
+tenant por defecto; ?instance=<inst> (o "instance" en el cuerpo JSON) elige otro.
+/sessions, /paused_users y /blocked_users se paginan por cursor sobre una copia tomada sin
+retener el lock del camino caliente (ver listing.py).
 
 Variables de entorno:
 - EVO_API_URL (ej. http://localhost:8080)
 - EVO_APIKEY  (AUTHENTICATION_API_KEY)
 - EVO_INSTANCE (nombre de la instancia en Evolution)
 - PUBLIC_WEBHOOK_URL (URL pública hacia este /webhook)
+- TENANTS_CONFIG (JSON con varias instancias de Evolution, ver tenants.py)
+- SPECULATIVE_PREFETCH / SPECULATIVE_PREFETCH_ANSWERS (ver prefetch.py)
+- EVENT_LOG_PATH / EVENT_LOG_LEVEL / EVENT_LOG_STDOUT (log estructurado JSONL, ver eventlog.py)
+- WEBHOOK_CAPTURE_PATH (captura anonimizada de payloads para benchmarks/replay.py, ver capture.py)
+- ADMISSION_MAX_QUEUE / ADMISSION_TARGET_LATENCY_SECONDS / ADMISSION_SENDER_RATE_PER_MINUTE ... (ver admission.py)
+- TURN_BUDGET_SECONDS / LLM_HEDGING / BREAKER_* (plazos, hedging y circuit breaker, ver resilience.py)
+- HISTORY_MAX_MESSAGES / HISTORY_MAX_AI_CHARS (historial compacto por sesión, ver main.py)
+- DEBUG_MEMORY_TRACEMALLOC (activa tracemalloc al arrancar para /debug/memory)
+- DEDUP_TTL_SECONDS / DEDUP_MAX_ENTRIES / DEDUP_STATE_PATH (deduplicación por id de mensaje, ver dedup.py)
+- INGEST_WORKERS / EMBED_BATCH_SIZE / EMBED_CONCURRENCY (reconstrucción del vectorstore, ver ingest.py)
+- FILTERED_RETRIEVAL_K (fragmentos por servicio al filtrar por metadata, ver main.py y chunking.py)
+- RETRIEVER_K / LLM_BASE_URL (fragmentos del retriever RAG y endpoint alternativo del chat, ver main.py)
+- INDEX_TYPE / HNSW_* / IVF_NLIST / IVF_NPROBE / PQ_M (tipo de índice FAISS, ver indexes.py)
+- ADMISSION_TENANT_MAX_QUEUE (cola máxima por tenant, ver admission.py)
+- BUDGET_WINDOW_SECONDS / BUDGET_SENDER_* / BUDGET_GLOBAL_* (presupuestos de tokens, ver budgets.py)
+- FUNNEL_SNAPSHOT_PATH / FUNNEL_SNAPSHOT_SECONDS (snapshots periódicos del embudo, ver funnel.py)
+
+SIGTERM termina el proceso con SystemExit para que corran los guardados de atexit
+(dedup.py, funnel.py, eventlog.py), que de otro modo waitress-serve nunca ejecuta.
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from dotenv import load_dotenv
-from main import Chatbot, load_vector_store, load_documents, create_vector_store
-from threading import RLock
+from main import Chatbot, load_vector_store, load_documents, create_vector_store, DOCUMENTS_PATH, VECTORSTORE_PATH
+from prefetch import PREFETCHER
+from metrics import span, turn, add_llm_observer, render as render_metrics, QUEUE_DEPTH, IN_FLIGHT, SEND_ATTEMPTS, STAGE_LATENCY, WEBHOOK_MESSAGES, WEBHOOK_BATCH_SIZE
+from dedup import SEEN_MESSAGES
+from budgets import BUDGETS
+from funnel import FUNNEL
+from admission import AdmissionController, ADMISSION_OVERLOAD_MESSAGE
+import resilience
+import listing
+import eventlog
+from capture import capture_enabled, capture_payload
 from concurrent.futures import ThreadPoolExecutor
 import time
 import os
+import json
+import tracemalloc
+import signal
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timedelta
+from tenants import Tenant, TenantRegistry, load_tenant_configs
 
-# Variables para sistema de pausa por intervención humana
-HUMAN_PAUSED_USERS = {}  # {user_number: timestamp_when_paused}
+
+def _exit_on_sigterm(signum, frame):
+    # Con SIGTERM (systemd, kill) el proceso muere sin correr atexit; salir con SystemExit hace
+    # que se guarden el índice de dedup (DEDUP_STATE_PATH), el último snapshot del embudo y el
+    # flush del log de eventos
+    raise SystemExit(0)
+
+
+# waitress-serve importa este módulo en el hilo principal; no se pisa un manejador ya instalado
+if threading.current_thread() is threading.main_thread() and signal.getsignal(signal.SIGTERM) == signal.SIG_DFL:
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
+# Retenciones por usuario (pausa por intervención humana y bloqueo por solicitud de agente)
 HUMAN_PAUSE_DURATION_HOURS = 4  # Duración de la pausa en horas
+BLOCK_DURATION_HOURS = 4
 HUMAN_INTERVENTION_KEYWORD = "Hola soy un agente de ventas de xtalento, gracias por escribir"
+HOLD_PAUSED = "paused"
+HOLD_BLOCKED = "blocked"
 
 
-def pause_bot_for_human_intervention(user_number: str):
+def _on_hold_expired(tenant: Tenant, user_number: str, kind: str) -> None:
+    if kind == HOLD_PAUSED:
+        eventlog.info("human_pause_expired", tenant=tenant.instance, sender=user_number, hours=HUMAN_PAUSE_DURATION_HOURS)
+    else:
+        eventlog.info("block_expired", tenant=tenant.instance, sender=user_number)
+
+
+# Cada tenant guarda ambos temporizadores en un solo ExpiringStore (tenant.holds):
+# consulta O(1) y barrido en background
+def pause_bot_for_human_intervention(tenant: Tenant, user_number: str):
     """Pausa el bot para un usuario específico por intervención humana."""
-    pause_timestamp = time.time()
-    HUMAN_PAUSED_USERS[user_number] = pause_timestamp
-    print(f"[HUMAN INTERVENTION] ⏸️  Bot pausado ESPECÍFICAMENTE para usuario {user_number} por {HUMAN_PAUSE_DURATION_HOURS} horas")
-    print(f"[HUMAN INTERVENTION] Otros usuarios NO se ven afectados")
-    print(f"[HUMAN INTERVENTION] Total usuarios pausados: {len(HUMAN_PAUSED_USERS)}")
+    tenant.holds.set(user_number, HOLD_PAUSED, HUMAN_PAUSE_DURATION_HOURS * 3600)
+    FUNNEL.event("human_pause")
+    eventlog.info("human_pause", tenant=tenant.instance, sender=user_number, hours=HUMAN_PAUSE_DURATION_HOURS,
+                  paused_total=tenant.holds.count(HOLD_PAUSED))
 
-def is_bot_paused_by_human(user_number: str) -> bool:
+def is_bot_paused_by_human(tenant: Tenant, user_number: str) -> bool:
     """Verifica si el bot está pausado por intervención humana para un usuario específico."""
-    if user_number not in HUMAN_PAUSED_USERS:
-        return False
-    
-    pause_timestamp = HUMAN_PAUSED_USERS[user_number]
-    current_time = time.time()
-    elapsed_hours = (current_time - pause_timestamp) / 3600  # Convertir a horas
-    
-    print(f"[PAUSE_CHECK] Usuario {user_number} pausado hace {elapsed_hours:.2f} horas")
-    
-    # Si han pasado más de 4 horas, reactivar automáticamente
-    if elapsed_hours >= HUMAN_PAUSE_DURATION_HOURS:
-        del HUMAN_PAUSED_USERS[user_number]
-        print(f"[AUTO RESUME] ✅ Bot reactivado automáticamente para {user_number} después de {HUMAN_PAUSE_DURATION_HOURS} horas")
-        return False
-    
-    print(f"[PAUSE_CHECK] ⏸️  Usuario {user_number} permanece pausado")
-    return True
+    return tenant.holds.kind(user_number) == HOLD_PAUSED
 
-def resume_bot_for_user(user_number: str):
-    """Reactiva el bot manualmente para un usuario."""
-    if user_number in HUMAN_PAUSED_USERS:
-        del HUMAN_PAUSED_USERS[user_number]
-        print(f"[MANUAL RESUME] Bot reactivado manualmente para {user_number}")
+def resume_bot_for_user(tenant: Tenant, user_number: str) -> bool:
+    """Reactiva el bot manualmente para un usuario; devuelve False si no estaba pausado."""
+    if tenant.holds.discard(user_number, HOLD_PAUSED):
+        eventlog.info("human_pause_resumed", tenant=tenant.instance, sender=user_number)
+        return True
+    return False
 
 
 # 1) Configuración
@@ -73,75 +132,84 @@ EVO_INSTANCE = os.getenv("EVO_INSTANCE", "test")
 PUBLIC_WEBHOOK_URL = os.getenv("PUBLIC_WEBHOOK_URL", "https://tu-dominio.com/webhook")
 WEBHOOK_BY_EVENTS = os.getenv("WEBHOOK_BY_EVENTS", "false").strip().lower() in ("1", "true", "yes")
 MAX_WORKERS = int(os.getenv("WEBHOOK_MAX_WORKERS", "16"))
+# Rastreo de asignaciones para /debug/memory desde el arranque (tiene costo; también se activa con ?start=1)
+DEBUG_MEMORY_TRACEMALLOC = os.getenv("DEBUG_MEMORY_TRACEMALLOC", "false").strip().lower() in ("1", "true", "yes")
+if DEBUG_MEMORY_TRACEMALLOC and not tracemalloc.is_tracing():
+    tracemalloc.start(10)
 
 app = Flask(__name__)
 
-# 2) Vectorstore compartido + sesiones por número
-def _ensure_vectorstore():
-    vector = load_vector_store()
+# 2) Tenants (instancias de Evolution): vectorstore compartido por ruta + sesiones por número
+def _ensure_vectorstore(vectorstore_path: str = VECTORSTORE_PATH, documents_path: str = DOCUMENTS_PATH):
+    vector = load_vector_store(vectorstore_path)
     if vector is None:
         try:
-            print("[INIT] Vectorstore no encontrado. Creándolo...")
-            docs = load_documents()
-            vector = create_vector_store(docs)
+            print(f"[INIT] Vectorstore {vectorstore_path} no encontrado. Creándolo...")
+            docs = load_documents(documents_path=documents_path, vectorstore_path=vectorstore_path)
+            vector = create_vector_store(docs, vectorstore_path)
             print("[INIT] Vectorstore creado.")
         except Exception as err:
             print("[INIT] Error creando vectorstore:", err)
             vector = None
     return vector
 
-VECTORSTORE = _ensure_vectorstore()
-
-_user_bots: dict[str, Chatbot] = {}
-_bots_lock = RLock()
-
-# Sistema de bloqueo temporal para usuarios que solicitan agente humano
-_blocked_users: dict[str, datetime] = {}
-_blocked_lock = RLock()
-BLOCK_DURATION_HOURS = 4
-
-# Pool de hilos para procesar mensajes en background
+TENANTS = TenantRegistry(
+    load_tenant_configs({
+        "instance": EVO_INSTANCE,
+        "evo_api_url": EVO_API_URL,
+        "evo_apikey": EVO_APIKEY,
+        "public_webhook_url": PUBLIC_WEBHOOK_URL,
+        "documents_path": DOCUMENTS_PATH,
+        "vectorstore_path": VECTORSTORE_PATH,
+        "intervention_keyword": HUMAN_INTERVENTION_KEYWORD,
+    }),
+    load_vectorstore=_ensure_vectorstore,
+    on_hold_expired=_on_hold_expired,
+)
+if len(TENANTS) > 1:
+    print(f"[INIT] {len(TENANTS)} tenants: {', '.join(TENANTS.tenants)} "
+          f"({TENANTS.shared_vectorstores()} vectorstores distintos)")
+
+# Alias del tenant por defecto (despliegues de una sola instancia y benchmarks)
+VECTORSTORE = TENANTS.default.vectorstore
+_user_bots = TENANTS.default.bots
+
+# Una sola sesión HTTP (pool de conexiones keep-alive) hacia Evolution para todos los tenants
+HTTP = requests.Session()
+HTTP.mount("http://", HTTPAdapter(pool_connections=max(4, len(TENANTS)), pool_maxsize=MAX_WORKERS))
+HTTP.mount("https://", HTTPAdapter(pool_connections=max(4, len(TENANTS)), pool_maxsize=MAX_WORKERS))
+
+# Pool de hilos para procesar mensajes en background, detrás del control de admisión
 EXECUTOR = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+ADMISSION = AdmissionController(EXECUTOR, MAX_WORKERS)
+add_llm_observer(ADMISSION.limit.on_sample)
+QUEUE_DEPTH.set_function(ADMISSION.queue_depth, queue="webhook")
+# Pool aparte para los avisos de sobrecarga: no deben esperar detrás de la cola que los provoca
+NOTICE_EXECUTOR = ThreadPoolExecutor(max_workers=2)
 
-def is_user_blocked(sender_number: str) -> bool:
+def is_user_blocked(tenant: Tenant, sender_number: str) -> bool:
     """Verifica si el usuario está bloqueado temporalmente."""
-    key = sender_number or "anonymous"
-    with _blocked_lock:
-        if key in _blocked_users:
-            block_time = _blocked_users[key]
-            # Verificar si han pasado las 4 horas
-            if datetime.now() - block_time >= timedelta(hours=BLOCK_DURATION_HOURS):
-                # El bloqueo expiró, remover al usuario
-                del _blocked_users[key]
-                print(f"[UNBLOCK] Usuario {sender_number} desbloqueado automáticamente")
-                return False
-            else:
-                # Usuario sigue bloqueado
-                remaining = block_time + timedelta(hours=BLOCK_DURATION_HOURS) - datetime.now()
-                print(f"[BLOCKED] Usuario {sender_number} bloqueado por {remaining}")
-                return True
-        return False
+    return tenant.holds.kind(sender_number or "anonymous") == HOLD_BLOCKED
 
-def block_user(sender_number: str):
+def block_user(tenant: Tenant, sender_number: str):
     """Bloquea temporalmente al usuario por 4 horas."""
-    key = sender_number or "anonymous"
-    with _blocked_lock:
-        _blocked_users[key] = datetime.now()
-        print(f"[BLOCK] Usuario {sender_number} bloqueado por {BLOCK_DURATION_HOURS} horas")
+    tenant.holds.set(sender_number or "anonymous", HOLD_BLOCKED, BLOCK_DURATION_HOURS * 3600)
+    FUNNEL.event("blocked")
+    eventlog.info("block", tenant=tenant.instance, sender=sender_number, hours=BLOCK_DURATION_HOURS)
 
-def get_user_bot(sender_number: str) -> Chatbot:
-    """Devuelve un bot por número; crea uno nuevo si no existe (memoria aislada por usuario)."""
+def get_user_bot(tenant: Tenant, sender_number: str) -> Chatbot:
+    """Devuelve un bot por número dentro del tenant; crea uno nuevo si no existe (memoria aislada por usuario)."""
     key = sender_number or "anonymous"
-    with _bots_lock:
-        bot = _user_bots.get(key)
+    with tenant.bots_lock:
+        bot = tenant.bots.get(key)
         if bot is None:
-            bot = Chatbot(VECTORSTORE)
-            _user_bots[key] = bot
+            bot = Chatbot(tenant.vectorstore)
+            tenant.bots[key] = bot
     return bot
 
 # 3) Utilidades Evolution
-def _auth_headers() -> dict:
-    return {"Content-Type": "application/json", "apikey": EVO_APIKEY}
+def _auth_headers(tenant: Tenant) -> dict:
+    return {"Content-Type": "application/json", "apikey": tenant.evo_apikey}
 
 def _jid_to_number(jid: str) -> str:
     if not jid:
@@ -172,11 +240,60 @@ def _extract_text_from_baileys(message_obj: dict) -> str | None:
                 return message_obj.get(field)
     return None
 
-def send_whatsapp_text(number: str, text: str) -> tuple[int, str]:
+def _is_duplicate(tenant: Tenant, key: dict, remote_jid: str) -> bool:
+    """True si este mensaje (instancia + remoteJid + key.id) ya se recibió; los reenvíos de Evolution se descartan."""
+    if SEEN_MESSAGES.check_and_add(f"{tenant.instance}:{remote_jid}", str(key.get("id") or "")):
+        return False
+    WEBHOOK_MESSAGES.inc(result="duplicate")
+    eventlog.debug("webhook_skip", reason="duplicate", message_id=key.get("id"))
+    return True
+
+def _group_batch(tenant: Tenant, messages: list, payload: dict) -> tuple[dict[str, list[str]], dict[str, int]]:
+    """Recorre el lote una vez: devuelve {remitente: [textos en orden]} y conteo de descartes por motivo."""
+    by_sender: dict[str, list[str]] = {}
+    skipped: dict[str, int] = {}
+    for msg in messages:
+        msg = msg or {}
+        key = msg.get("key", {}) or {}
+        remote_jid = key.get("remoteJid") or msg.get("from") or payload.get("sender") or ""
+        text_in = _extract_text_from_baileys(msg)
+        if key.get("fromMe", False):
+            # Mensaje del agente: solo interesa la palabra clave de intervención humana
+            if text_in and tenant.intervention_keyword.lower() in text_in.lower() and not _is_duplicate(tenant, key, remote_jid):
+                pause_bot_for_human_intervention(tenant, _jid_to_number(str(remote_jid).split(":")[0]))
+                reason = "human_intervention"
+            else:
+                reason = "fromMe"
+        elif not text_in:
+            reason = "no-text"
+        # Se deduplica solo con texto: los MESSAGES_UPDATE de estado comparten id y no deben marcarlo
+        elif _is_duplicate(tenant, key, remote_jid):
+            reason = "duplicate"
+        else:
+            by_sender.setdefault(_jid_to_number(str(remote_jid).split(":")[0]), []).append(text_in)
+            continue
+        skipped[reason] = skipped.get(reason, 0) + 1
+    return by_sender, skipped
+
+def _shed(tenant: Tenant, sender_number: str, texts: list[str], decision: str) -> None:
+    """Mensajes no admitidos (sobrecarga o límite por remitente): aviso inmediato en vez de encolar."""
+    WEBHOOK_MESSAGES.inc(len(texts), result=decision)
+    eventlog.warning("shed", tenant=tenant.instance, sender=sender_number, reason=decision, messages=len(texts))
+    # Sin aviso si hay un humano atendiendo o el usuario está bloqueado
+    if tenant.holds.kind(sender_number or "anonymous") is not None:
+        return
+    if ADMISSION.should_notify(f"{tenant.instance}:{sender_number}"):
+        NOTICE_EXECUTOR.submit(send_whatsapp_text, tenant, sender_number, ADMISSION_OVERLOAD_MESSAGE)
+
+def send_whatsapp_text(tenant: Tenant, number: str, text: str) -> tuple[int, str]:
     """Envía texto (solo chats 1:1) probando variantes de endpoint y payload según versión de Evolution."""
+    with span("send_whatsapp_text"):
+        return _send_whatsapp_text(tenant, number, text)
+
+def _send_whatsapp_text(tenant: Tenant, number: str, text: str) -> tuple[int, str]:
     endpoints = [
-        f"{EVO_API_URL}/message/sendText/{EVO_INSTANCE}",
-        f"{EVO_API_URL}/v2/message/sendText/{EVO_INSTANCE}",
+        f"{tenant.evo_api_url}/message/sendText/{tenant.instance}",
+        f"{tenant.evo_api_url}/v2/message/sendText/{tenant.instance}",
     ]
     payload_variants: list[dict] = [
         {"number": number, "text": text},  # muchas versiones requieren 'text' plano
@@ -189,9 +306,11 @@ def send_whatsapp_text(number: str, text: str) -> tuple[int, str]:
         for url in endpoints:
             for payload in payload_variants:
                 try:
-                    print(f"[SEND TRY] POST {url} payload_keys={list(payload.keys())}")
-                    r = requests.post(url, headers=_auth_headers(), json=payload, timeout=30)
-                    print(f"[SEND RESP] {r.status_code} -> {r.text[:300]}")
+                    with span("send_whatsapp_text.attempt"):
+                        r = HTTP.post(url, headers=_auth_headers(tenant), json=payload, timeout=30)
+                    SEND_ATTEMPTS.inc(status=str(r.status_code))
+                    if eventlog.EVENT_LOG.enabled_for("DEBUG"):
+                        eventlog.debug("send_attempt", url=url, payload_keys=list(payload.keys()), status=r.status_code, body=r.text[:300])
                     last_status, last_text = r.status_code, r.text
                     if r.status_code in (200, 201):
                         return last_status, last_text
@@ -200,57 +319,84 @@ def send_whatsapp_text(number: str, text: str) -> tuple[int, str]:
                         continue
                 except Exception as e:
                     last_status, last_text = 0, str(e)
-                    print("[SEND ERROR]", e)
+                    SEND_ATTEMPTS.inc(status="error")
+                    eventlog.warning("send_error", url=url, error=str(e))
         # backoff exponencial entre intentos
         sleep_s = 0.5 * (2 ** attempt)
         time.sleep(sleep_s)
     return last_status, last_text
 
 
-def handle_message_async(sender_number: str, text_in: str) -> None:
+def handle_messages_async(tenant: Tenant, sender_number: str, texts: list[str], enqueued_at: float | None = None) -> None:
+    """Procesa en orden los mensajes de un remitente recibidos en el mismo lote."""
+    for text_in in texts:
+        handle_message_async(tenant, sender_number, text_in, enqueued_at)
+
+
+def handle_message_async(tenant: Tenant, sender_number: str, text_in: str, enqueued_at: float | None = None) -> None:
     """Procesa el mensaje y envía la respuesta en background."""
+    queue_wait_ms = None
+    if enqueued_at is not None:
+        queue_wait = time.perf_counter() - enqueued_at
+        STAGE_LATENCY.observe(queue_wait, stage="queue_wait")
+        queue_wait_ms = round(queue_wait * 1000, 1)
+    IN_FLIGHT.inc(pool="webhook")
+    budget_key = f"{tenant.instance}:{sender_number}"
     try:
-        # PRIMERA VERIFICACIÓN: ¿Está pausado por intervención humana?
-        if is_bot_paused_by_human(sender_number):
-            print(f"[SKIP] Bot pausado para {sender_number} - Agente humano en control")
-            return
-        
-        # Verificar si el usuario está bloqueado temporalmente
-        if is_user_blocked(sender_number):
-            print(f"[SKIP] Usuario {sender_number} está bloqueado temporalmente")
-            return
+        # Sin presupuesto de tokens el turno se responde con plantillas (ver budgets.py)
+        over_budget = BUDGETS.exceeded(budget_key)
+        with turn() as stats:
+            with span("handle_message"), resilience.llm_budget_exceeded(over_budget):
+                record = _handle_message(tenant, sender_number, text_in)
+        BUDGETS.charge(budget_key, stats.tokens_in + stats.tokens_out, stats.llm_calls)
+        if over_budget:
+            record["budget_exceeded"] = over_budget
+        # Registro estructurado del turno (depuración e insumo del benchmark de replay)
+        record.update(stats.as_dict())
+        eventlog.info("turn", tenant=tenant.instance, sender=sender_number, text=text_in, queue_wait_ms=queue_wait_ms, **record)
+    finally:
+        IN_FLIGHT.dec(pool="webhook")
+
+
+def _handle_message(tenant: Tenant, sender_number: str, text_in: str) -> dict:
+    """Procesa un mensaje y envía la respuesta; devuelve los datos del turno para el log."""
+    record = {"state_from": None, "state_to": None, "outcome": "replied"}
+    try:
+        # PRIMERA VERIFICACIÓN: ¿pausado por intervención humana o bloqueado? (una sola consulta)
+        hold = tenant.holds.kind(sender_number or "anonymous")
+        if hold is not None:
+            record["outcome"] = "skip_paused" if hold == HOLD_PAUSED else "skip_blocked"
+            return record
         
-        user_bot = get_user_bot(sender_number)
+        user_bot = get_user_bot(tenant, sender_number)
+        record["state_from"] = user_bot.state.name
         reply_text = user_bot.process_message(text_in) or "🤖"
+        record["state_to"] = user_bot.state.name
         
         # Detectar si el bot activó el modo agente humano
         if "Perfecto. Te conecto con un agente humano inmediatamente" in reply_text:
-            print(f"[AGENT MODE] Bloqueando usuario {sender_number} por {BLOCK_DURATION_HOURS} horas")
-            block_user(sender_number)
+            record["outcome"] = "handoff"
+            FUNNEL.event("handoff")
+            block_user(tenant, sender_number)
             
     except Exception as e:
         reply_text = "Lo siento, tuve un problema procesando tu mensaje. Si quieres comunicarte con un humano, menciona la palabra 'agente' en el chat."
-        print("[BOT] ERROR (bg):", e)
+        record["outcome"] = "error"
+        eventlog.error("process_error", tenant=tenant.instance, sender=sender_number, error=str(e))
     
-    status, body = send_whatsapp_text(sender_number, reply_text)
-    print(f"[SEND (bg)] -> {sender_number} [{status}] {body}")
+    status, body = send_whatsapp_text(tenant, sender_number, reply_text)
+    record["reply_chars"] = len(reply_text)
+    record["send_status"] = status
+    if status not in (200, 201):
+        eventlog.warning("send_failed", tenant=tenant.instance, sender=sender_number, status=status, body=body[:300])
+    return record
 
 
-def handle_message_async_with_remote(sender_number: str, text_in: str, remote_jid: str | None) -> None:
-    try:
-        user_bot = get_user_bot(sender_number)
-        reply_text = user_bot.process_message(text_in) or "🤖"
-    except Exception as e:
-        reply_text = "Lo siento, tuve un problema procesando tu mensaje. Si quieres comunicarte con un humano, menciona la palabra 'agente' en el chat."
-        print("[BOT] ERROR (bg):", e)
-    status, body = send_whatsapp_text(sender_number, reply_text, remote_jid=remote_jid)
-    print(f"[SEND (bg)] -> {sender_number} [{status}] {body}")
-
-def register_webhook() -> tuple[int, str]:
-    """Registra el webhook en Evolution API, probando rutas v2 y legacy."""
+def register_webhook(tenant: Tenant) -> tuple[int, str]:
+    """Registra el webhook del tenant en Evolution API, probando rutas v2 y legacy."""
     webhook_cfg = {
         "enabled": True,
-        "url": PUBLIC_WEBHOOK_URL,
+        "url": tenant.public_webhook_url,
         "webhookByEvents": WEBHOOK_BY_EVENTS,
         "webhookBase64": False,
         "events": [
@@ -268,17 +414,17 @@ def register_webhook() -> tuple[int, str]:
         {"webhook": webhook_cfg},
     ]
     candidates = [
-        f"{EVO_API_URL}/webhook/set/{EVO_INSTANCE}",
-        f"{EVO_API_URL}/v2/webhook/set/{EVO_INSTANCE}",
-        f"{EVO_API_URL}/instance/{EVO_INSTANCE}/webhook",
-        f"{EVO_API_URL}/instances/{EVO_INSTANCE}/webhook",
+        f"{tenant.evo_api_url}/webhook/set/{tenant.instance}",
+        f"{tenant.evo_api_url}/v2/webhook/set/{tenant.instance}",
+        f"{tenant.evo_api_url}/instance/{tenant.instance}/webhook",
+        f"{tenant.evo_api_url}/instances/{tenant.instance}/webhook",
     ]
     last_status, last_text = 0, ""
     for url in candidates:
         for payload in payload_variants:
             try:
                 print(f"[REGISTER] POST {url} payload_keys={list(payload.keys())}")
-                r = requests.post(url, headers=_auth_headers(), json=payload, timeout=20)
+                r = HTTP.post(url, headers=_auth_headers(tenant), json=payload, timeout=20)
                 print(f"[REGISTER] RESP {r.status_code} -> {r.text[:300]}")
                 last_status, last_text = r.status_code, r.text
                 if r.status_code in (200, 201):
@@ -288,16 +434,16 @@ def register_webhook() -> tuple[int, str]:
                 print("[REGISTER] ERROR", e)
     return last_status, last_text
 
-def find_webhook() -> tuple[int, str]:
+def find_webhook(tenant: Tenant) -> tuple[int, str]:
     candidates = [
-        f"{EVO_API_URL}/webhook/find/{EVO_INSTANCE}",
-        f"{EVO_API_URL}/v2/webhook/find/{EVO_INSTANCE}",
+        f"{tenant.evo_api_url}/webhook/find/{tenant.instance}",
+        f"{tenant.evo_api_url}/v2/webhook/find/{tenant.instance}",
     ]
     last_status, last_text = 0, ""
     for url in candidates:
         try:
             print(f"[FIND] GET {url}")
-            r = requests.get(url, headers={"apikey": EVO_APIKEY}, timeout=20)
+            r = HTTP.get(url, headers={"apikey": tenant.evo_apikey}, timeout=20)
             last_status, last_text = r.status_code, r.text
             if r.status_code == 200:
                 return last_status, last_text
@@ -307,52 +453,137 @@ def find_webhook() -> tuple[int, str]:
     return last_status, last_text
 
 # 4) Endpoints
+def _request_tenant() -> Tenant | None:
+    """Tenant de ?instance= o del campo "instance" del cuerpo JSON; el por defecto si no viene."""
+    body = request.get_json(silent=True) if request.method != "GET" else None
+    instance = request.args.get("instance") or (body.get("instance") if isinstance(body, dict) else None)
+    return TENANTS.get(instance)
+
+def _unknown_tenant():
+    return jsonify({"ok": False, "error": "instancia desconocida"}), 404
+
+def _bad_listing_request(err: ValueError):
+    return jsonify({"ok": False, "error": f"parámetro inválido: {err}"}), 400
+
+def _request_session_filter():
+    args = request.args
+    return listing.session_filter(args.get("state"), args.get("tier"), args.get("idle_min"), args.get("idle_max"))
+
 @app.get("/healthz")
 def healthz():
-    return jsonify({"ok": True, "instance": EVO_INSTANCE}), 200
+    return jsonify({"ok": True, "instance": TENANTS.default.instance, "instances": list(TENANTS.tenants)}), 200
+
+@app.get("/tenants")
+def list_tenants():
+    """Instancias configuradas y cuántos recursos pesados comparten."""
+    return jsonify({
+        "default": TENANTS.default.instance,
+        "tenants": [tenant.describe() for tenant in TENANTS],
+        "vectorstores_loaded": TENANTS.shared_vectorstores(),
+        "queue_by_tenant": ADMISSION.stats()["queue_by_tenant"],
+    }), 200
 
 @app.post("/register_webhook")
 def register_webhook_endpoint():
-    status, body = register_webhook()
-    return jsonify({"ok": status in (200, 201), "status": status, "body": body}), 200
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    status, body = register_webhook(tenant)
+    return jsonify({"ok": status in (200, 201), "instance": tenant.instance, "status": status, "body": body}), 200
 
 @app.get("/check_webhook")
 def check_webhook_endpoint():
-    status, body = find_webhook()
-    return jsonify({"status": status, "body": body}), 200
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    status, body = find_webhook(tenant)
+    return jsonify({"instance": tenant.instance, "status": status, "body": body}), 200
 
 @app.get("/paused_users")
 def get_paused_users():
-    """Endpoint para consultar usuarios pausados por intervención humana."""
-    current_time = time.time()
+    """Usuarios pausados por intervención humana, paginados por número (?after=&limit=)."""
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    try:
+        limit = listing.parse_limit(request.args.get("limit"))
+    except ValueError as err:
+        return _bad_listing_request(err)
+    entries = tenant.holds.items(HOLD_PAUSED)
+    rows, next_cursor = listing.page(entries, request.args.get("after"), limit)
     paused_info = {}
-    
-    for user_number, pause_timestamp in HUMAN_PAUSED_USERS.items():
-        elapsed_hours = (current_time - pause_timestamp) / 3600
-        remaining_hours = max(0, HUMAN_PAUSE_DURATION_HOURS - elapsed_hours)
+    for user_number, paused_since, remaining_s in rows:
         paused_info[user_number] = {
-            "paused_since": datetime.fromtimestamp(pause_timestamp).isoformat(),
-            "remaining_hours": round(remaining_hours, 2)
+            "paused_since": datetime.fromtimestamp(paused_since).isoformat(),
+            "remaining_hours": round(remaining_s / 3600, 2)
         }
     
     return jsonify({
-        "paused_users_count": len(HUMAN_PAUSED_USERS),
+        "paused_users_count": len(entries),
         "pause_duration_hours": HUMAN_PAUSE_DURATION_HOURS,
-        "intervention_keyword": HUMAN_INTERVENTION_KEYWORD,
-        "paused_users": paused_info
+        "intervention_keyword": tenant.intervention_keyword,
+        "paused_users": paused_info,
+        "next_cursor": next_cursor
     }), 200
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Métricas en formato de texto Prometheus (latencias por etapa, tokens, colas, cachés)."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/prefetch_stats")
+def prefetch_stats():
+    """Contadores del prefetch especulativo (agendados, aciertos, desperdicio, presupuesto)."""
+    return jsonify(PREFETCHER.stats()), 200
+
+@app.get("/admission_stats")
+def admission_stats():
+    """Cola, concurrencia adaptativa y decisiones del control de admisión."""
+    return jsonify(ADMISSION.stats()), 200
+
+@app.get("/resilience_stats")
+def resilience_stats():
+    """Estado del circuit breaker del LLM y umbrales de hedging por sitio."""
+    return jsonify(resilience.stats()), 200
+
+@app.get("/budget_stats")
+def budget_stats():
+    """Consumo de tokens y llamadas LLM en la ventana del presupuesto; ?user_number= (e ?instance=) para un remitente."""
+    user_number = request.args.get("user_number")
+    if user_number:
+        tenant = _request_tenant()
+        if tenant is None:
+            return _unknown_tenant()
+        return jsonify(BUDGETS.usage(f"{tenant.instance}:{user_number}")), 200
+    try:
+        top = listing.parse_limit(request.args.get("top"), default=20, maximum=200)
+    except ValueError as err:
+        return _bad_listing_request(err)
+    return jsonify(BUDGETS.stats(top)), 200
+
+@app.get("/funnel")
+def funnel_stats():
+    """Embudo de conversación de todos los tenants, desde contadores incrementales (no recorre sesiones)."""
+    return jsonify(FUNNEL.summary()), 200
+
+@app.get("/dedup_stats")
+def dedup_stats():
+    """Tamaño del índice de deduplicación y cuántos reenvíos se han descartado."""
+    return jsonify(SEEN_MESSAGES.stats()), 200
+
 @app.post("/resume_user")
 def resume_user_endpoint():
     """Endpoint para reactivar manualmente un usuario pausado."""
-    data = request.get_json()
+    data = request.get_json(silent=True) or {}
     user_number = data.get("user_number")
     
     if not user_number:
         return jsonify({"error": "user_number is required"}), 400
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
     
-    if user_number in HUMAN_PAUSED_USERS:
-        resume_bot_for_user(user_number)
+    if resume_bot_for_user(tenant, user_number):
         return jsonify({"message": f"Bot reactivado para {user_number}"}), 200
     else:
         return jsonify({"message": f"Usuario {user_number} no estaba pausado"}), 200
@@ -360,24 +591,45 @@ def resume_user_endpoint():
 
 @app.get("/debug_user_status/<user_number>")
 def debug_user_status(user_number: str):
-    """Endpoint para debugging: verifica el estado completo de un usuario específico."""
+    """Endpoint para debugging: retenciones y sesión de un usuario (sin listar a los demás; ver /paused_users)."""
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    bot = tenant.bots.get(user_number)  # lectura atómica del dict, sin lock
     return jsonify({
+        "instance": tenant.instance,
         "user_number": user_number,
-        "is_paused_by_human": is_bot_paused_by_human(user_number),
-        "is_in_paused_users_dict": user_number in HUMAN_PAUSED_USERS,
-        "total_paused_users": len(HUMAN_PAUSED_USERS),
-        "all_paused_users": list(HUMAN_PAUSED_USERS.keys()),
+        "is_paused_by_human": is_bot_paused_by_human(tenant, user_number),
+        "is_blocked": is_user_blocked(tenant, user_number),
+        "hold": tenant.holds.kind(user_number),
+        "session": bot.session_info() if bot is not None else None,
+        "total_paused_users": tenant.holds.count(HOLD_PAUSED),
         "pause_duration_hours": HUMAN_PAUSE_DURATION_HOURS
     }), 200
 
 @app.post("/webhook")
-def webhook():
+@app.post("/webhook/<instance>")
+def webhook(instance: str | None = None):
     """Recibe eventos Evolution y responde 200 rápidamente."""
+    with span("webhook.ingress"):
+        return _webhook(instance)
+
+def _webhook(instance: str | None = None):
     try:
         payload = request.get_json(force=True, silent=True) or {}
+        if instance is not None:
+            tenant = TENANTS.get(instance)
+            if tenant is None:
+                eventlog.warning("webhook_skip", reason="unknown-instance", instance=instance)
+                return jsonify({"ok": False, "error": "instancia desconocida"}), 404
+        else:
+            # /webhook sin instancia: Evolution incluye "instance" en el payload
+            tenant = TENANTS.tenants.get(str(payload.get("instance") or "")) or TENANTS.default
         event_raw = payload.get("event") or payload.get("type") or ""
         event = str(event_raw).upper().replace(".", "_")
-        print("[WEBHOOK INCOMING] event=", event, "keys=", list(payload.keys()))
+        eventlog.debug("webhook_incoming", tenant=tenant.instance, webhook_event=event, keys=list(payload.keys()))
+        if capture_enabled() and event in ("MESSAGES_UPSERT", "MESSAGES_UPDATE"):
+            capture_payload(payload)
 
         # Extrae mensajes desde distintas variantes de payload
         data_obj = payload.get("data")
@@ -394,93 +646,174 @@ def webhook():
 
         if event in ("MESSAGES_UPSERT", "MESSAGES_UPDATE") or (messages and "message" in (messages[0] or {})):
             if not messages:
-                print("[WEBHOOK] No messages array found")
+                eventlog.debug("webhook_skip", reason="no-messages", webhook_event=event)
                 return jsonify({"ok": True, "skip": "no-messages"}), 200
 
-            msg = messages[0] or {}
-            key = msg.get("key", {}) or {}
-            if key.get("fromMe", False):
-                # Detectar intervención humana con palabra clave específica
-                agent_text = _extract_text_from_baileys(msg)
-                if agent_text and HUMAN_INTERVENTION_KEYWORD.lower() in agent_text.lower():
-                    # Obtener el número del destinatario (cliente)
-                    remote_jid = key.get("remoteJid") or msg.get("from") or payload.get("sender") or ""
-                    client_number = _jid_to_number(str(remote_jid).split(":")[0])
-                    
-                    # Pausar bot para este cliente específico
-                    pause_bot_for_human_intervention(client_number)
-                    print(f"[HUMAN TAKEOVER] Agente humano tomó control de {client_number} con palabra clave")
-                    
-                    return jsonify({"ok": True, "human_intervention": True}), 200
-                
-                # Si no es la palabra clave, ignorar mensaje normal del agente
-                return jsonify({"ok": True, "skip": "fromMe"}), 200
-
-            remote_jid = key.get("remoteJid") or msg.get("from") or payload.get("sender") or ""
-            sender_number = _jid_to_number(str(remote_jid).split(":")[0])
-            text_in = _extract_text_from_baileys(msg)
-            print(f"[WEBHOOK PARSED] number={sender_number} text={text_in!r}")
-            if not text_in:
-                return jsonify({"ok": True, "skip": "no-text"}), 200
-
-            # Encolar procesamiento en background para responder sin bloquear el webhook
-            EXECUTOR.submit(handle_message_async, sender_number, text_in)
-            print(f"[ENQUEUED] reply task for {sender_number}")
+            # Un solo recorrido del lote: agrupa textos por remitente conservando el orden de llegada
+            by_sender, skipped = _group_batch(tenant, messages, payload)
+            WEBHOOK_BATCH_SIZE.observe(len(messages))
+            if len(messages) > 1:
+                eventlog.info("webhook_batch", webhook_event=event, size=len(messages), senders=len(by_sender), skipped=skipped)
+
+            # Encolar una unidad de trabajo por remitente para responder sin bloquear el webhook
+            enqueued_at = time.perf_counter()
+            enqueued = 0
+            for sender_number, texts in by_sender.items():
+                decision = ADMISSION.submit(sender_number, len(texts), handle_messages_async, tenant, sender_number, texts,
+                                            enqueued_at, tenant=tenant.instance)
+                if decision == "admitted":
+                    enqueued += len(texts)
+                    WEBHOOK_MESSAGES.inc(len(texts), result="enqueued")
+                    eventlog.debug("enqueued", tenant=tenant.instance, sender=sender_number, messages=len(texts), webhook_event=event)
+                else:
+                    _shed(tenant, sender_number, texts, decision)
+                    skipped[decision] = skipped.get(decision, 0) + len(texts)
+
+            body = {"ok": True, "messages": len(messages), "enqueued": enqueued}
+            if skipped:
+                body["skipped"] = skipped
+                if len(messages) == 1:
+                    body["skip"] = next(iter(skipped))
+            if skipped.get("human_intervention"):
+                body["human_intervention"] = True
+            return jsonify(body), 200
 
         elif event in ("QRCODE_UPDATED", "CONNECTION_UPDATE"):
-            print("[EVOLUTION]", event, payload.get("data"))
+            eventlog.info("evolution_event", tenant=tenant.instance, webhook_event=event, data=payload.get("data"))
 
         return jsonify({"ok": True}), 200
     except Exception as e:
-        print("[WEBHOOK] ERROR:", e)
+        eventlog.error("webhook_error", error=str(e))
         return jsonify({"ok": False, "error": str(e)}), 200
 
 # Sesiones: utilidades opcionales
 @app.get("/sessions")
 def list_sessions():
-    with _bots_lock:
-        return jsonify({"sessions": list(_user_bots.keys())}), 200
+    """Sesiones del tenant paginadas por número (?after=&limit=), filtrables por ?state=, ?tier=, ?idle_min=, ?idle_max=."""
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    try:
+        limit = listing.parse_limit(request.args.get("limit"))
+        matches = _request_session_filter()
+    except ValueError as err:
+        return _bad_listing_request(err)
+    snapshot = tenant.sessions_snapshot()
+    rows, next_cursor = listing.page(
+        ((key, bot) for key, bot in snapshot if matches(bot)), request.args.get("after"), limit)
+    return jsonify({
+        "instance": tenant.instance,
+        "total_sessions": len(snapshot),
+        "sessions": [{"user_number": key, **bot.session_info()} for key, bot in rows],
+        "next_cursor": next_cursor,
+    }), 200
+
+@app.get("/sessions/export")
+def export_sessions():
+    """Exporta las sesiones del tenant (mismos filtros que /sessions) como NDJSON, una línea por sesión."""
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    try:
+        matches = _request_session_filter()
+    except ValueError as err:
+        return _bad_listing_request(err)
+    snapshot = tenant.sessions_snapshot()
+    instance = tenant.instance
+
+    def generate():
+        for key, bot in snapshot:
+            if matches(bot):
+                yield json.dumps({"instance": instance, "user_number": key, **bot.session_info()}, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson",
+                    headers={"Content-Disposition": f'attachment; filename="sessions_{instance}.ndjson"'})
+
+@app.get("/debug/memory")
+def debug_memory():
+    """Bytes por sesión (de todos los tenants) y principales sitios de asignación. ?start=1 activa el rastreo, ?top=N."""
+    try:
+        top = listing.parse_limit(request.args.get("top"), default=15, maximum=100)
+    except ValueError as err:
+        return _bad_listing_request(err)
+    if request.args.get("start") and not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+    bots = []
+    for tenant in TENANTS:
+        bots.extend(bot for _, bot in tenant.sessions_snapshot())
+    owned = [bot.memory_bytes() for bot in bots]
+    body = {
+        "sessions": len(bots),
+        "session_bytes_total": sum(owned),
+        "session_bytes_avg": sum(owned) // len(owned) if owned else 0,
+        "session_bytes_max": max(owned) if owned else 0,
+        "history_messages_avg": round(sum(len(b.chat_history) for b in bots) / len(bots), 1) if bots else 0,
+        "tracing": tracemalloc.is_tracing(),
+    }
+    if tracemalloc.is_tracing():
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        body["traced_bytes"] = current
+        body["traced_peak_bytes"] = peak
+        body["traced_bytes_per_session"] = current // len(bots) if bots else None
+        body["top_allocations"] = [
+            {"site": str(stat.traceback[0]), "size_bytes": stat.size, "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:top]
+        ]
+    return jsonify(body), 200
 
 @app.delete("/sessions")
 def clear_sessions():
-    with _bots_lock:
-        _user_bots.clear()
-    return jsonify({"ok": True, "cleared": True}), 200
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    with tenant.bots_lock:
+        states = [bot.state.name for bot in tenant.bots.values()]
+        tenant.bots.clear()
+    FUNNEL.sessions_removed(states)
+    return jsonify({"ok": True, "instance": tenant.instance, "cleared": True}), 200
 
 # Gestión de usuarios bloqueados
 @app.get("/blocked_users")
 def list_blocked_users():
-    """Lista usuarios bloqueados y tiempo restante."""
-    with _blocked_lock:
-        blocked_info = {}
-        current_time = datetime.now()
-        for user, block_time in _blocked_users.items():
-            remaining = block_time + timedelta(hours=BLOCK_DURATION_HOURS) - current_time
-            if remaining.total_seconds() > 0:
-                blocked_info[user] = {
-                    "blocked_at": block_time.isoformat(),
-                    "remaining_seconds": int(remaining.total_seconds()),
-                    "remaining_readable": str(remaining).split('.')[0]
-                }
-        return jsonify({"blocked_users": blocked_info}), 200
+    """Usuarios bloqueados y tiempo restante, paginados por número (?after=&limit=)."""
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    try:
+        limit = listing.parse_limit(request.args.get("limit"))
+    except ValueError as err:
+        return _bad_listing_request(err)
+    entries = tenant.holds.items(HOLD_BLOCKED)
+    rows, next_cursor = listing.page(entries, request.args.get("after"), limit)
+    blocked_info = {}
+    for user, blocked_at, remaining_s in rows:
+        blocked_info[user] = {
+            "blocked_at": datetime.fromtimestamp(blocked_at).isoformat(),
+            "remaining_seconds": int(remaining_s),
+            "remaining_readable": str(timedelta(seconds=int(remaining_s)))
+        }
+    return jsonify({"blocked_users_count": len(entries), "blocked_users": blocked_info, "next_cursor": next_cursor}), 200
 
 @app.delete("/blocked_users")
 def clear_blocked_users():
-    """Limpia todos los bloqueos (para emergencias)."""
-    with _blocked_lock:
-        count = len(_blocked_users)
-        _blocked_users.clear()
+    """Limpia todos los bloqueos del tenant (para emergencias)."""
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    count = tenant.holds.clear(HOLD_BLOCKED)
     return jsonify({"ok": True, "unblocked_count": count}), 200
 
 @app.delete("/blocked_users/<user_number>")
 def unblock_specific_user(user_number: str):
     """Desbloquea un usuario específico."""
-    with _blocked_lock:
-        if user_number in _blocked_users:
-            del _blocked_users[user_number]
-            return jsonify({"ok": True, "unblocked": user_number}), 200
-        else:
-            return jsonify({"ok": False, "error": "Usuario no estaba bloqueado"}), 404
+    tenant = _request_tenant()
+    if tenant is None:
+        return _unknown_tenant()
+    if tenant.holds.discard(user_number, HOLD_BLOCKED):
+        return jsonify({"ok": True, "unblocked": user_number}), 200
+    else:
+        return jsonify({"ok": False, "error": "Usuario no estaba bloqueado"}), 404
 
 if __name__ == "__main__":
     # Opcional: registra automáticamente el webhook al iniciar